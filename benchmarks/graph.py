@@ -0,0 +1,118 @@
+'''
+Benchmark for graph build time and shortest path query latency, both on the
+default CONVERTERS conversion graph (without and with its routing table, in
+a temporary PATH_PREFIX), and on a large synthetic graph.
+
+Run from the repo root with:
+
+    PYTHONPATH=. python benchmarks/graph.py
+'''
+import random
+import shutil
+import tempfile
+import time
+
+from omnic import singletons
+from omnic.conversion.graph import ConverterGraph
+from omnic.utils.graph import DirectedGraph
+
+SYNTHETIC_NODES = 5000
+SYNTHETIC_EDGES_PER_NODE = 4
+SYNTHETIC_QUERIES = 100
+
+DEFAULT_QUERIES = [
+    ('DOC', 'PNG'),
+    ('JPG', 'thumb.jpg'),
+    ('MOL', 'thumb.png'),
+    ('PY', 'html'),
+    ('STL', 'thumb.jpg'),
+    ('nodepackage', 'min.js'),
+]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def report(label, seconds):
+    print('%-45s %10.3f ms' % (label, seconds * 1000))
+
+
+def query_all(dgraph, queries):
+    for start, end in queries:
+        try:
+            dgraph.shortest_path(start, end)
+        except DirectedGraph.NoPath:
+            pass
+
+
+def bench_default_converters():
+    print('Default CONVERTERS')
+    path_prefix = tempfile.mkdtemp(prefix='omnic_bench_')
+    singletons.settings.set(path_prefix=path_prefix)
+    try:
+        bench_default_graph()
+    finally:
+        shutil.rmtree(path_prefix, ignore_errors=True)
+
+
+def bench_default_graph():
+    seconds, cgraph = timed(ConverterGraph)
+    dgraph = cgraph.dgraph
+    node_count = len(set(dgraph.edges) | set(
+        b for edges in dgraph.edges.values() for b in edges))
+    edge_count = sum(len(edges) for edges in dgraph.edges.values())
+    print('  %i nodes, %i edges' % (node_count, edge_count))
+    report('  graph build', seconds)
+    seconds, _ = timed(ConverterGraph)
+    report('  graph build (from routing table)', seconds)
+
+    seconds, _ = timed(dgraph.shortest_path, *DEFAULT_QUERIES[0])
+    report('  first query %s -> %s' % DEFAULT_QUERIES[0], seconds)
+    seconds, _ = timed(query_all, dgraph, DEFAULT_QUERIES)
+    report('  %i queries (cold)' % len(DEFAULT_QUERIES), seconds)
+    seconds, _ = timed(query_all, dgraph, DEFAULT_QUERIES)
+    report('  %i queries (warm)' % len(DEFAULT_QUERIES), seconds)
+
+
+def build_synthetic_graph(rand):
+    dgraph = DirectedGraph()
+    for node in range(SYNTHETIC_NODES):
+        for _ in range(SYNTHETIC_EDGES_PER_NODE):
+            other = rand.randrange(SYNTHETIC_NODES)
+            if other != node:
+                dgraph.add_edge('N%i' % node, 'N%i' % other,
+                                rand.randint(1, 5))
+    return dgraph
+
+
+def bench_synthetic():
+    print('Synthetic graph')
+    rand = random.Random(0)
+    seconds, dgraph = timed(build_synthetic_graph, rand)
+    edge_count = sum(len(edges) for edges in dgraph.edges.values())
+    print('  %i nodes, %i edges' % (SYNTHETIC_NODES, edge_count))
+    report('  graph build', seconds)
+
+    queries = [
+        ('N%i' % rand.randrange(SYNTHETIC_NODES),
+         'N%i' % rand.randrange(SYNTHETIC_NODES))
+        for _ in range(SYNTHETIC_QUERIES)
+    ]
+    seconds, _ = timed(dgraph.shortest_path, *queries[0])
+    report('  first query %s -> %s' % queries[0], seconds)
+    seconds, _ = timed(query_all, dgraph, queries)
+    report('  %i queries (cold)' % len(queries), seconds)
+    seconds, _ = timed(query_all, dgraph, queries)
+    report('  %i queries (warm)' % len(queries), seconds)
+
+
+def main():
+    bench_default_converters()
+    bench_synthetic()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+'''
+Benchmark for the media route when the conversion result is already cached
+on disk (the common case in production), including the HMAC security check,
+both for just checking and for serving results from disk or from memory.
+
+Run from the repo root with:
+
+    PYTHONPATH=. python benchmarks/media.py
+'''
+import asyncio
+import shutil
+import tempfile
+import time
+
+from omnic import singletons
+from omnic.builtin.services import media
+from omnic.types.resource import TypedResource
+from omnic.types.resourceurl import ResourceURL
+from omnic.types.typestring import TypeString
+from omnic.utils.security import get_hmac_sha1_digest
+
+URL_COUNT = 200
+REQUESTS_PER_URL = 50
+TARGET_TYPE = 'thumb.jpg:200x200'
+
+
+class FakeRequest:
+    def __init__(self, args):
+        self.args = args
+        self.headers = {}
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def report(label, seconds, count):
+    print('%-45s %10.3f ms %8.3f us/request' % (
+        label, seconds * 1000, seconds * 1e6 / count))
+
+
+def setup():
+    singletons.settings.set(
+        path_prefix=tempfile.mkdtemp(prefix='omnic_bench_'),
+        security='omnic.web.security.HmacSha1',
+        allowed_locations='*',
+    )
+    singletons.server.configure()
+    requests = []
+    for number in range(URL_COUNT):
+        url = 'example.com/images/%i.png' % number
+        resource = TypedResource(url, TypeString(TARGET_TYPE))
+        with resource.cache_open('wb') as fd:
+            fd.write(b'cached')
+        digest = get_hmac_sha1_digest(
+            singletons.settings.HMAC_SECRET, url, TARGET_TYPE)
+        requests.append({'url': [url], 'digest': [digest]})
+    return requests
+
+
+def checking(requests):
+    return [FakeRequest(dict(args, just_checking=['1'])) for args in requests]
+
+
+def serving(requests):
+    return [FakeRequest(args) for args in requests]
+
+
+def clear_parse_caches():
+    ResourceURL._parsed_urls.clear()
+    TypeString._interned.clear()
+
+
+async def run_requests(requests):
+    for _ in range(REQUESTS_PER_URL):
+        for request in requests:
+            await media.media_route(request, TARGET_TYPE)
+
+
+def main():
+    requests = setup()
+    try:
+        run_all(requests)
+    finally:
+        shutil.rmtree(singletons.settings.PATH_PREFIX, ignore_errors=True)
+
+
+def run_all(requests):
+    loop = asyncio.new_event_loop()
+    count = len(requests) * REQUESTS_PER_URL
+    print('%i URLs, %i requests each' % (URL_COUNT, REQUESTS_PER_URL))
+
+    run = loop.run_until_complete
+    clear_parse_caches()
+    seconds, _ = timed(run, run_requests(checking(requests)))
+    report('  just checking (first run)', seconds, count)
+    seconds, _ = timed(run, run_requests(checking(requests)))
+    report('  just checking (repeated)', seconds, count)
+
+    singletons.settings.set(hot_cache_max_bytes=0)
+    seconds, _ = timed(run, run_requests(serving(requests)))
+    report('  serving from disk', seconds, count)
+    singletons.settings.set(hot_cache_max_bytes=64 * 1024 * 1024)
+    seconds, _ = timed(run, run_requests(serving(requests)))
+    report('  serving from memory', seconds, count)
+
+
+if __name__ == '__main__':
+    main()
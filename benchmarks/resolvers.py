@@ -0,0 +1,70 @@
+'''
+Benchmark for resolving the destination type and basename of many resource
+URLs with the default RESOLVERS.
+
+Run from the repo root with:
+
+    PYTHONPATH=. python benchmarks/resolvers.py
+'''
+import random
+import time
+
+from omnic import singletons
+from omnic.types.resourceurl import ResourceURL
+
+URL_COUNT = 100000
+
+URL_TEMPLATES = [
+    'http://example.com/images/%i.png',
+    'https://example.com/docs/%i/',
+    'example.com/%i.jpg',
+    'git://example.com/repo%i.git',
+    'git://example.com/repo%i.git<master>',
+    'git+https://example.com/repo%i.git<master><docs/README.md>',
+    'git+http://example.com/repo%i.git<master></>',
+]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def report(label, seconds):
+    print('%-45s %10.3f ms %8.3f us/url' % (
+        label, seconds * 1000, seconds * 1e6 / URL_COUNT))
+
+
+def build_urls(rand):
+    return [
+        ResourceURL(rand.choice(URL_TEMPLATES) % number)
+        for number in range(URL_COUNT)
+    ]
+
+
+def resolve_all(rgraph, resource_urls):
+    for resource_url in resource_urls:
+        rgraph.find_destination_type(resource_url)
+
+
+def basename_all(rgraph, resource_urls):
+    for resource_url in resource_urls:
+        rgraph.find_resource_url_basename(resource_url)
+
+
+def main():
+    singletons.settings  # Ensure resolver_graph etc are registered
+    rgraph = singletons.resolver_graph
+    rand = random.Random(0)
+    print('%i URLs' % URL_COUNT)
+    seconds, resource_urls = timed(build_urls, rand)
+    report('  parse ResourceURLs', seconds)
+    seconds, _ = timed(resolve_all, rgraph, resource_urls)
+    report('  find_destination_type', seconds)
+    seconds, _ = timed(basename_all, rgraph, resource_urls)
+    report('  find_resource_url_basename', seconds)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+'''
+Benchmark for the memory used by queued conversion tasks, and for Resource
+construction throughput.
+
+Run from the repo root with:
+
+    PYTHONPATH=. python benchmarks/resources.py
+'''
+import time
+import tracemalloc
+
+from omnic import singletons
+from omnic.types.resource import ForeignResource, TypedResource
+from omnic.types.typestring import TypeString
+from omnic.worker.enums import Task
+
+TASK_COUNT = 20000
+CONSTRUCTION_COUNT = 100000
+URL_COUNT = 1000
+
+
+class Converter:
+    pass
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return time.perf_counter() - start, result
+
+
+def build_tasks(urls, in_ts, out_ts):
+    converter = Converter()
+    return [
+        (Task.CONVERT, (
+            converter,
+            TypedResource(url, in_ts),
+            TypedResource(url, out_ts),
+        ))
+        for url in urls
+    ]
+
+
+def bench_memory():
+    urls = ['http://example.com/images/%i.png' % i for i in range(TASK_COUNT)]
+    in_ts = TypeString('PNG')
+    out_ts = TypeString('thumb.jpg:200x200')
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    tasks = build_tasks(urls, in_ts, out_ts)
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('%i queued conversion tasks' % len(tasks))
+    per_task = (after - before) / len(tasks)
+    print('  %-43s %10.0f bytes' % ('memory per task', per_task))
+
+
+def construct(urls, count):
+    ts = TypeString('thumb.jpg:200x200')
+    for i in range(count):
+        url = urls[i % len(urls)]
+        ForeignResource(url)
+        TypedResource(url, ts)
+
+
+def bench_construction():
+    urls = ['http://example.com/images/%i.png' % i for i in range(URL_COUNT)]
+    print('%i resources constructed, from %i URLs' % (
+        CONSTRUCTION_COUNT * 2, URL_COUNT))
+    seconds, _ = timed(construct, urls, CONSTRUCTION_COUNT)
+    print('  %-43s %10.0f resources/s' % (
+        'construction', CONSTRUCTION_COUNT * 2 / seconds))
+
+
+def main():
+    singletons.settings  # Ensure resolver_graph etc are registered
+    bench_memory()
+    bench_construction()
+
+
+if __name__ == '__main__':
+    main()
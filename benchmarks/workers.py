@@ -0,0 +1,79 @@
+'''
+Benchmark for conversion throughput by number of workers (see WORKERS),
+with stub converters that wait on I/O (like converters waiting on their
+subprocess) for CONVERSION_SECONDS each, for distinct URLs.
+
+Run from the repo root with:
+
+    PYTHONPATH=. python benchmarks/workers.py
+'''
+import asyncio
+import shutil
+import tempfile
+import time
+
+from omnic import singletons
+from omnic.types.resource import TypedResource
+from omnic.types.typestring import TypeString
+from omnic.worker.manager import WorkerManager
+
+URL_COUNT = 64
+CONVERSION_SECONDS = 0.05
+WORKER_COUNTS = [1, 2, 4, 8, 16]
+
+
+class StubConverter:
+    async def convert(self, in_resource, out_resource):
+        await asyncio.sleep(CONVERSION_SECONDS)
+        with out_resource.cache_open('wb') as fd:
+            fd.write(b'converted')
+
+
+def setup(worker_count):
+    singletons.settings.set(
+        path_prefix=tempfile.mkdtemp(prefix='omnic_bench_'),
+        workers=worker_count,
+    )
+    singletons.workers.clear()
+    singletons.workers.extend(WorkerManager())
+
+
+async def convert_all(urls):
+    converter = StubConverter()
+    in_ts = TypeString('PNG')
+    out_ts = TypeString('thumb.jpg:200x200')
+    outputs = []
+    for url in urls:
+        in_resource = TypedResource(url, in_ts)
+        out_resource = TypedResource(url, out_ts)
+        outputs.append(out_resource)
+        await singletons.workers.async_enqueue_convert(
+            converter, in_resource, out_resource)
+
+    future = asyncio.ensure_future(singletons.workers.gather_run())
+    while not all(out_resource.cache_exists() for out_resource in outputs):
+        await asyncio.sleep(CONVERSION_SECONDS / 10)
+    future.cancel()
+
+
+def main():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    print('%i conversions of %.0f ms each' % (
+        URL_COUNT, CONVERSION_SECONDS * 1000))
+    for worker_count in WORKER_COUNTS:
+        setup(worker_count)
+        urls = ['http://example.com/images/%i.png' % i
+                for i in range(URL_COUNT)]
+        try:
+            start = time.perf_counter()
+            loop.run_until_complete(convert_all(urls))
+            seconds = time.perf_counter() - start
+        finally:
+            shutil.rmtree(singletons.settings.PATH_PREFIX, ignore_errors=True)
+        print('  %-43s %10.3f s %8.1f conversions/s' % (
+            '%i workers' % worker_count, seconds, URL_COUNT / seconds))
+
+
+if __name__ == '__main__':
+    main()
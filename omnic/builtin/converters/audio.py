@@ -30,6 +30,8 @@ class FfmpegAudioWaveformRenderer(converter.ExecConverter):
         'PNG',
     ]
 
+    version_args = ['-version']
+
     command = [
         'ffmpeg',
         '-i',
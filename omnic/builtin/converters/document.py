@@ -67,6 +67,8 @@ class ImageMagickPageRasterizer(converter.ExecConverter):
         'image/png',
     ]
 
+    version_args = ['-version']
+
     command = [
         'convert',
         '$IN',
@@ -15,8 +15,9 @@ class GitLsTreeToJson(converter.Converter):
     outputs = [
         'git-tree.json',
     ]
+    execution = converter.PROCESS
 
-    async def convert(self, in_resource, out_resource):
+    def convert_sync(self, in_resource, out_resource):
         with in_resource.cache_open('r') as fd:
             contents = fd.read()
         lines = contents.splitlines()
@@ -45,8 +46,9 @@ class GitTreeJsonToHtml(converter.Converter):
     outputs = [
         'git-tree.html',
     ]
+    execution = converter.PROCESS
 
-    async def convert(self, in_resource, out_resource):
+    def convert_sync(self, in_resource, out_resource):
         with in_resource.cache_open('r') as fd:
             root = json.load(fd)
 
@@ -74,8 +76,9 @@ class InlineJsVariable(converter.Converter):
         'inlined.js',
         'docwrite-inject.js',
     ]
+    execution = converter.PROCESS
 
-    async def convert(self, in_resource, out_resource):
+    def convert_sync(self, in_resource, out_resource):
         name = '_OMNIC_DATA'
         should_docwrite = False
         ts = out_resource.typestring
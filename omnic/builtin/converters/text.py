@@ -45,6 +45,8 @@ class PandocMarkupCompiler(converter.ExecConverter):
         'HTML',
     ]
 
+    version_args = ['--version']
+
     command = [
         'pandoc',
         '$IN',
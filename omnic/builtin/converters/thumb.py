@@ -19,9 +19,10 @@ class PILThumb(converter.Converter):
         'thumb.jpg',
     ]
     default_size = (200, 200)
+    execution = converter.THREAD
 
     def __init__(self):
-        super(self).__init__()
+        super().__init__()
         # Import from Image only when in use
         from PIL import Image
         self.Image = Image
@@ -45,7 +46,7 @@ class PILThumb(converter.Converter):
                 # Save as is
                 im.save(target)
 
-    async def convert(self, in_resource, out_resource):
+    def convert_sync(self, in_resource, out_resource):
         size = self.default_size
         arguments = out_resource.typestring.arguments
         if arguments:
@@ -73,6 +74,8 @@ class ImageMagickThumb(converter.ExecConverter):
         'thumb.jpg',
     ]
 
+    version_args = ['-version']
+
     command = [
         'convert',
         # -define jpeg:size=500x180 ... should be 2x
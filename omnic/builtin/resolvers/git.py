@@ -13,13 +13,20 @@ GIT_ARCHIVE_FORMATS = '''
 
 
 class GitExecConverter(converter.ExecConverter):
+    url_schemes = [
+        'git',
+        'git+https',
+        'git+http',
+    ]
+    destination_type_by_shape = True
+
     @classmethod
     def get_destination_type(cls, resource_url):
         if not hasattr(cls, '_is_output'):
             return
 
         scheme = resource_url.parsed.scheme
-        if scheme not in ('git', 'git+https', 'git+http'):
+        if scheme not in cls.url_schemes:
             return
 
         if cls._is_output(resource_url.args):
@@ -56,14 +63,18 @@ class GitCloner(converter.ExecConverter):
         if mutable_resource.cache_exists():
             return  # Already cloned, exit right away
 
-        await super().convert(mutable_resource, out_resource)
+        # Clone atomically, such that a partial clone is never mistaken for
+        # a complete one
+        clone_into = super().convert
+
+        async def clone(partial_resource):
+            await clone_into(partial_resource, out_resource)
 
-        # Append to git config customized git archive format
-        config_path = os.path.join(mutable_resource.cache_path, 'config')
-        with open(config_path, 'a') as fd:
-            # Note: Not too concerned with staying idempotent, unlikely it
-            # could happen twice, and extra entries cause no issue
-            fd.write(GIT_ARCHIVE_FORMATS)
+            # Append to git config customized git archive format
+            config_path = os.path.join(partial_resource.cache_path, 'config')
+            with open(config_path, 'a') as fd:
+                fd.write(GIT_ARCHIVE_FORMATS)
+        await mutable_resource.cache_write(clone)
 
 
 class GitUpdater(GitExecConverter):
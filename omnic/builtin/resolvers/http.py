@@ -12,10 +12,16 @@ class CurlDownloader(converter.ExecConverter):
         'file',
     ]
 
+    url_schemes = [
+        'http',
+        'https',
+    ]
+    destination_type_by_shape = True
+
     @classmethod
     def get_destination_type(cls, resource_url):
         scheme = resource_url.parsed.scheme
-        if scheme in cls.inputs:
+        if scheme in cls.url_schemes:
             return 'file'
 
     def get_command(self, in_resource, out_resource):
@@ -24,6 +30,7 @@ class CurlDownloader(converter.ExecConverter):
             'curl',
             '-L',  # follow redirects
             '--silent',
+            '--fail',  # exit non-zero instead of saving HTTP error pages
             '--output',
             out_resource.cache_path,
             resource_url.url,
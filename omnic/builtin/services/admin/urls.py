@@ -6,5 +6,7 @@ urls = {
     'zoo/': views.zoo_tester,
     'graph/': views.conversion_graph_root,
     'graph/<ext>/': views.conversion_graph,
+    'converters/': views.converter_availability,
+    'failures/': views.failures,
     'ajax/workers/': views.poll_worker_queue,
 }
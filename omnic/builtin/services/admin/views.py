@@ -3,6 +3,7 @@ A read-only admin interface that is useful for monitoring broad server stats
 and testing conversions.
 '''
 import json
+import time
 
 from omnic import singletons
 from omnic.responses.template import Jinja2TemplateHelper
@@ -79,9 +80,7 @@ def get_nodes_edges_ids(ext=None):
     dgraph = singletons.converter_graph.dgraph
     paths_flat = None
     if ext is not None:
-        paths = dgraph.get_all_paths_from(ext)
-        path_list = [item for item in (path for cost, path in paths)]
-        paths_flat = frozenset(sum(path_list, tuple()))
+        paths_flat = dgraph.get_reachable_from(ext)
     nodes = []
     edges = []
     all_node_set = set()
@@ -165,7 +164,7 @@ async def conversion_tester(request):
     except:
         pass  # could be a myriad of errors
     else:
-        if foreign_res.cache_exists():
+        if await foreign_res.cache_ready():
             # Determine the file type of the foreign resource
             typed_foreign_res = foreign_res.guess_typed()
             ext = typed_foreign_res.typestring.extension
@@ -197,6 +196,40 @@ async def conversion_graph(request, ext):
     })
 
 
+async def converter_availability(request):
+    availability = singletons.converter_availability
+    if not availability.statuses:
+        # Show results of a previous probe, if the background probe started
+        # at boot has not yet finished
+        availability.load(availability.get_cache_path())
+
+    probed_at = None
+    if availability.probed_at:
+        probed_at = time.strftime(
+            '%Y-%m-%d %H:%M:%S', time.localtime(availability.probed_at))
+    return templates.render(request, 'converters.html', {
+        'is_converters': True,
+        'statuses': sorted(availability.statuses.items()),
+        'probed_at': probed_at,
+    })
+
+
+def _format_time(timestamp):
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(timestamp))
+
+
+async def failures(request):
+    # Clearing is left to the "omnic clear-failures" command
+    return templates.render(request, 'failures.html', {
+        'is_failures': True,
+        'failures': [
+            (failure, _format_time(failure.failed_at),
+             _format_time(failure.expires_at))
+            for failure in singletons.negative_cache.get_all()
+        ],
+    })
+
+
 async def poll_worker_queue(request):
     workers = await get_worker_info()
     return templates.render(request, 'workers.html', {
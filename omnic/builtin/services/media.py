@@ -20,4 +20,5 @@ async def media_route(request, ts):
     await security.check(ts, request.args)
 
     # Perform all actions of convert endpoint
-    return await convert_endpoint(url_string, ts, is_just_checking)
+    return await convert_endpoint(url_string, ts, is_just_checking,
+                                  request_headers=request.headers)
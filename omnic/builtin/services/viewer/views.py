@@ -3,10 +3,11 @@ Serves JavaScript necessary to refresh and display viewers and thumbs.
 '''
 
 from omnic import singletons
-from omnic.conversion.utils import enqueue_conversion_path
 from omnic.responses.template import Jinja2TemplateHelper
 from omnic.types.resource import TypedResource
 from omnic.types.typestring import TypeString
+from omnic.web import httpcache
+from omnic.worker.jobs import ConversionJob
 
 templates = Jinja2TemplateHelper('omnic.builtin.services.viewer', 'templates')
 
@@ -34,27 +35,22 @@ async def viewers_js(request):
     target_ts = TypeString('min.js')  # get a minified JS bundle
     target_resource = TypedResource(url_string, target_ts)
 
-    if target_resource.cache_exists():
-        return await response.file(target_resource.cache_path, headers={
-            'Content-Type': 'application/javascript',
-        })
+    if await target_resource.cache_ready():
+        return await httpcache.cached_response(
+            request.headers, target_resource, 'application/javascript')
 
     # Otherwise, does not exist, save this descriptor to cache and kick off
     # conversion process
     if not viewers_resource.cache_exists():
         viewers_resource.save()
 
-    # Queue up a single function that will in turn queue up conversion process
-    await singletons.workers.async_enqueue_sync(
-        enqueue_conversion_path,
-        url_string,
-        str(target_ts),
-        singletons.workers.enqueue_convert
-    )
+    # Queue up detecting its type and each conversion step, each once the
+    # steps it depends on are done
+    singletons.workers.enqueue_job(ConversionJob(url_string, str(target_ts)))
 
-    return response.text(NOT_LOADED_JS, headers={
-        'Content-Type': 'application/javascript',
-    })
+    headers = httpcache.get_uncached_headers()
+    headers['Content-Type'] = 'application/javascript'
+    return response.text(NOT_LOADED_JS, headers=headers)
 
 
 async def reload_viewers_js(request):
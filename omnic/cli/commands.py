@@ -1,6 +1,7 @@
 '''
 Contains main entrypoint of all things Omni Converter
 '''
+import logging
 import os
 
 from omnic import singletons
@@ -13,6 +14,13 @@ from omnic.web import shortcuts
 from omnic.worker.testing import autodrain_worker
 
 cli = singletons.cli  # Alias
+log = logging.getLogger()
+
+
+def _probe_done(future):
+    if not future.cancelled() and future.exception() is not None:
+        log.error('Could not probe converter availability: %s'
+                  % repr(future.exception()))
 
 
 @cli.subcommand('Run HTTP server and workers for on-the-fly conversions', {
@@ -39,7 +47,18 @@ def runserver(args):
     worker_coros = singletons.workers.gather_run()
     server_coro = singletons.server.create_server_coro(
         host=host, port=port, debug=debug)
-    singletons.eventloop.run(server_coro, worker_coros)
+
+    # Probe converter availability in the background, so the admin service
+    # knows about unavailable converters without slowing down startup
+    loop = singletons.eventloop.loop
+    future = loop.run_in_executor(
+        None, singletons.converter_availability.refresh)
+    future.add_done_callback(_probe_done)
+
+    # Evict least recently used cached resources in the background, if
+    # any cache watermarks are configured
+    janitor_coro = singletons.cache_janitor.run()
+    singletons.eventloop.run(server_coro, worker_coros, janitor_coro)
 
 
 @cli.subcommand('Convert local files to target type', {
@@ -118,6 +137,7 @@ def _clear_cache(url, ts=None):
         cli.print('%s: clearing ALL at %s'
                   % (url, res.cache_path_base))
         res.cache_remove_all()
+        singletons.hot_cache.invalidate_path(res.cache_path_base)
     else:
         # Clears an entire ForeignResource cache
         res = TypedResource(url, ts)
@@ -131,6 +151,7 @@ def _clear_cache(url, ts=None):
             res.cache_remove_as_dir()
         else:
             res.cache_remove()
+        singletons.hot_cache.invalidate(res)
 
 
 async def _precache(url, to_type, force=False):
@@ -217,6 +238,72 @@ async def precache_named(args):
         await _precache(res.url_string, args.type)
 
 
+@cli.subcommand('Lists recently failed downloads and conversions', {})
+def list_failures(args):
+    failures = singletons.negative_cache.get_all()
+    for failure in failures:
+        target = failure.typestring or '(download)'
+        print('%s -> %s: %s' % (failure.url, target, failure.error))
+
+
+@cli.subcommand('Forgets failed downloads and conversions, to retry them', {
+    'urls': {
+        'help': 'URLs for foreign resources (if none given, forgets all)',
+        'nargs': '*',
+    },
+})
+def clear_failures(args):
+    negative_cache = singletons.negative_cache
+    if args.urls:
+        count = sum(negative_cache.clear(url) for url in args.urls)
+    else:
+        count = negative_cache.clear()
+    cli.print('Forgot %i failure(s)' % count)
+
+
+def _get_cache_index():
+    if not singletons.settings.CACHE_INDEX:
+        cli.printerr('The cache index is disabled (see CACHE_INDEX)')
+        return None
+    return singletons.cache_index
+
+
+@cli.subcommand('Reports disk usage of the cache per type', {})
+def cache_usage(args):
+    cache_index = _get_cache_index()
+    if cache_index is None:
+        return
+    for usage in cache_index.get_usage():
+        typestring = usage.typestring or '(downloads)'
+        print('%s: %i cached, %i bytes'
+              % (typestring, usage.count, usage.size))
+
+
+@cli.subcommand('Clears cache of all resources matching the given filters', {
+    '--host': {'help': 'Only clear resources from the given host'},
+    '--prefix': {'help': 'Only clear resources with URLs starting with it'},
+    ('--type', '-t'): {
+        'help': 'Only clear resources of given filetype',
+        'default': None,
+    },
+})
+def invalidate_cache(args):
+    cache_index = _get_cache_index()
+    if cache_index is None:
+        return
+    if not (args.host or args.prefix or args.type):
+        cli.printerr('Specify at least one of --host, --prefix or --type')
+        return
+    entries = cache_index.invalidate(
+        host=args.host,
+        url_prefix=args.prefix,
+        typestring=args.type,
+    )
+    for entry in entries:
+        cli.print('%s: cleared "%s" at %s'
+                  % (entry.url, entry.typestring or '', entry.path))
+
+
 @cli.subcommand('Generate media URLs for given foreign resources', {
     'urls': {'help': 'URLs for foreign resources', 'nargs': '+'},
     ('--type', '-t'): {
@@ -3,15 +3,20 @@
 AUTOLOAD = [
     'omnic.conversion.resolvergraph',
     'omnic.conversion.graph',
+    'omnic.conversion.failures',
     'omnic.cli.commandparser',
     'omnic.cli.commands',
     'omnic.responses.placeholder',
     'omnic.web.server',
     'omnic.web.eventloop',
     'omnic.web.viewer',
+    'omnic.web.hotcache',
     'omnic.worker.manager',
+    'omnic.worker.janitor',
     'omnic.worker.subprocessmanager',
+    'omnic.worker.executor',
     'omnic.types.detectors',
+    'omnic.types.cacheindex',
 ]
 
 HOST = '127.0.0.1'
@@ -27,6 +32,21 @@ WEB_SERVER = 'sanic'
 EVENT_LOOP = 'uvloop'
 WORKER = 'omnic.worker.aioworker.AioWorker'
 
+# Number of workers running downloads and conversions concurrently. Tasks
+# are routed by URL, such that every step for a resource runs on the same
+# worker in order, and idle workers steal tasks for other URLs from busy ones.
+WORKERS = 4
+
+# Backend recording queued tasks until they are done. The default keeps them
+# only in memory. With 'omnic.worker.taskqueue.SQLiteTaskQueue', they are
+# recorded at TASK_QUEUE_PATH (by default, task_queue.sqlite3 in
+# PATH_PREFIX), and tasks left over by a process that exited or crashed are
+# queued again when the server next starts on the same host. Failed tasks
+# are retried up to TASK_RETRIES times.
+TASK_QUEUE = 'omnic.worker.taskqueue.TaskQueue'
+TASK_QUEUE_PATH = None
+TASK_RETRIES = 0
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': True,
@@ -109,9 +129,46 @@ RESOLVERS = [
     'omnic.builtin.resolvers.git.GitDirectoryResolver',
 ]
 
+# Routes through the conversion graph are precompiled and saved to
+# ROUTING_TABLE_PATH (by default, routing_table.bin in PATH_PREFIX), such
+# that startup needs neither import converters nor compute routes. It is
+# rebuilt whenever CONVERTERS or PREFERRED_CONVERSION_PATHS change.
+ROUTING_TABLE = True
+ROUTING_TABLE_PATH = None
+
+# Availability of converters (e.g. whether or not their binaries are in PATH)
+# is probed concurrently by CONVERTER_PROBE_WORKERS threads, optionally also
+# recording versions (e.g. `convert -version`). Results are cached in
+# CONVERTER_PROBE_PATH (by default, converter_availability.json in
+# PATH_PREFIX) until PATH or a probed binary changes, or for at most
+# CONVERTER_PROBE_TTL seconds.
+CONVERTER_PROBE_WORKERS = 8
+CONVERTER_PROBE_VERSIONS = False
+CONVERTER_PROBE_TTL = 24 * 60 * 60
+CONVERTER_PROBE_PATH = None
+
+# Converters run where their execution class says: 'inline' on the event
+# loop, or in a shared pool of CONVERTER_THREADS threads ('thread') or of
+# CONVERTER_PROCESSES processes ('process', by default one per CPU).
+# CONVERTER_CONCURRENCY limits how many conversions run at once, by
+# converter class name or else by execution class, e.g.
+# {'PILThumb': 2, 'process': 4}.
+CONVERTER_THREADS = 4
+CONVERTER_PROCESSES = None
+CONVERTER_CONCURRENCY = {}
+
 PREFERRED_CONVERSION_PATHS = []
 CONVERSION_PROFILES = {}
 
+# Learn conversion graph edge costs from observed converter runtimes and
+# failure rates, recomputing routes at most every ADAPTIVE_COSTS_INTERVAL
+# seconds. The static cost of each observed edge is scaled by its time relative
+# to the mean time of all observed edges. Learned costs are persisted to
+# ADAPTIVE_COSTS_PATH (by default, converter_costs.json in PATH_PREFIX).
+ADAPTIVE_COSTS = False
+ADAPTIVE_COSTS_INTERVAL = 60
+ADAPTIVE_COSTS_PATH = None
+
 VIEWERS = [
     'omnic.builtin.viewers.omnic_viewer_core',
     'omnic.builtin.viewers.simple_image_viewer',
@@ -128,8 +185,97 @@ PATH_PREFIX = '/tmp/omnic/'
 
 RESOURCE_CACHE_INTERFIX = 'resource'
 MUTABLE_RESOURCE_CACHE_INTERFIX = 'mutable'
+CONTENT_CACHE_INTERFIX = 'content'
+
+# Store downloaded files once per SHA-256 digest of their contents (in
+# CONTENT_CACHE_INTERFIX), with the cache path of every URL with the same
+# contents linking to them. Conversion results are then stored per content
+# digest and TypeString, and reused for every URL with the same contents.
+CONTENT_ADDRESSED = False
 
+# How to group cached resources into subdirectories, based on a hash of their
+# URL: 'MD5', 'BLAKE2B' or None (no grouping). When changing it, set
+# PATH_GROUPING_MIGRATE_FROM to the previous value, and cached resources will
+# be moved to their new path when next checked for.
 PATH_GROUPING = 'MD5'
+PATH_GROUPING_MIGRATE_FROM = None
+
+# Converters and resolvers write into a temporary directory next to their
+# output's cache path, which is only moved into place once complete. While
+# writing, they hold a lock file, such that several processes can share the
+# same PATH_PREFIX. Workers wait at most CACHE_LOCK_TIMEOUT seconds (or
+# forever, if None) for another to release a lock.
+CACHE_LOCK_TIMEOUT = 600
+
+# Converters and downloaders running longer than SUBPROCESS_TIMEOUT seconds
+# (or forever, if None) are stopped, and fail. Converters may set their own
+# `timeout`.
+SUBPROCESS_TIMEOUT = 600
+
+# Cached resources are evicted, least recently used first and together with
+# everything converted from them, once the cache grows beyond
+# CACHE_HIGH_WATERMARK bytes or free disk space drops below
+# CACHE_FREE_LOW_WATERMARK bytes, until the cache is back below
+# CACHE_LOW_WATERMARK bytes and free disk space above
+# CACHE_FREE_HIGH_WATERMARK bytes. This is checked every
+# CACHE_JANITOR_INTERVAL seconds. By default, nothing is ever evicted.
+CACHE_HIGH_WATERMARK = None
+CACHE_LOW_WATERMARK = None
+CACHE_FREE_LOW_WATERMARK = None
+CACHE_FREE_HIGH_WATERMARK = None
+CACHE_JANITOR_INTERVAL = 5 * 60
+
+# Conversion results of at most HOT_CACHE_MAX_ITEM_SIZE bytes are kept in
+# memory once served or produced, and served from there, up to
+# HOT_CACHE_MAX_BYTES in total (0 to disable).
+HOT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+HOT_CACHE_MAX_ITEM_SIZE = 256 * 1024
+
+# Failed downloads and conversions are remembered for NEGATIVE_CACHE_TTL
+# seconds (0 to disable) in NEGATIVE_CACHE_PATH (by default,
+# negative_cache.json in PATH_PREFIX). Meanwhile, requests for them get an
+# error response instead of being queued again. See `omnic list-failures`
+# and `omnic clear-failures`.
+NEGATIVE_CACHE_TTL = 5 * 60
+NEGATIVE_CACHE_PATH = None
+
+# If CACHE_INDEX is enabled, every cached resource is recorded in an SQLite
+# index at CACHE_INDEX_PATH (by default, cache_index.sqlite3 in PATH_PREFIX),
+# which readiness checks consult instead of the filesystem. Writers wait at
+# most CACHE_INDEX_TIMEOUT seconds for one another. Requests wait at most
+# CACHE_INDEX_REQUEST_TIMEOUT seconds, checking the filesystem instead (or
+# not recording the access) if the index is busy. See `omnic cache-usage`
+# and `omnic invalidate-cache`.
+CACHE_INDEX = False
+CACHE_INDEX_PATH = None
+CACHE_INDEX_TIMEOUT = 30
+CACHE_INDEX_REQUEST_TIMEOUT = 0.1
+
+# Cache-Control header of media responses, by TypeString or type format of
+# the result (or '*' for any other). Results for URLs that always refer to
+# the same contents (git URLs pinned to a commit SHA) get
+# CACHE_CONTROL_IMMUTABLE instead. Placeholders, readiness checks and errors
+# get CACHE_CONTROL_PLACEHOLDER, since they soon change. All results also get
+# an ETag and Last-Modified header, for conditional requests.
+CACHE_CONTROL = {
+    '*': 'public, max-age=3600',
+}
+CACHE_CONTROL_IMMUTABLE = 'public, max-age=31536000, immutable'
+CACHE_CONTROL_PLACEHOLDER = 'no-store'
+
+# Media results larger than FILE_STREAM_THRESHOLD bytes (or byte ranges of
+# them) are streamed in chunks of FILE_STREAM_CHUNK_SIZE bytes, instead of
+# read into memory whole. Behind a proxy that can send files itself with
+# sendfile, set SENDFILE_HEADER to the header it takes them from (e.g.
+# 'X-Accel-Redirect' for nginx, or 'X-Sendfile'), and full responses are
+# left to it. The header is the absolute cache path, or its path relative to
+# PATH_PREFIX appended to SENDFILE_PREFIX (e.g. the internal location of
+# PATH_PREFIX for nginx), if set.
+FILE_STREAM_THRESHOLD = 1024 * 1024
+FILE_STREAM_CHUNK_SIZE = 64 * 1024
+SENDFILE_HEADER = None
+SENDFILE_PREFIX = None
+
 ALLOWED_LOCATIONS = {
     # local
     'localhost', '127.0.0.1',
@@ -3,7 +3,7 @@ import logging
 import os
 import sys
 from logging import config
-from types import ModuleType
+from types import MappingProxyType, ModuleType
 
 from omnic.config import default_settings
 from omnic.config.exceptions import ConfigurationError
@@ -17,6 +17,10 @@ class SettingsManager:
     '''
     The `settings' singleton, used to house project settings, including logic
     to default to default settings for unset settings.
+
+    Overridden, custom and default settings are flattened into a single
+    read-only snapshot whenever any of them change, and each setting is
+    also an attribute of the instance, so reading settings is cheap.
     '''
     Error = ConfigurationError
 
@@ -25,6 +29,9 @@ class SettingsManager:
         self.default_settings_module = default_settings
         self.settings_module = None
         self.overridden_settings = {}
+        self.snapshot = MappingProxyType({})
+        self.generation = 0  # Incremented whenever settings change
+        self._loaded = {}
 
         # Now we figure out which (if any) settings module to use
         files = os.listdir(os.getcwd())
@@ -50,26 +57,43 @@ class SettingsManager:
         self.reconfigure()
 
     def __getattr__(self, key):
+        # Only reached for settings missing from the snapshot
         if key.upper() != key:  # not upper case
             raise AttributeError('Invalid settings attribute, '
                                  'must be all-uppercase: "%s"' % key)
-        # Try with customized settings
-        if key in self.overridden_settings:
-            return self.overridden_settings[key]
-
-        try:  # Try with the custom settings
-            return getattr(self.settings_module, key)
-        except AttributeError:
-            pass
-
-        try:  # Try with the default settings
-            return getattr(self.default_settings_module, key)
-        except AttributeError:
-            pass
-
         raise ConfigurationError('Invalid settings: "%s"' % key)
 
+    @staticmethod
+    def _get_module_settings(settings_module):
+        return {
+            key: getattr(settings_module, key)
+            for key in dir(settings_module)
+            if key.upper() == key and not key.startswith('_')
+        }
+
+    def _rebuild_snapshot(self):
+        '''
+        Flatten default, custom and overridden settings (in that order of
+        precedence) into a new snapshot, and forget everything loaded from
+        the previous one
+        '''
+        flattened = self._get_module_settings(self.default_settings_module)
+        flattened.update(self._get_module_settings(self.settings_module))
+        flattened.update(self.overridden_settings)
+
+        # Mirror settings as instance attributes, so that accessing them does
+        # not need to go through __getattr__
+        instance_dict = vars(self)
+        for key in self.snapshot:
+            instance_dict.pop(key, None)
+        instance_dict.update(flattened)
+
+        self.snapshot = MappingProxyType(flattened)
+        self.generation += 1
+        self._loaded = {}
+
     def reconfigure(self):
+        self._rebuild_snapshot()
         self.load_all('AUTOLOAD')
         self.configure_logging()
 
@@ -89,14 +113,28 @@ class SettingsManager:
         '''
         Import settings key as import path
         '''
-        return self.load_path(getattr(self, key))
+        cache_key = ('load', key)
+        if cache_key not in self._loaded:
+            self._loaded[cache_key] = self.load_path(getattr(self, key))
+        return self._loaded[cache_key]
 
     def load_all(self, key, default=None):
         '''
         Import settings key as a dict or list with values of importable paths
         If a default constructor is specified, and a path is not importable, it
         falls back to running the given constructor.
+
+        Results are cached until settings change, and a new list or dict is
+        returned every time.
         '''
+        cache_key = ('load_all', key, default)
+        loaded = self._loaded.get(cache_key)
+        if loaded is None:
+            loaded = self._load_all(key, default)
+            self._loaded[cache_key] = loaded
+        return type(loaded)(loaded)
+
+    def _load_all(self, key, default):
         value = getattr(self, key)
         if default is not None:
             def loader(path): return self.load_path_with_default(path, default)
@@ -155,11 +193,10 @@ class SettingsManager:
             if lower_key.lower() != lower_key:
                 raise ValueError('Requires lowercase: %s' % lower_key)
             key = lower_key.upper()
-            try:
-                getattr(self, key)
-            except (AttributeError, ConfigurationError):
+            if key not in self.snapshot:
                 raise AttributeError('Cannot override %s' % key)
             self.overridden_settings[key] = value
+        self._rebuild_snapshot()
 
     def use_settings(self, settings_module):
         '''
@@ -0,0 +1,259 @@
+'''
+ConverterAvailability probes which converters can run on this host,
+concurrently, and caches the results to disk so that subsequent startups
+need not walk PATH for every converter.
+'''
+import hashlib
+import json
+import logging
+import os
+import subprocess
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from omnic import singletons
+from omnic.conversion.exceptions import ConverterUnavailable
+
+log = logging.getLogger()
+
+# Bump whenever the layout of the cache file changes
+FORMAT_VERSION = 1
+
+# Maximum number of seconds to wait for a version probe (e.g. `convert
+# -version`) before giving up on it
+VERSION_PROBE_TIMEOUT = 5
+
+ConverterStatus = namedtuple('ConverterStatus', [
+    'available',
+    'binary',
+    'binary_mtime',
+    'version',
+    'error',
+])
+
+
+def get_converter_name(converter):
+    '''
+    Helper to get a stable name for a converter class, instance or import
+    path
+    '''
+    if isinstance(converter, str):
+        return converter  # Already an import path
+    if not isinstance(converter, type):
+        converter = type(converter)
+    return '%s.%s' % (converter.__module__, converter.__qualname__)
+
+
+def _get_mtime(path):
+    if not path:
+        return None
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def get_probe_key(converter_names, probe_versions):
+    '''
+    Return a hash of everything on this host that can affect which of the
+    given converters are available: the PATH, and the state of every
+    directory in it (which changes whenever a binary is added or removed)
+    '''
+    search_path = os.environ.get('PATH', os.defpath)
+    directories = search_path.split(os.pathsep)
+    key_data = (
+        FORMAT_VERSION,
+        search_path,
+        tuple(_get_mtime(directory) for directory in directories),
+        tuple(converter_names),
+        bool(probe_versions),
+    )
+    return hashlib.sha1(repr(key_data).encode('utf-8')).hexdigest()
+
+
+def probe_version(binary, version_args):
+    '''
+    Run the given binary with the given arguments (e.g. ['-version']) and
+    return the first line of its output, or None if it could not be run
+    '''
+    try:
+        result = subprocess.run(
+            [binary] + list(version_args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            stdin=subprocess.DEVNULL,
+            timeout=VERSION_PROBE_TIMEOUT,
+        )
+    except (OSError, subprocess.SubprocessError) as e:
+        log.warning('Could not probe version of %s: %s' % (binary, str(e)))
+        return None
+    output = result.stdout.decode('utf-8', 'replace').strip()
+    return output.splitlines()[0] if output else None
+
+
+def probe_converter(converter, probe_versions=False):
+    '''
+    Configure the given converter, returning a ConverterStatus describing
+    whether or not it is available
+    '''
+    try:
+        converter.configure()
+    except ConverterUnavailable as e:
+        return ConverterStatus(False, None, None, None, str(e) or None)
+    except Exception as e:
+        # Probing runs in the background, so a broken converter should not
+        # take down the remaining probes
+        msg = 'Error configuring: %s' % repr(e)
+        return ConverterStatus(False, None, None, None, msg)
+
+    binary = getattr(converter, 'binary_path', None)
+    version = None
+    version_args = getattr(converter, 'version_args', None)
+    if binary and probe_versions and version_args:
+        version = probe_version(binary, version_args)
+    return ConverterStatus(True, binary, _get_mtime(binary), version, None)
+
+
+class ConverterAvailability:
+    '''
+    Statuses of all known converters, keyed by converter name. Probing runs
+    each converter's configure (and optionally a version probe)
+    concurrently, and the results are reused until the TTL expires, the PATH
+    changes, or any of the probed binaries change.
+    '''
+
+    def __init__(self):
+        self.statuses = {}
+        self.key = None
+        self.probed_at = None
+
+    def get_status(self, converter):
+        return self.statuses.get(get_converter_name(converter))
+
+    def is_available(self, converter):
+        '''
+        Return True if the converter was probed and found to be available
+        '''
+        status = self.get_status(converter)
+        return status is not None and status.available
+
+    def get_unavailable(self):
+        return sorted(
+            name for name, status in self.statuses.items()
+            if not status.available
+        )
+
+    def probe(self, converters, probe_versions=False, workers=None):
+        '''
+        Probe all given converters concurrently, replacing any previous
+        statuses
+        '''
+        converters = list(converters)
+        names = [get_converter_name(converter) for converter in converters]
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            statuses = executor.map(
+                lambda converter: probe_converter(converter, probe_versions),
+                converters,
+            )
+            self.statuses = dict(zip(names, statuses))
+        self.key = get_probe_key(names, probe_versions)
+        self.probed_at = time.time()
+
+    def is_fresh(self, key, ttl):
+        '''
+        Check if the current statuses are for the given key, are not older
+        than the given TTL in seconds, and no probed binary has changed since
+        '''
+        if self.key != key or self.probed_at is None:
+            return False
+        if time.time() - self.probed_at > ttl:
+            return False
+        return all(
+            _get_mtime(status.binary) == status.binary_mtime
+            for status in self.statuses.values()
+            if status.binary
+        )
+
+    def save(self, path):
+        data = {
+            'version': FORMAT_VERSION,
+            'key': self.key,
+            'probed_at': self.probed_at,
+            'statuses': {
+                name: status._asdict()
+                for name, status in self.statuses.items()
+            },
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(data, fd)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        '''
+        Load previously probed statuses from the given path, returning False
+        if there were none
+        '''
+        try:
+            with open(path) as fd:
+                data = json.load(fd)
+            if data['version'] != FORMAT_VERSION:
+                return False
+            statuses = {
+                name: ConverterStatus(**status)
+                for name, status in data['statuses'].items()
+            }
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning('Ignoring invalid converter availability %s: %s' %
+                        (path, e))
+            return False
+        self.statuses = statuses
+        self.key = data['key']
+        self.probed_at = data['probed_at']
+        return True
+
+    def get_cache_path(self):
+        settings = singletons.settings
+        if settings.CONVERTER_PROBE_PATH:
+            return settings.CONVERTER_PROBE_PATH
+        filename = 'converter_availability.json'
+        return os.path.join(settings.PATH_PREFIX, filename)
+
+    def refresh(self, converters=None, force=False):
+        '''
+        Ensure statuses are up-to-date for the given converters (by default,
+        all configured CONVERTERS), reusing the cached results on disk if
+        they are still fresh, and otherwise probing and saving new results
+        '''
+        settings = singletons.settings
+        if converters is None:
+            converters = settings.load_all('CONVERTERS')
+        converters = list(converters)
+        probe_versions = settings.CONVERTER_PROBE_VERSIONS
+        names = [get_converter_name(converter) for converter in converters]
+        key = get_probe_key(names, probe_versions)
+        path = self.get_cache_path()
+
+        if not force:
+            if self.is_fresh(key, settings.CONVERTER_PROBE_TTL):
+                return
+            if self.load(path) and \
+                    self.is_fresh(key, settings.CONVERTER_PROBE_TTL):
+                return
+
+        self.probe(
+            converters,
+            probe_versions=probe_versions,
+            workers=settings.CONVERTER_PROBE_WORKERS,
+        )
+        try:
+            self.save(path)
+        except OSError as e:
+            log.warning('Could not save converter availability: %s' % str(e))
+
+
+singletons.register('converter_availability', ConverterAvailability)
@@ -3,29 +3,54 @@ import shutil
 
 from omnic import singletons
 from omnic.conversion.exceptions import (ConversionInputError,
+                                         ConversionProcessError,
                                          ConverterUnavailable)
 from omnic.conversion.utils import apply_command_list_template
 from omnic.utils import filesystem
 
+# Execution classes, i.e. where converters run (see ConverterExecutor)
+INLINE = 'inline'    # On the event loop
+THREAD = 'thread'    # In the shared thread pool, e.g. for C code (like PIL)
+PROCESS = 'process'  # In the shared process pool, for CPU-bound Python code
+
 
 class Converter:
     cost = 1
 
+    # Converters run in a pool (THREAD or PROCESS) implement convert_sync
+    # instead of convert. Those run in the process pool must be picklable.
+    execution = INLINE
+
+    # Resolvers (with get_destination_type) set this if their destination
+    # type depends only on the URL scheme and argument shape (see
+    # get_argument_shape), such that it can be remembered per shape
+    destination_type_by_shape = False
+
     @staticmethod
     def configure():
         pass
 
-    def convert(self, in_resource, out_resource):
-        msg = 'Converter subclass must override convert.'
+    async def convert(self, in_resource, out_resource):
+        self.convert_sync(in_resource, out_resource)
+
+    def convert_sync(self, in_resource, out_resource):
+        msg = 'Converter subclass must override convert or convert_sync.'
         raise NotImplementedError(msg)
 
 
 class ExecConverter(Converter):
+    # Arguments that make the binary print its version, e.g. ['-version']
+    version_args = None
+
+    # Seconds after which the command is stopped, if not SUBPROCESS_TIMEOUT
+    timeout = None
+
     @classmethod
     def configure(cls):
         binary_path = shutil.which(cls.command[0])
         if not binary_path:
             raise ConverterUnavailable()
+        cls.binary_path = binary_path
 
     def get_arguments(self, resource):
         return resource.typestring.arguments
@@ -50,6 +75,8 @@ class ExecConverter(Converter):
     async def _run_command(self, cmd, kwds, in_resource, out_resource):
         # Compute working directory and misc keyword args
         kwds.setdefault('cwd', self.get_cwd(in_resource, out_resource))
+        if self.timeout is not None:
+            kwds.setdefault('timeout', self.timeout)
 
         # Run the command itself, capturing stdout and/or stderr as necessary
         captures = self.get_capture(in_resource, out_resource)
@@ -63,6 +90,12 @@ class ExecConverter(Converter):
                 result = await singletons.subprocess.run(cmd, **kwds)
         else:
             result = await singletons.subprocess.run(cmd, **kwds)
+
+        # Never mistake whatever a failed command left behind (e.g. partial
+        # captured output) for its result
+        if result.returncode != 0:
+            raise ConversionProcessError('%s exited with %i' % (
+                os.path.basename(cmd[0]), result.returncode))
         return result
 
     async def convert(self, in_resource, out_resource):
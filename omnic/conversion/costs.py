@@ -0,0 +1,126 @@
+'''
+Adaptive edge costs for the conversion graph, learned from observed converter
+runtimes and failures
+'''
+import json
+import logging
+import os
+
+log = logging.getLogger()
+
+# Input sizes are normalized to this many bytes, such that big inputs don't
+# make a converter look slower than it actually is
+SIZE_UNIT = 1024 * 1024
+
+# Edge costs must be positive
+MIN_COST = 0.001
+
+
+class EdgeStats:
+    '''
+    Smoothed statistics for a single edge of the conversion graph
+    '''
+    __slots__ = ('converter', 'seconds', 'failure_rate', 'runs')
+
+    def __init__(self, converter, seconds=0.0, failure_rate=0.0, runs=0):
+        self.converter = converter
+        self.seconds = seconds
+        self.failure_rate = failure_rate
+        self.runs = runs
+
+
+class AdaptiveCosts:
+    '''
+    Keeps exponentially weighted moving averages of wall-clock time (per unit
+    of input size) and failure rate for each converter edge, and turns them
+    into edge costs.
+
+    Static converter costs are unitless, so learned costs are too: the static
+    cost of an edge scaled by how its time compares to the mean time of all
+    observed edges. An edge exactly as fast as the mean keeps its static
+    cost, and edges never observed keep theirs as well.
+    '''
+    smoothing = 0.2  # Weight given to each new observation
+    failure_penalty = 10  # Cost multiplier for an always-failing edge
+
+    def __init__(self):
+        self.stats = {}
+        self._mean_seconds = None
+
+    def record(self, edge, converter_name, seconds, size=0, success=True):
+        '''
+        Record a single run of the converter for the given (in, out) edge
+        '''
+        seconds = seconds / (1 + size / SIZE_UNIT)
+        failure = 0.0 if success else 1.0
+        self._mean_seconds = None
+        stats = self.stats.get(edge)
+        if stats is None or stats.converter != converter_name:
+            self.stats[edge] = EdgeStats(converter_name, seconds, failure, 1)
+            return
+
+        alpha = self.smoothing
+        if success:
+            # Failed runs tend to exit early, so do not learn timing from them
+            stats.seconds += alpha * (seconds - stats.seconds)
+        stats.failure_rate += alpha * (failure - stats.failure_rate)
+        stats.runs += 1
+
+    def get_mean_seconds(self):
+        '''
+        Return the mean time (per unit of input size) of all observed edges
+        '''
+        if self._mean_seconds is None:
+            seconds = [stats.seconds for stats in self.stats.values()]
+            self._mean_seconds = sum(seconds) / max(len(seconds), 1)
+        return self._mean_seconds
+
+    def get_cost(self, edge, converter_name, default):
+        '''
+        Return the learned cost of the given edge, scaled from its static
+        cost (default), or default if it was never observed
+        '''
+        stats = self.stats.get(edge)
+        if stats is None or stats.converter != converter_name:
+            return default
+        mean_seconds = self.get_mean_seconds()
+        ratio = stats.seconds / mean_seconds if mean_seconds else 1.0
+        penalty = 1 + self.failure_penalty * stats.failure_rate
+        return max(MIN_COST, default * ratio * penalty)
+
+    def save(self, path):
+        records = [
+            {
+                'input': edge[0],
+                'output': edge[1],
+                'converter': stats.converter,
+                'seconds': stats.seconds,
+                'failure_rate': stats.failure_rate,
+                'runs': stats.runs,
+            }
+            for edge, stats in self.stats.items()
+        ]
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.tmp' % path
+        with open(tmp_path, 'w') as fd:
+            json.dump(records, fd)
+        os.replace(tmp_path, path)
+
+    def load(self, path):
+        try:
+            with open(path) as fd:
+                records = json.load(fd)
+        except FileNotFoundError:
+            return
+        except ValueError as e:
+            log.warning('Ignoring invalid converter costs %s: %s' % (path, e))
+            return
+        self._mean_seconds = None
+        for record in records:
+            edge = (record['input'], record['output'])
+            self.stats[edge] = EdgeStats(
+                record['converter'],
+                record['seconds'],
+                record['failure_rate'],
+                record['runs'],
+            )
@@ -0,0 +1,215 @@
+'''
+NegativeCache remembers failed downloads and conversions for a while, such
+that requests for them are answered with an error right away, instead of
+queuing the same failing work again and again.
+
+Failures are saved to disk, so they are shared between the server, its
+workers and the CLI. The file is only changed while holding a lock on it, such
+that failures recorded at once by different processes are all kept.
+'''
+import json
+import logging
+import os
+import time
+from collections import namedtuple
+
+from omnic import singletons
+from omnic.conversion.exceptions import ConversionInputError
+from omnic.types.resource import CacheLock, get_lock_path
+
+log = logging.getLogger()
+
+# Bump whenever the layout of the negative cache file changes
+FORMAT_VERSION = 1
+
+# HTTP status codes for the media route to respond to failures with
+DOWNLOAD_FAILED_STATUS = 502
+CONVERSION_INPUT_FAILED_STATUS = 422
+CONVERSION_FAILED_STATUS = 500
+
+Failure = namedtuple('Failure', [
+    'url',
+    'typestring',  # None if downloading failed
+    'error',
+    'converter',
+    'status',
+    'failed_at',
+    'expires_at',
+])
+
+
+def get_failure_status(typestring, exception):
+    if typestring is None:
+        return DOWNLOAD_FAILED_STATUS
+    if isinstance(exception, ConversionInputError):
+        return CONVERSION_INPUT_FAILED_STATUS
+    return CONVERSION_FAILED_STATUS
+
+
+def get_error_message(exception):
+    message = str(exception)
+    if message:
+        return '%s: %s' % (type(exception).__name__, message)
+    return type(exception).__name__
+
+
+class NegativeCache:
+    '''
+    Singleton of failed downloads (keyed by URL) and conversions (keyed by
+    URL and target TypeString), each expiring after NEGATIVE_CACHE_TTL
+    seconds
+    '''
+
+    def __init__(self):
+        self.failures = {}
+        self.loaded = None  # path and mtime of the loaded file
+
+    def get_cache_path(self):
+        settings = singletons.settings
+        if settings.NEGATIVE_CACHE_PATH:
+            return settings.NEGATIVE_CACHE_PATH
+        return os.path.join(settings.PATH_PREFIX, 'negative_cache.json')
+
+    def _reload_if_changed(self):
+        # Failures recorded or cleared by another process are picked up
+        # whenever the file changes
+        path = self.get_cache_path()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if (path, mtime) != self.loaded:
+            self.load(path)
+            self.loaded = (path, mtime)
+
+    def load(self, path):
+        self.failures = {}
+        try:
+            with open(path) as fd:
+                data = json.load(fd)
+            if data['version'] != FORMAT_VERSION:
+                return False
+            failures = [Failure(**failure) for failure in data['failures']]
+        except FileNotFoundError:
+            return False
+        except (ValueError, KeyError, TypeError) as e:
+            log.warning('Ignoring invalid negative cache %s: %s' % (path, e))
+            return False
+        self.failures = {
+            (failure.url, failure.typestring): failure
+            for failure in failures
+        }
+        return True
+
+    def save(self, path):
+        now = time.time()
+        data = {
+            'version': FORMAT_VERSION,
+            'failures': [
+                failure._asdict()
+                for failure in self.failures.values()
+                if failure.expires_at > now
+            ],
+        }
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'w') as fd:
+            json.dump(data, fd)
+        os.replace(tmp_path, path)
+        self.loaded = (path, os.stat(path).st_mtime_ns)
+
+    def _update(self, update):
+        # Reload, change (by calling update, which returns whether anything
+        # changed) and save the failures while holding the lock, such that
+        # no concurrent changes by other processes are overwritten
+        path = self.get_cache_path()
+        updated = False
+        try:
+            with CacheLock(get_lock_path(path)):
+                self.load(path)
+                updated = True
+                if update():
+                    self.save(path)
+        except OSError as e:
+            log.warning('Could not save negative cache: %s' % str(e))
+        if not updated:
+            update()  # Still remembered by this process
+
+    def record(self, url_string, typestring, exception, converter=None):
+        '''
+        Record that downloading the given URL (if typestring is None), or
+        converting it to the given TypeString failed with the given exception
+        '''
+        ttl = singletons.settings.NEGATIVE_CACHE_TTL
+        if not ttl:
+            return None
+        if typestring is not None:
+            typestring = str(typestring)
+        if converter is not None:
+            converter = type(converter).__name__
+        now = time.time()
+        failure = Failure(
+            url=url_string,
+            typestring=typestring,
+            error=get_error_message(exception),
+            converter=converter,
+            status=get_failure_status(typestring, exception),
+            failed_at=now,
+            expires_at=now + ttl,
+        )
+
+        def update():
+            self.failures[(url_string, typestring)] = failure
+            return True
+        self._update(update)
+        return failure
+
+    def get(self, url_string, typestring):
+        '''
+        Return the unexpired Failure of downloading the given URL, or of
+        converting it to the given TypeString, or None
+        '''
+        if not singletons.settings.NEGATIVE_CACHE_TTL:
+            return None
+        self._reload_if_changed()
+        if not self.failures:
+            return None
+        now = time.time()
+        for key in ((url_string, None), (url_string, str(typestring))):
+            failure = self.failures.get(key)
+            if failure is not None and failure.expires_at > now:
+                return failure
+        return None
+
+    def get_all(self):
+        '''
+        Return a list of all unexpired failures, most recent first
+        '''
+        self._reload_if_changed()
+        now = time.time()
+        failures = [
+            failure for failure in self.failures.values()
+            if failure.expires_at > now
+        ]
+        return sorted(failures, key=lambda f: f.failed_at, reverse=True)
+
+    def clear(self, url_string=None):
+        '''
+        Forget all failures, or only those of the given URL, returning how
+        many were forgotten
+        '''
+        keys = []
+
+        def update():
+            keys[:] = [
+                key for key in self.failures
+                if url_string is None or key[0] == url_string
+            ]
+            for key in keys:
+                del self.failures[key]
+            return bool(keys)
+        self._update(update)
+        return len(keys)
+
+
+singletons.register('negative_cache', NegativeCache)
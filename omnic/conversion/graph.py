@@ -1,13 +1,23 @@
 import logging
+import os
+import time
 
 from omnic import singletons
-from omnic.conversion.exceptions import ConverterUnavailable
+from omnic.conversion.availability import get_converter_name
+from omnic.conversion.costs import AdaptiveCosts
+from omnic.conversion.plan import ConversionPlan, MultiConversionPlan
+from omnic.conversion.profiles import ConversionProfiles, freeze_profiles
+from omnic.conversion.routing import RoutingTable, get_fingerprint
 from omnic.types.typestring import TypeString
 from omnic.utils.graph import DirectedGraph
 from omnic.utils.iters import pair_looper
+from omnic.utils.lru import LRUCache
 
 log = logging.getLogger()
 
+# Maximum number of distinct custom conversion profiles to remember
+PROFILES_CACHE_SIZE = 256
+
 
 def _format(string):
     '''
@@ -18,44 +28,88 @@ def _format(string):
 
 class ConverterGraph:
     def __init__(self, converter_list=None, prune_converters=False):
-        # Configure graph from arguments and global setting
-        if converter_list is None:
-            converter_list = singletons.settings.load_all('CONVERTERS')
-        self.converter_list = converter_list
         self._init_fields()
-
         settings = singletons.settings
-        self._setup_converter_graph(converter_list, prune_converters)
-        self._setup_preferred_paths(settings.PREFERRED_CONVERSION_PATHS)
+
+        # Configure graph from arguments and global setting, using the
+        # precompiled routing table if possible
+        table_path = None
+        if converter_list is None and not prune_converters:
+            table_path = self._get_routing_table_path(settings)
+        if not (table_path and self._setup_from_routing_table(table_path)):
+            if converter_list is None:
+                converter_list = settings.load_all('CONVERTERS')
+            self.converter_list = converter_list
+            self._setup_converter_graph(converter_list, prune_converters)
+            self._setup_preferred_paths(settings.PREFERRED_CONVERSION_PATHS)
+            if table_path:
+                self._save_routing_table(table_path)
+
         self._setup_profiles(settings.CONVERSION_PROFILES)
+        self._setup_adaptive_costs(settings)
+
+    @property
+    def converter_list(self):
+        # Converters are imported lazily when set up from a routing table
+        if self._converter_list is None:
+            self._converter_list = singletons.settings.load_all('CONVERTERS')
+        return self._converter_list
+
+    @converter_list.setter
+    def converter_list(self, converter_list):
+        self._converter_list = converter_list
 
     def _init_fields(self):
         self.conversion_profiles = {}
         self.direct_converters = {}
         self.dgraph = DirectedGraph()
         self.converters = {}
+        self.static_costs = {}  # (in, out) -> cost of its converter class
+        self.generation = 0
+        self.profiles = ConversionProfiles({})
+        self.custom_profiles = LRUCache(PROFILES_CACHE_SIZE)
+        self.adaptive_costs = None
+        self._converter_list = None
+        self.routing_table_fingerprint = None
+
+    def _clear_plans(self):
+        '''
+        Forget all compiled plans and custom profiles, necessary whenever the
+        graph changes
+        '''
+        self.generation += 1
+        self.custom_profiles.clear()
+        self.profiles = ConversionProfiles(
+            self.conversion_profiles,
+            generation=self.generation,
+        )
 
     def _setup_converter_graph(self, converter_list, prune_converters):
         '''
         Set up directed conversion graph, pruning unavailable converters as
-        necessary
+        necessary. Availability of all converters is probed concurrently,
+        and cached between runs.
         '''
+        if prune_converters:
+            availability = singletons.converter_availability
+            availability.refresh(converter_list)
+
         for converter in converter_list:
-            if prune_converters:
-                try:
-                    converter.configure()
-                except ConverterUnavailable as e:
-                    log.warning('%s unavailable: %s' %
-                                (converter.__class__.__name__, str(e)))
-                    continue
+            if prune_converters and not availability.is_available(converter):
+                status = availability.get_status(converter)
+                log.warning('%s unavailable: %s' %
+                            (get_converter_name(converter), status.error))
+                continue
 
             for in_ in converter.inputs:
                 for out in converter.outputs:
                     self.dgraph.add_edge(in_, out, converter.cost)
                     self.converters[(in_, out)] = converter
+                    self.static_costs[(in_, out)] = converter.cost
 
             if hasattr(converter, 'direct_outputs'):
                 self._setup_direct_converter(converter)
+        self._clear_plans()
 
     def _setup_preferred_paths(self, preferred_conversion_paths):
         '''
@@ -70,12 +124,22 @@ class ConverterGraph:
             else:
                 # If it did not break, then add to dgraph
                 self.dgraph.add_preferred_path(*path)
+        self._clear_plans()
 
     def _setup_profiles(self, conversion_profiles):
         '''
         Add given conversion profiles checking for invalid profiles
         '''
-        # Check for invalid profiles
+        self.conversion_profiles.update(
+            self._validate_profiles(conversion_profiles))
+        self._clear_plans()
+
+    def _validate_profiles(self, conversion_profiles):
+        '''
+        Return a new dict of the given conversion profiles, skipping invalid
+        profiles
+        '''
+        valid_profiles = {}
         for key, path in conversion_profiles.items():
             if isinstance(path, str):
                 path = (path, )
@@ -87,7 +151,118 @@ class ConverterGraph:
                     break
             else:
                 # If it did not break, then add to conversion profiles
-                self.conversion_profiles[key] = path
+                valid_profiles[key] = path
+        return valid_profiles
+
+    def _get_routing_table_path(self, settings):
+        '''
+        Return the path of the routing table to use, or None if disabled or
+        not possible with current settings
+        '''
+        if not settings.ROUTING_TABLE:
+            return None
+        converter_paths = settings.CONVERTERS
+        if not all(isinstance(path, str) for path in converter_paths):
+            return None  # Can only use routing table for import paths
+        self.routing_table_fingerprint = get_fingerprint(
+            converter_paths,
+            settings.PREFERRED_CONVERSION_PATHS,
+        )
+        if settings.ROUTING_TABLE_PATH:
+            return settings.ROUTING_TABLE_PATH
+        return os.path.join(settings.PATH_PREFIX, 'routing_table.bin')
+
+    def _setup_from_routing_table(self, path):
+        '''
+        Set up the graph from the routing table at the given path, without
+        importing any converters. Return False if there is no routing table,
+        or if it is out-of-date.
+        '''
+        table = RoutingTable.load(path, self.routing_table_fingerprint)
+        if table is None:
+            return False
+        for (in_, out), (converter_path, cost) in table.edges.items():
+            self.dgraph.add_edge(in_, out, cost)
+            self.converters[(in_, out)] = converter_path
+            self.static_costs[(in_, out)] = cost
+        self.direct_converters.update(table.direct_edges)
+        for cost, path in table.preferred_paths.values():
+            self.dgraph.add_preferred_path(*path, cost=cost)
+        self.dgraph.set_routes(table.routes)
+        self._clear_plans()
+        return True
+
+    def _save_routing_table(self, path):
+        '''
+        Compile and save a routing table for this graph to the given path
+        '''
+        table = RoutingTable.compile(
+            self.routing_table_fingerprint,
+            self,
+            singletons.settings.CONVERTERS,
+        )
+        try:
+            table.save(path)
+        except OSError as e:
+            log.warning('Could not save routing table: %s' % str(e))
+
+    def _load_converter(self, converter):
+        '''
+        Return the given converter class, importing it first if it is an
+        import path (as is the case when set up from a routing table)
+        '''
+        if isinstance(converter, str):
+            return singletons.settings.load_path(converter)
+        return converter
+
+    def _setup_adaptive_costs(self, settings):
+        '''
+        If enabled, load previously learned edge costs and apply them
+        '''
+        if not settings.ADAPTIVE_COSTS:
+            return
+        self.adaptive_costs = AdaptiveCosts()
+        self.adaptive_costs_path = settings.ADAPTIVE_COSTS_PATH
+        if not self.adaptive_costs_path:
+            self.adaptive_costs_path = os.path.join(
+                settings.PATH_PREFIX, 'converter_costs.json')
+        self.adaptive_costs.load(self.adaptive_costs_path)
+        self.apply_adaptive_costs()
+
+    def apply_adaptive_costs(self):
+        '''
+        Update the cost of every edge of the graph to the learned cost (or
+        static converter cost, if never observed), recomputing routes.
+        Converters are not imported, if set up from a routing table.
+        '''
+        for edge, converter in self.converters.items():
+            cost = self.adaptive_costs.get_cost(
+                edge, get_converter_name(converter), self.static_costs[edge])
+            self.dgraph.add_edge(edge[0], edge[1], cost)
+        self._clear_plans()
+        self.adaptive_costs_applied_at = time.monotonic()
+
+    def record_conversion(self, converter, from_ts, to_ts, seconds,
+                          size=0, success=True):
+        '''
+        Record an observed run of a converter between the given TypeStrings,
+        periodically recomputing routes and persisting learned costs
+        '''
+        if self.adaptive_costs is None:
+            return  # Adaptive costs are not enabled
+        edge = (from_ts.ts_format, to_ts.ts_format)
+        if edge not in self.converters:
+            return  # Direct conversions are not part of the graph
+        name = get_converter_name(converter)
+        self.adaptive_costs.record(edge, name, seconds, size, success)
+
+        elapsed = time.monotonic() - self.adaptive_costs_applied_at
+        if elapsed >= singletons.settings.ADAPTIVE_COSTS_INTERVAL:
+            self.apply_adaptive_costs()
+            try:
+                self.adaptive_costs.save(self.adaptive_costs_path)
+            except OSError as e:
+                log.warning('Could not save converter costs: %s' % str(e))
 
     def _setup_direct_converter(self, converter):
         '''
@@ -103,11 +278,81 @@ class ConverterGraph:
             for out in converter.direct_outputs:
                 self.direct_converters[(in_, out)] = converter
 
-    def find_path(self, in_, out):
+    def get_profiles(self, conversion_profiles):
+        '''
+        Given a dict of conversion profiles, return ConversionProfiles that
+        overlay them on top of the global conversion profiles.
+
+        The result is validated once and then reused for equal dicts, so it
+        (and its plan cache) can be shared between many concurrent requests.
+        Previously returned ConversionProfiles are passed through as-is,
+        unless the graph has since changed.
+        '''
+        if isinstance(conversion_profiles, ConversionProfiles):
+            if conversion_profiles.generation == self.generation:
+                return conversion_profiles
+            overrides = conversion_profiles.overrides
+        else:
+            overrides = freeze_profiles(conversion_profiles)
+
+        profiles = self.custom_profiles.get(overrides)
+        if profiles is None:
+            merged_profiles = dict(self.conversion_profiles)
+            merged_profiles.update(self._validate_profiles(dict(overrides)))
+            profiles = ConversionProfiles(
+                merged_profiles,
+                overrides=overrides,
+                generation=self.generation,
+            )
+            self.custom_profiles[overrides] = profiles
+        return profiles
+
+    def find_path(self, in_, out, profiles=None):
+        '''
+        Given an input and output TypeString, produce a ConversionPlan of the
+        graph traversal, keeping in mind special options like Conversion
+        Profiles, Preferred Paths, and Direct Conversions.
+
+        If profiles (a dict or ConversionProfiles) is given, it is overlaid on
+        top of the global conversion profiles.
+
+        Plans are compiled once and then memoized until the graph changes.
+        '''
+        if profiles is None:
+            profiles = self.profiles
+        else:
+            profiles = self.get_profiles(profiles)
+
+        key = (str(in_), str(out))
+        plan = profiles.plans.get(key)
+        if plan is None:
+            plan = self._compile_plan(profiles, in_, out)
+            profiles.plans[key] = plan
+        return plan
+
+    def find_paths(self, in_, outs, profiles=None):
+        '''
+        Given an input TypeString and a list of output TypeStrings, produce a
+        MultiConversionPlan that reaches every output, where intermediate
+        steps shared between outputs occur only once.
+        '''
+        if profiles is None:
+            profiles = self.profiles
+        else:
+            profiles = self.get_profiles(profiles)
+
+        key = (str(in_), tuple(str(out) for out in outs))
+        plan = profiles.plans.get(key)
+        if plan is None:
+            plan = MultiConversionPlan(
+                self.find_path(in_, out, profiles) for out in outs)
+            profiles.plans[key] = plan
+        return plan
+
+    def _compile_plan(self, conversion_profiles, in_, out):
         '''
-        Given an input and output TypeString, produce a graph traversal,
-        keeping in mind special options like Conversion Profiles, Preferred
-        Paths, and Direct Conversions.
+        Compile a ConversionPlan from in_ to out using the given (already
+        validated) conversion profiles
         '''
         if in_.arguments:
             raise ValueError('Cannot originate path in argumented TypeString')
@@ -115,7 +360,7 @@ class ConverterGraph:
         # Determine conversion profile. This is either simply the output, OR,
         # if a custom profile has been specified for this output, that custom
         # path or type is used.
-        profile = self.conversion_profiles.get(str(out), str(out))
+        profile = conversion_profiles.get(str(out), str(out))
         if isinstance(profile, str):
             profile = (profile, )
         types_by_format = {_format(s): TypeString(s) for s in profile}
@@ -127,8 +372,11 @@ class ConverterGraph:
         # First check for direct conversions, returning immediately if found
         direct_converter = self.direct_converters.get((in_str, out_str))
         if direct_converter:
+            direct_converter = self._load_converter(direct_converter)
             out_ts = types_by_format.get(out_str, TypeString(out_str))
-            return [(direct_converter, TypeString(in_str), out_ts)]
+            return ConversionPlan([
+                (direct_converter, TypeString(in_str), out_ts),
+            ])
 
         # No direct conversions was found, so find path through graph.
         # If profile was plural, add in extra steps.
@@ -141,9 +389,10 @@ class ConverterGraph:
         results = []
         for left, right in pair_looper(path):
             converter = self.converters.get((_format(left), _format(right)))
+            converter = self._load_converter(converter)
             right_typestring = types_by_format.get(right, TypeString(right))
             results.append((converter, TypeString(left), right_typestring))
-        return results
+        return ConversionPlan(results)
 
     def find_path_with_profiles(self, conversion_profiles, in_, out):
         '''
@@ -151,11 +400,7 @@ class ConverterGraph:
         conversion profile setting. Useful for "temporarily overriding" the
         global conversion profiles with your own.
         '''
-        original_profiles = dict(self.conversion_profiles)
-        self._setup_profiles(conversion_profiles)
-        results = self.find_path(in_, out)
-        self.conversion_profiles = original_profiles
-        return results
+        return self.find_path(in_, out, conversion_profiles)
 
 
 singletons.register('converter_graph', ConverterGraph)
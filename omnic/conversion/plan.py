@@ -0,0 +1,78 @@
+'''
+ConversionPlan is an immutable, precompiled path through the conversion graph
+'''
+from collections import namedtuple
+
+ConversionStep = namedtuple('ConversionStep', [
+    'converter',
+    'from_ts',
+    'to_ts',
+])
+
+
+class ConversionPlan:
+    '''
+    Immutable sequence of ConversionSteps, each consisting of the converter
+    class to use and the TypeStrings to convert from and to.
+
+    Plans are compiled once by ConverterGraph and then memoized, so they
+    should never be modified after creation.
+    '''
+    __slots__ = ('steps',)
+
+    def __init__(self, steps):
+        steps = tuple(ConversionStep(*step) for step in steps)
+        object.__setattr__(self, 'steps', steps)
+
+    def __setattr__(self, key, value):
+        raise AttributeError('ConversionPlan is immutable')
+
+    def __iter__(self):
+        return iter(self.steps)
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __getitem__(self, index):
+        return self.steps[index]
+
+    def __eq__(self, other):
+        if isinstance(other, ConversionPlan):
+            return self.steps == other.steps
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, ConversionPlan):
+            return not self.__eq__(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, repr(list(self.steps)))
+
+
+class MultiConversionPlan(ConversionPlan):
+    '''
+    Immutable merge of several ConversionPlans originating from the same
+    source type into a DAG of steps, ordered such that each step comes after
+    the step that produces its input.
+
+    Intermediate steps shared between plans (e.g. DOC -> PDF, when targeting
+    both PDF and PNG) only occur once, and each output type is only ever
+    produced by a single step.
+    '''
+    __slots__ = ('targets',)
+
+    def __init__(self, plans):
+        steps = []
+        produced = set()
+        targets = []
+        for plan in plans:
+            for step in plan:
+                output = str(step[2])
+                if output not in produced:
+                    produced.add(output)
+                    steps.append(step)
+            if len(plan):
+                targets.append(plan[-1][2])
+        super().__init__(steps)
+        object.__setattr__(self, 'targets', tuple(targets))
@@ -0,0 +1,69 @@
+'''
+ConversionProfiles are immutable, validated sets of conversion profiles
+'''
+from omnic.utils.lru import LRUCache
+
+# Maximum number of compiled conversion plans to remember per profiles
+PLAN_CACHE_SIZE = 1024
+
+
+def freeze_profiles(conversion_profiles):
+    '''
+    Given a dict of conversion profiles, return a hashable, canonical tuple
+    of its items
+    '''
+    return tuple(sorted(
+        (key, path if isinstance(path, str) else tuple(path))
+        for key, path in conversion_profiles.items()
+    ))
+
+
+class ConversionProfiles:
+    '''
+    Immutable and hashable mapping of conversion profiles, that is, of output
+    typestrings to custom typestrings or paths of typestrings.
+
+    Instances are created (and validated once) by a ConverterGraph, and
+    overlay the given overrides on top of the global conversion profiles.
+    Each has its own cache of compiled ConversionPlans, so per-request or
+    per-tenant profiles are as cheap to use as the global ones.
+    '''
+    __slots__ = ('_profiles', '_key', 'overrides', 'generation', 'plans')
+
+    def __init__(self, profiles, overrides=(), generation=0):
+        self._profiles = dict(profiles)
+        self._key = freeze_profiles(self._profiles)
+        self.overrides = overrides
+        self.generation = generation
+        self.plans = LRUCache(PLAN_CACHE_SIZE)
+
+    def get(self, key, default=None):
+        return self._profiles.get(key, default)
+
+    def items(self):
+        return self._profiles.items()
+
+    def __contains__(self, key):
+        return key in self._profiles
+
+    def __iter__(self):
+        return iter(self._profiles)
+
+    def __len__(self):
+        return len(self._profiles)
+
+    def __hash__(self):
+        return hash(self._key)
+
+    def __eq__(self, other):
+        if isinstance(other, ConversionProfiles):
+            return self._key == other._key
+        return NotImplemented
+
+    def __ne__(self, other):
+        if isinstance(other, ConversionProfiles):
+            return not self.__eq__(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return '%s(%s)' % (type(self).__name__, repr(self._profiles))
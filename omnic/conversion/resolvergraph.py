@@ -1,10 +1,16 @@
+import asyncio
 import os
 
 from omnic import singletons
 from omnic.conversion.graph import ConverterGraph
+from omnic.types import content
 from omnic.types.resource import ForeignResource, MutableResource
 from omnic.types.typestring import TypeString
-from omnic.utils.iters import first_last_iterator
+from omnic.utils.lru import LRUCache
+
+# Maximum number of distinct (scheme, argument shape) pairs to remember the
+# destination type of (see Converter.destination_type_by_shape)
+DESTINATION_TYPE_CACHE_SIZE = 1024
 
 
 def _get_basename_based_on_url(resource_url):
@@ -15,47 +21,105 @@ def _get_basename_based_on_url(resource_url):
     return path_basename
 
 
+def _get_basename_based_on_git_args(resource_url):
+    if len(resource_url.args) == 2:
+        # For now, git has 2 positional args, hash and path
+        git_tree, subpath = resource_url.args
+        basename = os.path.basename(subpath)
+        if basename:
+            return basename  # subpath was not '/' or ''
+    return _get_basename_based_on_url(resource_url)
+
+
+BASENAME_FINDERS = {
+    'git': _get_basename_based_on_git_args,
+    'git+https': _get_basename_based_on_git_args,
+    'git+http': _get_basename_based_on_git_args,
+}
+
+
+def get_argument_shape(args):
+    '''
+    Given the positional args of a ResourceURL, return its "shape": the
+    number of args, and which of them are the root path. Resolvers that set
+    destination_type_by_shape determine destination types based only on
+    scheme and argument shape.
+    '''
+    return tuple(arg == '/' for arg in args)
+
+
 class ResolverGraph(ConverterGraph):
     def __init__(self):
         self._init_fields()
 
         resolvers = singletons.settings.load_all('RESOLVERS')
         self._setup_converter_graph(resolvers, False)
+        self._setup_dispatch_table(resolvers)
 
         # Later, might want to enable these features:
         # self._setup_preferred_paths(settings.PREFERRED_RESOLVER_PATHS)
         # self._setup_profiles(settings.RESOLVER_PROFILES)
 
+    def _setup_dispatch_table(self, resolvers):
+        '''
+        Index resolvers that are opinionated about destination types by the
+        URL schemes they declare, such that each URL only needs to be
+        checked against the resolvers for its scheme
+        '''
+        self.resolvers_by_scheme = {}
+        self.any_scheme_resolvers = []
+        self.destination_types = LRUCache(DESTINATION_TYPE_CACHE_SIZE)
+        for resolver in resolvers:
+            # Not all resolvers are opinionated about destination types
+            if not hasattr(resolver, 'get_destination_type'):
+                continue
+
+            schemes = getattr(resolver, 'url_schemes', None)
+            if schemes is None:
+                # Undeclared schemes, so has to be checked for every URL
+                self.any_scheme_resolvers.append(resolver)
+                for scheme_resolvers in self.resolvers_by_scheme.values():
+                    scheme_resolvers.append(resolver)
+                continue
+
+            for scheme in schemes:
+                scheme_resolvers = self.resolvers_by_scheme.setdefault(
+                    scheme, list(self.any_scheme_resolvers))
+                scheme_resolvers.append(resolver)
+
     def find_resource_url_basename(self, resource_url):
         '''
         Figure out path basename for given resource_url
         '''
-        scheme = resource_url.parsed.scheme
-        if scheme in ('http', 'https', 'file'):
-            return _get_basename_based_on_url(resource_url)
-
-        elif scheme in ('git', 'git+https', 'git+http'):
-            if len(resource_url.args) == 2:
-                # For now, git has 2 positional args, hash and path
-                git_tree, subpath = resource_url.args
-                basename = os.path.basename(subpath)
-                if basename:
-                    return basename  # subpath was not '/' or ''
-        return _get_basename_based_on_url(resource_url)
+        finder = BASENAME_FINDERS.get(
+            resource_url.parsed.scheme, _get_basename_based_on_url)
+        return finder(resource_url)
 
     def find_destination_type(self, resource_url):
         '''
         Given a resource_url, figure out what it would resolve into
         '''
-        resolvers = self.converters.values()
+        scheme = resource_url.parsed.scheme
+        key = (scheme, get_argument_shape(resource_url.args))
+        destination_type = self.destination_types.get(key)
+        if destination_type is not None:
+            return destination_type
+
+        destination_type = None
+        by_shape = True
+        resolvers = self.resolvers_by_scheme.get(
+            scheme, self.any_scheme_resolvers)
         for resolver in resolvers:
-            # Not all resolvers are opinionated about destination types
-            if not hasattr(resolver, 'get_destination_type'):
-                continue
-
+            by_shape = by_shape and getattr(
+                resolver, 'destination_type_by_shape', False)
             destination_type = resolver.get_destination_type(resource_url)
             if destination_type:
-                return destination_type
+                break
+
+        # Only remembered if every resolver asked opted in, and found one
+        if destination_type and by_shape:
+            self.destination_types[key] = destination_type
+        return destination_type
 
     def find_path_from_url(self, resource_url):
         destination_type = self.find_destination_type(resource_url)
@@ -67,13 +131,18 @@ class ResolverGraph(ConverterGraph):
         return self.find_path(input_type, TypeString(destination_type))
 
     async def apply_resolver_path(self, resource_url, resolver_path):
-        argument_free_url = resource_url.url
-        for is_first, is_last, path_step in first_last_iterator(resolver_path):
-            converter_class, _, _ = path_step
-            converter = converter_class()
-            mutable_resource = MutableResource(argument_free_url)
-            out_resource = ForeignResource(resource_url)
-            await converter.convert(mutable_resource, out_resource)
+        mutable_resource = MutableResource(resource_url.url)
+        out_resource = ForeignResource(resource_url)
+
+        async def resolve(partial_resource):
+            for converter_class, _, _ in resolver_path:
+                converter = converter_class()
+                await converter.convert(mutable_resource, partial_resource)
+            if singletons.settings.CONTENT_ADDRESSED:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(
+                    None, content.store_download, partial_resource)
+        await out_resource.cache_write(resolve)
 
     async def download(self, resource_url):
         '''
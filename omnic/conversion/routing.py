@@ -0,0 +1,126 @@
+'''
+RoutingTable is a precompiled set of every route through a ConverterGraph,
+which can be persisted to disk to speed up startup.
+'''
+import hashlib
+import importlib.util
+import logging
+import marshal
+import os
+
+import omnic
+
+log = logging.getLogger()
+
+# Bump whenever the layout of the serialized table changes
+FORMAT_VERSION = 1
+
+
+def _get_module_stat(import_path):
+    '''
+    Given an import path to a class, return the modification time and size
+    of the file containing it, without importing it
+    '''
+    module_name, _, last_item = import_path.rpartition('.')
+    if not last_item[:1].isupper():
+        module_name = import_path  # Not a class, but a module
+    try:
+        spec = importlib.util.find_spec(module_name)
+        stat = os.stat(spec.origin)
+    except (ImportError, AttributeError, TypeError, ValueError, OSError):
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_fingerprint(converter_paths, preferred_conversion_paths):
+    '''
+    Return a hash of everything that can affect routes: the import paths of
+    all converters (and the state of the files containing them), and the
+    preferred conversion paths.
+    '''
+    fingerprint_data = (
+        FORMAT_VERSION,
+        marshal.version,
+        omnic.__version__,
+        tuple(converter_paths),
+        tuple(_get_module_stat(path) for path in converter_paths),
+        tuple(tuple(path) for path in preferred_conversion_paths),
+    )
+    return hashlib.sha1(repr(fingerprint_data).encode('utf-8')).hexdigest()
+
+
+class RoutingTable:
+    '''
+    Compact representation of a ConverterGraph, with converters referred to
+    by import path, and including the shortest path for every reachable
+    (input, output) pair.
+    '''
+
+    def __init__(self, fingerprint, edges, direct_edges,
+                 preferred_paths, routes):
+        self.fingerprint = fingerprint
+        self.edges = edges  # (in, out) -> (converter path, cost)
+        self.direct_edges = direct_edges  # (in, out) -> converter path
+        self.preferred_paths = preferred_paths  # (start, end) -> (cost, path)
+        self.routes = routes  # (start, end) -> (cost, path)
+
+    @classmethod
+    def compile(cls, fingerprint, cgraph, converter_paths):
+        '''
+        Compile a RoutingTable from the given ConverterGraph, where
+        converter_paths are the import paths of each of its converters
+        '''
+        paths = dict(zip(cgraph.converter_list, converter_paths))
+        edges = {
+            edge: (paths[converter], cgraph.static_costs[edge])
+            for edge, converter in cgraph.converters.items()
+        }
+        direct_edges = {
+            edge: paths[converter]
+            for edge, converter in cgraph.direct_converters.items()
+        }
+        routes = cgraph.dgraph.get_shortest_paths()
+        for key in cgraph.dgraph.preferred_paths:
+            routes.pop(key, None)  # Preferred paths are stored separately
+        return cls(
+            fingerprint,
+            edges,
+            direct_edges,
+            dict(cgraph.dgraph.preferred_paths),
+            routes,
+        )
+
+    def save(self, path):
+        data = (
+            FORMAT_VERSION,
+            self.fingerprint,
+            self.edges,
+            self.direct_edges,
+            self.preferred_paths,
+            self.routes,
+        )
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fd:
+            fd.write(marshal.dumps(data))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        '''
+        Load a RoutingTable from the given path, returning None if it does not
+        exist, or does not match the given fingerprint
+        '''
+        try:
+            with open(path, 'rb') as fd:
+                data = marshal.loads(fd.read())
+        except FileNotFoundError:
+            return None
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            log.warning('Ignoring invalid routing table %s: %s' % (path, e))
+            return None
+        if not isinstance(data, tuple) or len(data) != 6:
+            return None
+        if data[0] != FORMAT_VERSION or data[1] != fingerprint:
+            return None
+        return cls(*data[1:])
@@ -1,9 +1,11 @@
 from omnic import singletons
-from omnic.types.resource import (ForeignResource, TypedForeignResource,
-                                  TypedLocalResource, TypedPathedLocalResource,
-                                  TypedResource)
+from omnic.types.resource import (ForeignResource, TypedLocalResource,
+                                  TypedPathedLocalResource, TypedResource)
 from omnic.types.typestring import TypeString
 from omnic.utils.iters import first_last_iterator
+from omnic.web import httpcache
+from omnic.worker import tasks
+from omnic.worker.jobs import ConversionJob
 
 
 def _just_checking_response(resource_exists, resource):
@@ -11,13 +13,23 @@ def _just_checking_response(resource_exists, resource):
     return response.json({
         'url': resource.url_string,
         'ready': resource_exists,
-    })
+    }, headers=httpcache.get_uncached_headers())
 
 
-async def convert_endpoint(url_string, ts,
-                           is_just_checking, custom_profiles=None):
+def _failure_response(failure, resource):
+    response = singletons.server.response
+    return response.json({
+        'url': resource.url_string,
+        'ready': False,
+        'error': failure.error,
+    }, status=failure.status, headers=httpcache.get_uncached_headers())
+
+
+async def convert_endpoint(url_string, ts, is_just_checking,
+                           custom_profiles=None, request_headers=None):
     '''
-    Main logic for HTTP endpoint.
+    Main logic for HTTP endpoint. Conditional requests (with the given
+    request headers) for unchanged results are answered with 304.
     '''
     response = singletons.server.response
 
@@ -28,33 +40,54 @@ async def convert_endpoint(url_string, ts,
     target_ts = TypeString(ts)
     target_resource = TypedResource(url_string, target_ts)
 
-    # Send back cache if it exists
-    if target_resource.cache_exists():
+    # Send back from memory if served or produced recently
+    hot_cache = singletons.hot_cache
+    item = hot_cache.get_item(target_resource)
+    if item is not None:
+        singletons.cache_janitor.touch(target_resource)
         if is_just_checking:
             return _just_checking_response(True, target_resource)
-        return await response.file(target_resource.cache_path, headers={
-            'Content-Type': target_ts.mimetype,
-        })
+        return await httpcache.cached_response(
+            request_headers, target_resource, target_ts.mimetype, item)
 
-    # Check if already downloaded. If not, queue up download.
-    if not foreign_res.cache_exists():
-        singletons.workers.enqueue_download(foreign_res)
-
-    # Queue up a single function that will in turn queue up conversion
-    # process
-    singletons.workers.enqueue_sync(
-        enqueue_conversion_path,
-        url_string,
-        str(target_ts),
-        singletons.workers.enqueue_convert,
-        custom_profiles,
-    )
+    # Send back cache if it is completely written, keeping it in memory if
+    # it is small
+    if await target_resource.cache_ready():
+        singletons.cache_janitor.touch(target_resource)
+        if is_just_checking:
+            return _just_checking_response(True, target_resource)
+        hot_cache.admit(target_resource)
+        item = hot_cache.get_item(target_resource)
+        try:
+            return await httpcache.cached_response(
+                request_headers, target_resource, target_ts.mimetype, item)
+        except FileNotFoundError:
+            # Removed behind the cache index's back (e.g. its content was
+            # evicted), so forget it and convert it again
+            index = target_resource.cache_index()
+            if index is None:
+                raise
+            index.remove(target_resource)
+
+    # Respond with an error right away if downloading or converting failed
+    # recently, instead of trying again
+    failure = singletons.negative_cache.get(url_string, target_ts)
+    if failure is not None:
+        return _failure_response(failure, target_resource)
+
+    # Queue up downloading (unless already downloaded), detecting its type
+    # and each conversion step, each once the steps it depends on are done.
+    # Record the access, such that its input is not evicted meanwhile.
+    singletons.cache_janitor.touch(foreign_res)
+    singletons.workers.enqueue_job(
+        ConversionJob(url_string, str(target_ts), custom_profiles))
 
     if is_just_checking:
         return _just_checking_response(False, target_resource)
 
     # Respond with placeholder
-    return singletons.placeholders.stream_response(target_ts, response)
+    return singletons.placeholders.stream_response(
+        target_ts, response, headers=httpcache.get_uncached_headers())
 
 
 async def cache_foreign_resource(url_string):
@@ -98,12 +131,10 @@ async def convert_local(path, to_type):
     # Now find path between types
     typed_foreign_res = TypedLocalResource(path)
     original_ts = typed_foreign_res.typestring
-    conversion_path = singletons.converter_graph.find_path(
-        original_ts, to_type)
-    # print('Conversion path: ', conversion_path)
+    plan = singletons.converter_graph.find_path(original_ts, to_type)
 
     # Loop through each step in graph path and convert
-    for is_first, is_last, path_step in first_last_iterator(conversion_path):
+    for is_first, is_last, path_step in first_last_iterator(plan):
         converter_class, from_ts, to_ts = path_step
         converter = converter_class()
         in_resource = TypedLocalResource(path, from_ts)
@@ -113,41 +144,25 @@ async def convert_local(path, to_type):
 
         if is_last:
             out_resource = TypedPathedLocalResource(path, to_ts)
-        await converter.convert(in_resource, out_resource)
+
+        # Always reconvert, since the local file may have changed
+        async def write(partial_resource):
+            await singletons.converter_executor.convert(
+                converter, in_resource, partial_resource)
+        await out_resource.cache_write(write, replace=True)
 
 
 def enqueue_conversion_path(url_string, to_type,
                             enqueue_convert, custom_profiles=None):
     '''
     Given a URL string that has already been downloaded, enqueue
-    necessary conversion to get to target type
-    '''
-    target_ts = TypeString(to_type)
-    foreign_res = ForeignResource(url_string)
-
-    # Determine the file type of the foreign resource
-    typed_foreign_res = foreign_res.guess_typed()
-
-    if not typed_foreign_res.cache_exists():
-        # Symlink to new location that includes typed extension
-        typed_foreign_res.symlink_from(foreign_res)
-
-    # Now find path between types
-    original_ts = typed_foreign_res.typestring
-    cgraph = singletons.converter_graph
-    if custom_profiles:
-        path = cgraph.find_path_with_profiles(
-            custom_profiles, original_ts, target_ts)
-    else:
-        path = cgraph.find_path(original_ts, target_ts)
+    necessary conversion to get to target type. If to_type is a list of
+    target types, intermediate steps shared between them are only enqueued
+    once.
 
-    # Loop through each step in graph path and convert
-    is_first = True
-    for converter_class, from_ts, to_ts in path:
-        converter = converter_class()
-        in_resource = TypedResource(url_string, from_ts)
-        if is_first:  # Ensure first resource is just the source one
-            in_resource = TypedForeignResource(url_string, from_ts)
-        out_resource = TypedResource(url_string, to_ts)
+    Steps are enqueued all at once, so rely on being run in order (see
+    ConversionJob for running them once their inputs are ready).
+    '''
+    steps = tasks.plan_conversion(url_string, to_type, custom_profiles)
+    for converter, in_resource, out_resource in steps:
         enqueue_convert(converter, in_resource, out_resource)
-        is_first = False
@@ -46,12 +46,13 @@ class PlaceholderSelector:
                 return placeholder_class(typestring)
         return None
 
-    def stream_response(self, typestring, response):
+    def stream_response(self, typestring, response, headers=None):
         placeholder = self.get_placeholder(typestring)
         if not placeholder:
             raise PlaceholderNotFound(str(typestring))
         return response.stream(
             placeholder.stream_response,
+            headers=headers,
             content_type=placeholder.content_type,
         )
 
@@ -0,0 +1,297 @@
+'''
+Embedded SQLite index of cache entries (see CACHE_INDEX).
+
+Every cached resource written, linked, removed or evicted is recorded, such
+that readiness checks are a single lookup instead of a stat of a deep cache
+path, and the cache can be inventoried and invalidated in bulk without
+walking it. Resources cached before the index was enabled are recorded the
+next time a worker finds them already cached.
+'''
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from omnic import singletons
+
+# Bump whenever the schema changes. Since the index rebuilds itself as
+# resources are written, an outdated index is simply started over.
+FORMAT_VERSION = 1
+
+STATUS_READY = 'ready'
+STATUS_FAILED = 'failed'
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    host TEXT NOT NULL,
+    typestring TEXT,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    accessed_at REAL NOT NULL,
+    converter TEXT,
+    status TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_url ON entries (url);
+CREATE INDEX IF NOT EXISTS entries_host ON entries (host);
+CREATE INDEX IF NOT EXISTS entries_typestring ON entries (typestring);
+'''
+
+IndexEntry = namedtuple('IndexEntry', [
+    'path',
+    'url',
+    'host',
+    'typestring',  # None for downloaded (foreign) resources
+    'size',
+    'created_at',
+    'accessed_at',
+    'converter',
+    'status',
+])
+
+TypeUsage = namedtuple('TypeUsage', ['typestring', 'count', 'size'])
+
+
+def get_size(path):
+    '''
+    Return the total size of the given file, or of all files in the given
+    directory
+    '''
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    size = 0
+    for dirpath, dirnames, filenames in os.walk(path):
+        for filename in filenames:
+            try:
+                size += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass  # e.g. a broken link
+    return size
+
+
+class CacheIndex:
+    '''
+    Singleton index of all cache entries, shared by every worker and process
+    using the same cache. Each thread uses a connection of its own (or two,
+    see get_connection).
+    '''
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def is_enabled(self):
+        return singletons.settings.CACHE_INDEX
+
+    def get_index_path(self):
+        settings = singletons.settings
+        if settings.CACHE_INDEX_PATH:
+            return settings.CACHE_INDEX_PATH
+        return os.path.join(settings.PATH_PREFIX, 'cache_index.sqlite3')
+
+    def _connect(self, path, timeout):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=timeout)
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        with connection:
+            version, = connection.execute('PRAGMA user_version').fetchone()
+            if version != FORMAT_VERSION:
+                connection.execute('DROP TABLE IF EXISTS entries')
+                connection.execute('PRAGMA user_version = %i'
+                                   % FORMAT_VERSION)
+            connection.executescript(SCHEMA)
+        return connection
+
+    def get_connection(self, brief=False):
+        '''
+        Return the connection of the current thread to the index, (re)opening
+        it if needed, e.g. when settings changed. Unless brief is set, it
+        waits up to CACHE_INDEX_TIMEOUT seconds for other writers, otherwise
+        only CACHE_INDEX_REQUEST_TIMEOUT seconds, for use on the request path.
+        '''
+        path = self.get_index_path()
+        if getattr(self.local, 'path', None) != path:
+            self.close()
+            self.local.path = path
+        name = 'brief_connection' if brief else 'connection'
+        connection = getattr(self.local, name, None)
+        if connection is None:
+            settings = singletons.settings
+            if brief:
+                timeout = settings.CACHE_INDEX_REQUEST_TIMEOUT
+            else:
+                timeout = settings.CACHE_INDEX_TIMEOUT
+            connection = self._connect(path, timeout)
+            setattr(self.local, name, connection)
+        return connection
+
+    def close(self):
+        for name in ('connection', 'brief_connection'):
+            connection = getattr(self.local, name, None)
+            if connection is not None:
+                connection.close()
+            setattr(self.local, name, None)
+        self.local.path = None
+
+    def add(self, resource, converter=None, status=STATUS_READY):
+        '''
+        Record that the given resource was written to the cache (or failed to
+        be written), and by which converter
+        '''
+        try:
+            size = get_size(resource.cache_path)
+        except OSError:
+            size = 0
+        if converter is not None:
+            converter = type(converter).__name__
+        typestring = getattr(resource, 'typestring', None)
+        if typestring is not None:
+            typestring = str(typestring)
+        now = time.time()
+        connection = self.get_connection()
+        with connection:
+            connection.execute('''
+                INSERT OR REPLACE INTO entries
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (
+                resource.cache_path,
+                resource.url_string,
+                resource.url.parsed.netloc,
+                typestring,
+                size,
+                now,
+                now,
+                converter,
+                status,
+            ))
+
+    def adopt(self, resource):
+        '''
+        Record the given resource, found already cached, unless it is
+        recorded already
+        '''
+        entry = self.get(resource)
+        if entry is None or entry.status != STATUS_READY:
+            self.add(resource)
+
+    def get(self, resource):
+        '''
+        Return the IndexEntry of the given resource, or None
+        '''
+        row = self.get_connection().execute(
+            'SELECT * FROM entries WHERE path = ?',
+            (resource.cache_path,),
+        ).fetchone()
+        return None if row is None else IndexEntry(*row)
+
+    def is_ready(self, resource):
+        '''
+        Return whether the given resource is recorded as ready, or None if
+        the index was too busy to tell right away
+        '''
+        try:
+            row = self.get_connection(brief=True).execute(
+                'SELECT status FROM entries WHERE path = ?',
+                (resource.cache_path,),
+            ).fetchone()
+        except sqlite3.OperationalError:
+            return None
+        return row is not None and row[0] == STATUS_READY
+
+    def touch(self, resource):
+        '''
+        Record an access to the given resource, unless the index is too busy
+        to do so right away
+        '''
+        try:
+            connection = self.get_connection(brief=True)
+            with connection:
+                connection.execute(
+                    'UPDATE entries SET accessed_at = ? WHERE path = ?',
+                    (time.time(), resource.cache_path),
+                )
+        except sqlite3.OperationalError:
+            pass  # Accesses are only a hint for eviction anyway
+
+    def remove(self, resource):
+        self.remove_path(resource.cache_path)
+
+    def remove_path(self, path):
+        '''
+        Forget the entry at the given path, and any within it
+        '''
+        prefix = os.path.join(path, '')
+        connection = self.get_connection()
+        with connection:
+            connection.execute('''
+                DELETE FROM entries
+                WHERE path = ? OR substr(path, 1, ?) = ?
+            ''', (path, len(prefix), prefix))
+
+    def _select(self, host=None, url_prefix=None, typestring=None):
+        clauses = []
+        params = []
+        if host is not None:
+            clauses.append('host = ?')
+            params.append(host)
+        if url_prefix is not None:
+            clauses.append('substr(url, 1, ?) = ?')
+            params.extend((len(url_prefix), url_prefix))
+        if typestring is not None:
+            clauses.append('typestring = ?')
+            params.append(str(typestring))
+        query = 'SELECT * FROM entries'
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        rows = self.get_connection().execute(query, params).fetchall()
+        return [IndexEntry(*row) for row in rows]
+
+    def find(self, host=None, url_prefix=None, typestring=None):
+        '''
+        Return the IndexEntry of every cache entry with the given host, URL
+        prefix and TypeString, or of all of them
+        '''
+        return self._select(host, url_prefix, typestring)
+
+    def invalidate(self, host=None, url_prefix=None, typestring=None):
+        '''
+        Remove every cache entry with the given host, URL prefix and
+        TypeString from the cache, returning their IndexEntry tuples
+        '''
+        entries = self._select(host, url_prefix, typestring)
+        for entry in entries:
+            path = entry.path
+            if os.path.isdir(path) and not os.path.islink(path):
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            singletons.hot_cache.invalidate_path(path)
+        connection = self.get_connection()
+        with connection:
+            connection.executemany(
+                'DELETE FROM entries WHERE path = ?',
+                [(entry.path,) for entry in entries],
+            )
+        return entries
+
+    def get_usage(self):
+        '''
+        Return a TypeUsage tuple of the number and total size of ready cache
+        entries for each TypeString (None for downloads), largest first
+        '''
+        rows = self.get_connection().execute('''
+            SELECT typestring, COUNT(*), SUM(size) FROM entries
+            WHERE status = ?
+            GROUP BY typestring
+            ORDER BY SUM(size) DESC
+        ''', (STATUS_READY,)).fetchall()
+        return [TypeUsage(*row) for row in rows]
+
+
+singletons.register('cache_index', CacheIndex)
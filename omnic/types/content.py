@@ -0,0 +1,147 @@
+'''
+Content-addressed storage of cached resources (see CONTENT_ADDRESSED).
+
+Downloaded files are stored once per digest of their contents, and the cache
+path of every URL with those contents is a symlink to them. Conversion results
+are likewise stored once per content digest and TypeString, such that
+converting the same contents from another URL is an instant cache hit.
+'''
+import hashlib
+import os
+import shutil
+
+from omnic import singletons
+from omnic.types.resource import ForeignResource
+from omnic.utils.iters import group_by
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+# Content digests are grouped into this many nested directories
+CONTENT_PATH_DEPTH = 4
+
+BLOB_BASENAME = 'blob'
+OUTPUT_BASENAME = 'content'
+
+
+def hash_file(path):
+    '''
+    Return the SHA-256 hex digest of the contents of the given file
+    '''
+    digest = hashlib.sha256()
+    with open(path, 'rb') as fd:
+        for chunk in iter(lambda: fd.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def get_content_root():
+    settings = singletons.settings
+    return os.path.join(settings.PATH_PREFIX, settings.CONTENT_CACHE_INTERFIX)
+
+
+def get_content_path(digest, basename=BLOB_BASENAME):
+    '''
+    Return the path of the file with the given digest, or with the given
+    basename, of what was converted from it
+    '''
+    groups = group_by(digest, len(digest) // CONTENT_PATH_DEPTH)
+    return os.path.join(get_content_root(), *groups, basename)
+
+
+def get_output_path(digest, typestring):
+    basename = typestring.modify_basename(OUTPUT_BASENAME)
+    return get_content_path(digest, basename)
+
+
+def get_digest(resource):
+    '''
+    Return the content digest of the given (downloaded) foreign resource, or
+    None if it is not stored by content
+    '''
+    try:
+        target = os.readlink(resource.cache_path)
+    except OSError:
+        return None  # Not a link, or not downloaded yet
+    content_root = get_content_root()
+    if not target.startswith(content_root + os.sep):
+        return None
+    relpath = os.path.relpath(target, content_root)
+    groups = relpath.split(os.sep)[:-1]
+    if len(groups) != CONTENT_PATH_DEPTH:
+        return None
+    return ''.join(groups)
+
+
+def _move_to_content(path, content_path):
+    '''
+    Move the given file or directory to the given content path, unless it
+    is already stored there, and replace it with a link to it
+    '''
+    os.makedirs(os.path.dirname(content_path), exist_ok=True)
+    if os.path.lexists(content_path):
+        # Identical contents are already stored
+        if os.path.isdir(path) and not os.path.islink(path):
+            shutil.rmtree(path)
+        else:
+            os.unlink(path)
+    else:
+        os.replace(path, content_path)
+    os.symlink(content_path, path)
+
+
+def store_download(resource):
+    '''
+    Store the freshly downloaded file of the given (partial) foreign resource
+    by its contents, linking to it instead. Returns its digest, or None if it
+    is not a file, e.g. a directory from a git resolver.
+    '''
+    path = resource.cache_path
+    if os.path.islink(path) or not os.path.isfile(path):
+        return None
+    digest = hash_file(path)
+    _move_to_content(path, get_content_path(digest))
+    return digest
+
+
+def store_output(digest, resource):
+    '''
+    Store what was converted into the given (partial) typed resource by the
+    digest of its source and its TypeString, linking to it instead
+    '''
+    path = resource.cache_path
+    if os.path.islink(path) or not os.path.exists(path):
+        return
+    _move_to_content(path, get_output_path(digest, resource.typestring))
+
+
+def link_output(digest, resource):
+    '''
+    If a conversion result for the given source digest and TypeString of the
+    given typed resource is already stored, link to it, returning True
+    '''
+    output_path = get_output_path(digest, resource.typestring)
+    if not os.path.exists(output_path):
+        return False
+    resource.cache_makedirs()
+    try:
+        os.symlink(output_path, resource.cache_path)
+    except FileExistsError:
+        return True  # Another worker linked it first
+    index = resource.cache_index()
+    if index is not None:
+        index.add(resource)
+    return True
+
+
+def link_converted(resource):
+    '''
+    If CONTENT_ADDRESSED, and the source of the given typed resource has
+    identical contents to one already converted to its TypeString, link to
+    that result. Returns True if it was linked.
+    '''
+    if not singletons.settings.CONTENT_ADDRESSED:
+        return False
+    digest = get_digest(ForeignResource(resource.url_string))
+    if digest is None:
+        return False
+    return link_output(digest, resource)
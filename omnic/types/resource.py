@@ -1,28 +1,178 @@
+import asyncio
+import copy
+import itertools
 import os
 import re
 import shutil
+import time
 
 from omnic import singletons
 from omnic.types.resourceurl import BytesResourceURL, ResourceURL
 from omnic.utils.iters import group_by
+from omnic.utils.lru import LRUCache
 
 try:
     import requests
 except ImportError:
     requests = None
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # e.g. on Windows, where cache locks are not supported
+
+# Maximum number of resources to remember the cache paths of
+CACHE_PATHS_CACHE_SIZE = 4096
+
+# Seconds between attempts to acquire a cache lock held by another worker
+CACHE_LOCK_POLL_INTERVAL = 0.05
+
+# Names of temporary directories for partially written caches, and suffix of
+# lock files, both found next to the cache paths they are for
+PARTIAL_PREFIX = '.partial-'
+LOCK_SUFFIX = '.lock'
+
+# Suffix of the lock files of whole cache entries (see CacheJanitor), held
+# shared while writing to them, and exclusively while evicting them
+ENTRY_LOCK_SUFFIX = '.entry' + LOCK_SUFFIX
+
+_cache_paths = LRUCache(CACHE_PATHS_CACHE_SIZE)
+_partial_counter = itertools.count()
+
+
+def get_partial_name():
+    '''
+    Return a name, unique within this host, for the temporary directory that
+    a cached resource is written into before being moved into place
+    '''
+    return '%s%i-%i' % (PARTIAL_PREFIX, os.getpid(), next(_partial_counter))
+
+
+def get_lock_path(path, suffix=LOCK_SUFFIX):
+    '''
+    Return the path of the lock file next to the given cache path
+    '''
+    dirname, basename = os.path.split(path)
+    return os.path.join(dirname, '.%s%s' % (basename, suffix))
+
+
+class CacheLock:
+    '''
+    Asynchronous context manager holding an exclusive (or, if shared is set,
+    a shared) lock on the given lock file, across all workers and processes
+    using the same cache. The lock is released when the context exits, or if
+    the process dies.
+
+    Also usable as a synchronous context manager, which blocks while waiting
+    (and ignores timeout), for locks only ever held very briefly.
+    '''
+
+    def __init__(self, path, timeout=None, shared=False):
+        self.path = path
+        self.timeout = timeout
+        self.shared = shared
+        self.fd = None
+
+    async def __aenter__(self):
+        start = time.monotonic()
+        while not self.try_acquire():
+            if self.timeout is not None:
+                if time.monotonic() - start > self.timeout:
+                    self.release()
+                    raise CacheError('Timed out waiting for %s' % self.path)
+            await asyncio.sleep(CACHE_LOCK_POLL_INTERVAL)
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def _flock(self, blocking):
+        if fcntl is None:
+            return True
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        if not blocking:
+            operation |= fcntl.LOCK_NB
+        while True:
+            if self.fd is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+            try:
+                fcntl.flock(self.fd, operation)
+            except BlockingIOError:
+                return False
+            if self._is_current():
+                return True
+            # Removed by whoever held it meanwhile (see remove), so lock the
+            # lock file now in its place instead
+            self.release()
+
+    def _is_current(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        fd_stat = os.fstat(self.fd)
+        return (stat.st_dev, stat.st_ino) == (fd_stat.st_dev, fd_stat.st_ino)
+
+    def try_acquire(self):
+        '''
+        Acquire the lock without waiting, returning False if it is held by
+        someone else
+        '''
+        return self._flock(blocking=False)
+
+    def acquire(self):
+        '''
+        Acquire the lock, blocking until whoever else holds it releases it
+        '''
+        try:
+            self._flock(blocking=True)
+        except BaseException:
+            self.release()
+            raise
+
+    def remove(self):
+        '''
+        Remove the lock file while holding the lock exclusively, such that
+        lock files of removed cache entries do not pile up. Anyone waiting on
+        it locks a new lock file instead.
+        '''
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def release(self):
+        # Closing the file descriptor also releases the lock. The lock file
+        # itself is left in place, since removing it would race with other
+        # processes waiting on it.
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
 
 class Resource:
     '''
     Abstract base class for Resources
+
+    Resources are compact and immutable: every subclass declares its slots,
+    the hash is computed once, and cache paths are remembered for recently
+    seen resources.
     '''
+    # Whether this resource is recorded in the cache index (see CACHE_INDEX)
+    indexed = True
+
     __slots__ = (
-        # Slots used by all Resources
         'url', 'url_string',
-        'basename', 'md5', 'cache_path_base', 'cache_path'
-
-        # Optional slots used by subclasses
-        'typestring', 'foreign', 'data',
+        'basename', 'cache_path_base', 'cache_path',
+        '_hash',
     )
 
     def __init__(self, resource_url):
@@ -33,19 +183,41 @@ class Resource:
 
         # Alias properties of URL
         self.url_string = str(self.url)
-        self.md5 = self.url.md5
+        self._hash = None
+
+        # Generate filepath, reusing it if computed for an equal resource
+        # with the same settings
+        key = (self._get_cache_paths_key(), singletons.settings.generation)
+        paths = _cache_paths.get(key)
+        if paths is None:
+            basename = self._get_basename()
+            cache_path_base = self._get_cache_path_base()
+            paths = (
+                basename,
+                cache_path_base,
+                os.path.join(cache_path_base, basename),
+            )
+            _cache_paths[key] = paths
+        self.basename, self.cache_path_base, self.cache_path = paths
+
+    def _get_cache_paths_key(self):
+        '''
+        Return a key that determines the cache paths of this resource
+        '''
+        return (type(self), self.url_string, getattr(self, 'typestring', None))
+
+    def _compute_hash(self):
+        return hash(self.url_string)
 
-        # Generate filepath
-        self.basename = self._get_basename()
-        self.cache_path_base = os.path.join(
+    @property
+    def md5(self):
+        return self.url.md5
+
+    def _get_cache_path_base(self, path_grouping=None):
+        return os.path.join(
             singletons.settings.PATH_PREFIX,
             self._get_cache_interfix(),
-            *self.path_grouping(),
-        )
-
-        self.cache_path = os.path.join(
-            self.cache_path_base,
-            self.basename,
+            *self.path_grouping(path_grouping),
         )
 
     def _get_cache_interfix(self):
@@ -54,13 +226,44 @@ class Resource:
     def _get_basename(self):
         raise NotImplementedError()
 
-    def path_grouping(self):
-        if singletons.settings.PATH_GROUPING is None:
+    def path_grouping(self, path_grouping=None):
+        if path_grouping is None:
+            path_grouping = singletons.settings.PATH_GROUPING
+        if path_grouping is None:
             return ['']
-        if singletons.settings.PATH_GROUPING == 'MD5':
-            return group_by(self.md5, 8)
+        if path_grouping == 'MD5':
+            return group_by(self.url.md5, 8)
+        if path_grouping == 'BLAKE2B':
+            return group_by(self.url.blake2b, 8)
         raise singletons.settings.Error('Invalid PATH_GROUPING')
 
+    def cache_migrate(self):
+        '''
+        If PATH_GROUPING_MIGRATE_FROM is set, and this resource is only
+        cached at the path it would have had under that PATH_GROUPING, move
+        it to its current cache path. Returns True if it was moved.
+        '''
+        previous_grouping = singletons.settings.PATH_GROUPING_MIGRATE_FROM
+        if not previous_grouping:
+            return False
+        cached_path = os.path.join(self.cache_path_base, self.basename)
+        if self.cache_path != cached_path:
+            return False  # Not stored in the cache, e.g. a local file
+        previous_path = os.path.join(
+            self._get_cache_path_base(previous_grouping),
+            self.basename,
+        )
+        if previous_path == self.cache_path:
+            return False
+        if not os.path.exists(previous_path):
+            return False
+        self.cache_makedirs()
+        try:
+            os.rename(previous_path, self.cache_path)
+        except FileNotFoundError:
+            pass  # Another worker migrated it first
+        return True
+
     def cache_makedirs(self, subdir=None):
         '''
         Make necessary directories to hold cache value
@@ -75,9 +278,113 @@ class Resource:
 
     def cache_lock(self):
         '''
-        Call AFTER a resource has been prepared or finished resolving.
+        Return a CacheLock for writing this resource, held by at most one
+        worker at a time across all processes
+        '''
+        return CacheLock(get_lock_path(self.cache_path),
+                         singletons.settings.CACHE_LOCK_TIMEOUT)
+
+    def cache_entry_path(self):
+        '''
+        Return the path of the cache entry holding this resource (see
+        CacheJanitor): the directory of all resources with its URL, or
+        without PATH_GROUPING, its cache path itself
+        '''
+        if singletons.settings.PATH_GROUPING is None:
+            return self.cache_path
+        return self.cache_path_base
+
+    def cache_entry_lock(self):
+        '''
+        Return a shared CacheLock on the cache entry holding this resource,
+        such that it is not evicted while being written to
+        '''
+        lock_path = get_lock_path(self.cache_entry_path(), ENTRY_LOCK_SUFFIX)
+        return CacheLock(lock_path, singletons.settings.CACHE_LOCK_TIMEOUT,
+                         shared=True)
+
+    def cache_index(self):
+        '''
+        Return the cache index if it is enabled for this resource, or None
         '''
-        pass  # TODO fill in
+        if self.indexed and singletons.settings.CACHE_INDEX:
+            return singletons.cache_index
+        return None
+
+    def cache_partial(self):
+        '''
+        Return a copy of this resource with its cache path in a new temporary
+        directory next to its actual cache path, to be written to and then
+        moved into place with cache_commit
+        '''
+        dirname, basename = os.path.split(self.cache_path)
+        partial_dirname = os.path.join(dirname, get_partial_name())
+        os.makedirs(partial_dirname, exist_ok=True)
+        partial = copy.copy(self)
+        partial.cache_path = os.path.join(partial_dirname, basename)
+        return partial
+
+    def cache_commit(self, partial, converter=None):
+        '''
+        Atomically move the completely written cache of the given partial
+        resource into place, replacing any previous cache, and record it
+        in the cache index along with the converter that wrote it
+        '''
+        try:
+            os.replace(partial.cache_path, self.cache_path)
+        except FileNotFoundError:
+            partial_dirname = os.path.dirname(partial.cache_path)
+            if not os.path.isdir(partial_dirname):
+                raise CacheError('Removed while writing: %s' % partial_dirname)
+            # Nothing was written, e.g. a no-op resolver
+            self.cache_discard(partial)
+            return
+        except OSError:
+            # A directory cannot atomically replace a non-empty one (or a
+            # link to one), so remove the previous cache first
+            if not os.path.isdir(self.cache_path):
+                raise
+            self.cache_remove_as_dir()
+            os.replace(partial.cache_path, self.cache_path)
+        self.cache_discard(partial)
+        index = self.cache_index()
+        if index is not None:
+            index.add(self, converter)
+
+    def cache_discard(self, partial):
+        '''
+        Remove whatever is left of the given partial resource
+        '''
+        partial_dirname = os.path.dirname(partial.cache_path)
+        shutil.rmtree(partial_dirname, ignore_errors=True)
+
+    async def cache_write(self, write, replace=False, converter=None):
+        '''
+        Call the given coroutine function with a partial copy of this resource
+        to write to while holding its cache lock, then move the result into
+        place. Unless replace is set, returns False without calling it if
+        another worker got there first. The cache entry is not evicted
+        meanwhile.
+        '''
+        # Recording it in the cache index may wait on other writers, so it is
+        # done off the event loop
+        loop = asyncio.get_event_loop()
+        async with self.cache_entry_lock(), self.cache_lock():
+            if not replace and self.cache_exists():
+                # Written by another worker, or before it was indexed
+                index = self.cache_index()
+                if index is not None:
+                    await loop.run_in_executor(None, index.adopt, self)
+                return False
+            partial = self.cache_partial()
+            try:
+                await write(partial)
+            except BaseException:
+                self.cache_discard(partial)
+                raise
+            await loop.run_in_executor(
+                None, self.cache_commit, partial, converter)
+        return True
 
     def cache_open(self, mode='rb'):
         if 'w' in mode:
@@ -91,23 +398,47 @@ class Resource:
         return open(path, mode=mode)
 
     def cache_exists(self):
-        return os.path.exists(self.cache_path)
+        if os.path.exists(self.cache_path):
+            return True
+        return self.cache_migrate()
 
     async def cache_ready(self):
-        # TODO fill in, check if locked
-        return os.path.exists(self.cache_path)
+        '''
+        Check if this resource is completely written to the cache. Since
+        caches are only ever moved into place once complete (see
+        cache_write), this is the case as soon as it exists, or is recorded
+        in the cache index. If the index is busy, the filesystem is checked
+        instead.
+        '''
+        index = self.cache_index()
+        if index is not None:
+            ready = index.is_ready(self)
+            if ready is not None:
+                return ready
+        return self.cache_exists()
+
+    def _cache_unindex(self, path):
+        index = self.cache_index()
+        if index is not None:
+            index.remove_path(path)
 
     def cache_remove(self):
+        self._cache_unindex(self.cache_path)
         return os.unlink(self.cache_path)
 
     def cache_remove_as_dir(self):
+        self._cache_unindex(self.cache_path)
+        if os.path.islink(self.cache_path):
+            return os.unlink(self.cache_path)  # e.g. to content storage
         return shutil.rmtree(self.cache_path)
 
     def __repr__(self):
         return '%s(%s)' % (type(self).__name__, repr(self.url_string))
 
     def __hash__(self):
-        return hash(self.url_string)
+        if self._hash is None:
+            self._hash = self._compute_hash()
+        return self._hash
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
@@ -125,6 +456,7 @@ class ForeignResource(Resource):
     A resource from a foreign source (e.g. a URL), which does not have a known
     type, and may or may not be downloaded.
     '''
+    __slots__ = ()
 
     def _get_basename(self):
         return self.url.path_basename
@@ -134,8 +466,10 @@ class ForeignResource(Resource):
         if requests is None:
             raise RuntimeError('requests is not installed')
         req = requests.get(self.url_string, stream=True)
-        with self.cache_open('wb') as f:
+        partial = self.cache_partial()
+        with partial.cache_open('wb') as f:
             shutil.copyfileobj(req.raw, f)
+        self.cache_commit(partial)
 
     def validate(self):
         if not check_url(singletons.settings, self.url.parsed):
@@ -148,6 +482,7 @@ class ForeignResource(Resource):
         return TypedForeignResource(self.url_string, ts)
 
     def cache_remove_all(self):
+        self._cache_unindex(self.cache_path_base)
         return shutil.rmtree(self.cache_path_base)
 
 
@@ -155,6 +490,7 @@ class MutableResource(ForeignResource):
     '''
     A Mutable Resource resource from a foreign source (e.g. a URL)
     '''
+    __slots__ = ()
 
     def _get_cache_interfix(self):
         return singletons.settings.MUTABLE_RESOURCE_CACHE_INTERFIX
@@ -165,6 +501,7 @@ class TypedForeignResource(Resource):
     A resource freshly downloaded from a foreign source that has a known
     (guessed) type.
     '''
+    __slots__ = ('typestring',)
 
     def __init__(self, url, typestring):
         self.typestring = typestring
@@ -184,7 +521,13 @@ class TypedForeignResource(Resource):
     def symlink_from(self, foreign_resource):
         if foreign_resource.cache_path == self.cache_path:
             return
-        os.symlink(foreign_resource.cache_path, self.cache_path)
+        try:
+            os.symlink(foreign_resource.cache_path, self.cache_path)
+        except FileExistsError:
+            return  # Another worker symlinked it first
+        index = self.cache_index()
+        if index is not None:
+            index.add(self)
 
 
 class TypedResource(Resource):
@@ -192,6 +535,7 @@ class TypedResource(Resource):
     A resource that is or will be the result of a conversion, thus having
     a known type.
     '''
+    __slots__ = ('typestring',)
 
     def __init__(self, url_string, typestring):
         self.typestring = typestring
@@ -205,8 +549,8 @@ class TypedResource(Resource):
     def _get_basename(self):
         return self.typestring.modify_basename(self.url.path_basename)
 
-    def __hash__(self):
-        return hash('%s - %s' % (self.url_string, str(self.typestring)))
+    def _compute_hash(self):
+        return hash((self.url_string, str(self.typestring)))
 
 
 class TypedLocalResource(Resource):
@@ -216,6 +560,9 @@ class TypedLocalResource(Resource):
 
     Used in CLI conversions.
     '''
+    indexed = False
+
+    __slots__ = ('path', 'foreign', 'typestring')
 
     def __init__(self, path, typestring=None):
         self.path = path
@@ -239,7 +586,10 @@ class TypedLocalResource(Resource):
         else:
             return self.typestring.modify_basename(self.url.path_basename)
 
-    def __hash__(self):
+    def _get_cache_paths_key(self):
+        return super()._get_cache_paths_key() + (self.foreign,)
+
+    def _compute_hash(self):
         return hash(self.path)
 
 
@@ -250,6 +600,7 @@ class TypedPathedLocalResource(TypedLocalResource):
 
     Used in CLI conversions.
     '''
+    __slots__ = ()
 
     def __init__(self, path, typestring):
         super().__init__(path, typestring)
@@ -267,6 +618,7 @@ class ForeignBytesResource(ForeignResource):
     '''
     A foreign resource that consists of a string of bytes instead of a URL.
     '''
+    __slots__ = ('data',)
 
     def __init__(self, data, extension=None, basename='source'):
         self.data = data
@@ -276,8 +628,12 @@ class ForeignBytesResource(ForeignResource):
         return '%s(%s)' % (type(self).__name__, repr(self.data))
 
     def save(self):
-        with self.cache_open('wb') as f:
+        # Identical data is written by every worker, so there is no need to
+        # lock, only to ensure the cache is never seen half-written
+        partial = self.cache_partial()
+        with partial.cache_open('wb') as f:
             f.write(self.data)
+        self.cache_commit(partial)
 
     def download(self):
         self.save()
@@ -7,9 +7,13 @@ from urllib.parse import urlparse
 
 from omnic import singletons
 from omnic.types.exceptions import URLParseException
+from omnic.utils.lru import LRUCache
 
 DEFAULT_SCHEME = 'http'
 
+# Maximum number of parsed ResourceURLs to remember
+PARSE_CACHE_SIZE = 4096
+
 URL_ARGUMENTS_RE = re.compile(r'<([^>]+)>')
 SPLIT_URL_RE = re.compile(r'^([^<]+)(<?.*)$')
 ARG_RE = re.compile(r'^\s*([a-zA-Z0-9]+)\s*:\s*(.*)$')
@@ -19,9 +23,34 @@ SCHEME_RE = re.compile(r'^[a-zA-Z0-9+-]+://')
 class ResourceURL:
     '''
     Immutable utility class for parsing URLs
-    '''
 
-    def __init__(self, s):
+    Parsed ResourceURLs are remembered, so parsing the same string again
+    returns the same instance. Hashes and the path basename are only
+    computed when first needed.
+    '''
+    __slots__ = (
+        'str',
+        'args',
+        'kwargs',
+        'url',
+        'parsed',
+        'path_split',
+        '_normalized',
+        '_path_basename',
+        '_md5',
+        '_blake2b',
+    )
+    _parsed_urls = LRUCache(PARSE_CACHE_SIZE)
+
+    def __new__(cls, s):
+        resource_url = cls._parsed_urls.get(s)
+        if resource_url is None:
+            resource_url = super().__new__(cls)
+            resource_url._setup(s)
+            cls._parsed_urls[s] = resource_url
+        return resource_url
+
+    def _setup(self, s):
         self.str = s
 
         url_string, args, kwargs = self.parse_string(s)
@@ -33,18 +62,46 @@ class ResourceURL:
         self.parsed = urlparse(url_string)
         self.path_split = self.parsed.path.split('/')
 
-        # In case something else should drive the basename of paths built from
-        # this URL, e.g., in the case of a resource within a git repo
-        self.path_basename = self.get_basename(self)
-
-        self.md5 = hashlib.md5(str(self).encode('utf-8')).hexdigest()
-
-    def __str__(self):
-        return ''.join((
+        self._normalized = ''.join((
             self.url,
             ''.join('<%s>' % arg for arg in self.args),
             ''.join('<%s:%s>' % pair for pair in self.kwargs.items()),
         ))
+        self._path_basename = None
+        self._md5 = None
+        self._blake2b = None
+
+    def __reduce__(self):
+        return (ResourceURL, (self.str,))
+
+    @property
+    def path_basename(self):
+        # In case something else should drive the basename of paths built from
+        # this URL, e.g., in the case of a resource within a git repo
+        if self._path_basename is None:
+            self._path_basename = self.get_basename(self)
+        return self._path_basename
+
+    @property
+    def md5(self):
+        if self._md5 is None:
+            data = self._normalized.encode('utf-8')
+            self._md5 = hashlib.md5(data).hexdigest()
+        return self._md5
+
+    @property
+    def blake2b(self):
+        '''
+        Alternative to md5 for cache paths (see PATH_GROUPING), with the same
+        length hex digest
+        '''
+        if self._blake2b is None:
+            data = self._normalized.encode('utf-8')
+            self._blake2b = hashlib.blake2b(data, digest_size=16).hexdigest()
+        return self._blake2b
+
+    def __str__(self):
+        return self._normalized
 
     def __repr__(self):
         return '%s(%s)' % (type(self).__name__, repr(str(self)))
@@ -103,9 +160,13 @@ class BytesResourceURL(ResourceURL):
     Used by Foreign Bytes Resource, when resource data is in memory but has no
     particular foreign URL
     '''
+    __slots__ = ('data_md5',)
 
-    def __init__(self, data, extension, basename):
+    def __new__(cls, data, extension, basename):
         ext = '.%s' % extension if extension else ''
-        self.data_md5 = hashlib.md5(data).hexdigest()
-        virtual_path = 'file://%s/%s%s' % (self.data_md5, basename, ext)
-        super().__init__(virtual_path)
+        data_md5 = hashlib.md5(data).hexdigest()
+        virtual_path = 'file://%s/%s%s' % (data_md5, basename, ext)
+        resource_url = object.__new__(cls)
+        resource_url._setup(virtual_path)
+        resource_url.data_md5 = data_md5
+        return resource_url
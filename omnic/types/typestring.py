@@ -3,6 +3,40 @@ TypeString is a core class that extends mimetypes
 '''
 import mimetypes
 
+# Maximum number of distinct TypeStrings to keep interned
+INTERN_CACHE_SIZE = 4096
+
+
+def _build_tables():
+    '''
+    Precompute the mimetype of every known extension, and the extension of
+    every known mimetype, such that constructing TypeStrings does not need
+    to consult mimetypes
+    '''
+    mimetypes.init()
+    mimetype_by_extension = {}
+    extension_by_mimetype = {}
+    for ext, mimetype in mimetypes.types_map.items():
+        extension = ext.strip('.').upper()
+        if extension not in mimetype_by_extension:
+            mimetype_by_extension[extension] = _guess_mimetype(extension)
+        if mimetype not in extension_by_mimetype:
+            extension_by_mimetype[mimetype] = _guess_extension(mimetype)
+    return mimetype_by_extension, extension_by_mimetype
+
+
+def _guess_mimetype(extension):
+    mimetype, _ = mimetypes.guess_type('fn.%s' % extension)  # discard encoding
+    return mimetype
+
+
+def _guess_extension(mimetype):
+    ext = mimetypes.guess_extension(mimetype)
+    return ext.strip('.').upper() if ext else None
+
+
+MIMETYPE_BY_EXTENSION, EXTENSION_BY_MIMETYPE = _build_tables()
+
 
 class TypeString:
     '''
@@ -14,36 +48,89 @@ class TypeString:
     A typestring can also include arguments to be even more specific, that
     might signify the process by which a file of that type might be derived
     (example: thumb dimensions).
+
+    TypeStrings are interned, so constructing the same typestring again
+    returns the same (hashable) instance.
     '''
+    __slots__ = (
+        'str',
+        'ts_format',
+        'arguments',
+        'is_qualifier',
+        'mimetype',
+        'extension',
+        '_key',
+        '_hash',
+    )
+    _interned = {}
 
-    def __init__(self, s):
-        self.str = s
+    def __new__(cls, s):
+        try:
+            return cls._interned[s]
+        except KeyError:
+            pass
+        typestring = super().__new__(cls)
+        typestring._setup(s)
+        if len(cls._interned) >= INTERN_CACHE_SIZE:
+            # Forget the oldest typestring, the rest are likely to be reused
+            del cls._interned[next(iter(cls._interned))]
+        cls._interned[s] = typestring
+        return typestring
 
+    def _setup(self, s):
         # Extract arguments (anything that follows ':')
         if ':' in s:
-            self.ts_format, _, arguments_str = s.partition(':')
-            self.arguments = tuple(arguments_str.split(','))
+            ts_format, _, arguments_str = s.partition(':')
+            arguments = tuple(arguments_str.split(','))
         else:
-            self.ts_format = s
-            self.arguments = tuple()
+            ts_format = s
+            arguments = tuple()
 
         # Check if is mimetype, extension or qualifier
-        self.is_qualifier = False
-        self.mimetype = None
-        self.extension = None
-        if '/' in self.ts_format:
-            self.mimetype = self.ts_format
-            ext = mimetypes.guess_extension(self.mimetype)
-            if ext:
-                self.extension = ext.strip('.').upper()
-        elif self.ts_format.isupper():
-            self.extension = self.ts_format
-            fn = 'fn.%s' % self.extension
-            self.mimetype, _ = mimetypes.guess_type(fn)  # discard encoding
+        is_qualifier = False
+        mimetype = None
+        extension = None
+        if '/' in ts_format:
+            mimetype = ts_format
+            try:
+                extension = EXTENSION_BY_MIMETYPE[mimetype]
+            except KeyError:
+                extension = _guess_extension(mimetype)
+        elif ts_format.isupper():
+            extension = ts_format
+            try:
+                mimetype = MIMETYPE_BY_EXTENSION[extension]
+            except KeyError:
+                mimetype = _guess_mimetype(extension)
         else:
             # Is qualifier (e.g. 'custom made-up type'), can't determine
             # mimetype OR extension
-            self.is_qualifier = True
+            is_qualifier = True
+
+        # Qualifiers are only equal to the same qualifier
+        key = (
+            is_qualifier,
+            mimetype,
+            extension,
+            arguments,
+            ts_format if is_qualifier else None,
+        )
+
+        setattr_ = object.__setattr__
+        setattr_(self, 'str', s)
+        setattr_(self, 'ts_format', ts_format)
+        setattr_(self, 'arguments', arguments)
+        setattr_(self, 'is_qualifier', is_qualifier)
+        setattr_(self, 'mimetype', mimetype)
+        setattr_(self, 'extension', extension)
+        setattr_(self, '_key', key)
+        setattr_(self, '_hash', hash(key))
+
+    def __setattr__(self, key, value):
+        raise AttributeError('TypeString is immutable')
+
+    def __reduce__(self):
+        return (TypeString, (self.str,))
 
     def modify_basename(self, basename):
         if self.extension:
@@ -58,16 +145,20 @@ class TypeString:
     def __str__(self):
         return self.str
 
+    def __hash__(self):
+        return self._hash
+
     def __eq__(self, other):
-        return all((
-            self.is_qualifier == other.is_qualifier,
-            self.mimetype == other.mimetype,
-            self.extension == other.extension,
-            self.arguments == other.arguments,
-        ))
+        if self is other:
+            return True
+        if isinstance(other, TypeString):
+            return self._key == other._key
+        return NotImplemented
 
     def __ne__(self, other):
-        return not self == other
+        if isinstance(other, TypeString):
+            return not self.__eq__(other)
+        return NotImplemented
 
     def __repr__(self):
         return "TypeString(%s)" % repr(str(self))
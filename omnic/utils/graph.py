@@ -1,6 +1,14 @@
-import functools
+import heapq
+import itertools
 import math
 
+from omnic.utils.lru import LRUCache
+
+# Maximum number of (start, end) shortest path queries to remember, per graph
+SHORTEST_PATH_CACHE_SIZE = 4096
+
+_MISSING = object()
+
 
 class NoPath(ValueError):
     pass
@@ -8,8 +16,10 @@ class NoPath(ValueError):
 
 class DirectedGraph:
     '''
-    Simple weighted directed graph implementation with memoized naive algorithm
-    for shortest path.
+    Simple weighted directed graph implementation, using Dijkstra's algorithm
+    to find shortest paths on demand. Results of each (start, end) query are
+    memoized in a bounded cache of each graph, which is cleared whenever the
+    graph changes.
 
     It also supports magically preferred paths, which "supersede" all other
     paths, and can include nodes and edges not previously mentioned.
@@ -20,6 +30,8 @@ class DirectedGraph:
     def __init__(self):
         self.edges = {}
         self.preferred_paths = {}
+        self.routes = {}
+        self.shortest_paths = LRUCache(SHORTEST_PATH_CACHE_SIZE)
 
     def add_preferred_path(self, *nodes, cost=1):
         if len(nodes) < 2:
@@ -39,44 +51,92 @@ class DirectedGraph:
         self._clear_cache()
 
     def _clear_cache(self):
-        self.get_all_paths_from.cache_clear()
-        self.get_shortest_paths.cache_clear()
+        self.shortest_paths.clear()
+        self.routes = {}
 
-    @functools.lru_cache(maxsize=None)
-    def get_all_paths_from(self, start, seen=None):
+    def set_routes(self, routes):
         '''
-        Return a list of all paths to all nodes from a given start node
+        Use the given precomputed dict of (weight, path) tuples keyed by
+        (start, end) for shortest path queries, until the graph changes.
+        '''
+        self.routes = dict(routes)
+
+    def _dijkstra(self, start, end=None):
         '''
-        if seen is None:
-            seen = frozenset()
-        results = [(0, (start, ))]
-        if start in seen or start not in self.edges:
-            return results
-        seen = seen | frozenset((start,))
-        for node, edge_weight in self.edges[start].items():
-            for subpath_weight, subpath in self.get_all_paths_from(node, seen):
-                total_weight = edge_weight + subpath_weight
-                full_path = (start, ) + subpath
-                results.append((total_weight, full_path))
-        return tuple(results)
-
-    @functools.lru_cache(maxsize=None)
+        Run Dijkstra's algorithm from the given start node, returning a dict
+        of (weight, path) tuples keyed by each reached node. If an end node is
+        given, stop as soon as its shortest path is known.
+        '''
+        # Counter breaks ties in insertion order, keeping results
+        # deterministic and never comparing nodes themselves
+        counter = itertools.count()
+        best_weights = {start: 0}
+        previous = {}
+        results = {}
+        queue = [(0, next(counter), start)]
+        while queue:
+            weight, _, node = heapq.heappop(queue)
+            if node in results:
+                continue  # Already found a shorter route to this node
+
+            # Walk back through previous nodes to build up the path
+            path = [node]
+            while path[-1] in previous:
+                path.append(previous[path[-1]])
+            results[node] = (weight, tuple(reversed(path)))
+            if node == end:
+                break
+
+            for neighbor, edge_weight in self.edges.get(node, {}).items():
+                total_weight = weight + edge_weight
+                if total_weight < best_weights.get(neighbor, math.inf):
+                    best_weights[neighbor] = total_weight
+                    previous[neighbor] = node
+                    heapq.heappush(queue, (total_weight, next(counter),
+                                           neighbor))
+        return results
+
+    def _find_shortest_path(self, start, end):
+        '''
+        Return a (weight, path) tuple of the shortest path from start to end,
+        or None if no such path exists
+        '''
+        result = self.shortest_paths.get((start, end), _MISSING)
+        if result is _MISSING:
+            result = None
+            if start != end:  # Skip over self paths
+                result = self._dijkstra(start, end).get(end)
+            self.shortest_paths[(start, end)] = result
+        return result
+
+    def get_reachable_from(self, start):
+        '''
+        Return a frozenset of all nodes reachable from the given start node,
+        including the start node itself
+        '''
+        seen = set([start])
+        stack = [start]
+        while stack:
+            for node in self.edges.get(stack.pop(), {}):
+                if node not in seen:
+                    seen.add(node)
+                    stack.append(node)
+        return frozenset(seen)
+
     def get_shortest_paths(self):
         '''
-        Return a dictionary containing lists of all possible paths within the
-        graph, keyed by tuple of start and end
+        Return a dictionary containing all shortest paths within the graph,
+        keyed by tuple of start and end.
+
+        Expensive on large graphs, as it runs a full search from every node:
+        prefer shortest_path for single queries.
         '''
         shortest_paths = {}
         for start in self.edges:
-            paths_from_start = self.get_all_paths_from(start)
-            for weight, path in paths_from_start:
-                end = path[-1]
+            for end, weight_path in self._dijkstra(start).items():
                 if start == end:
                     continue  # Skip over self paths
-                shortest, _ = shortest_paths.get(
-                    (start, end), (math.inf, None))
-                if weight < shortest:
-                    shortest_paths[(start, end)] = (weight, path)
+                shortest_paths[(start, end)] = weight_path
 
         # Overlay preferred paths
         shortest_paths.update(self.preferred_paths)
@@ -89,8 +149,14 @@ class DirectedGraph:
 
         Raise DirectedGraph.NoPath error if no such path exists.
         '''
-        shortest_paths = self.get_shortest_paths()
-        try:
-            return shortest_paths[(start, end)][1]  # 1 is path
-        except KeyError:
+        # Preferred paths supersede everything else
+        preferred = self.preferred_paths.get((start, end))
+        if preferred is not None:
+            return preferred[1]  # 1 is path
+
+        result = self.routes.get((start, end))
+        if result is None:
+            result = self._find_shortest_path(start, end)
+        if result is None:
             raise self.NoPath("%s -> %s" % (start, end))
+        return result[1]  # 1 is path
@@ -0,0 +1,28 @@
+from collections import OrderedDict
+
+
+class LRUCache(OrderedDict):
+    '''
+    Simple dict-like container that remembers up to maxsize items, discarding
+    the least recently used items first.
+    '''
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError('LRUCache requires a positive maxsize')
+        self.maxsize = maxsize
+        super().__init__()
+
+    def get(self, key, default=None):
+        try:
+            value = super().__getitem__(key)
+        except KeyError:
+            return default
+        self.move_to_end(key)
+        return value
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.move_to_end(key)
+        while len(self) > self.maxsize:
+            self.popitem(last=False)
@@ -17,11 +17,10 @@ class EventLoopManager:
             raise ValueError('Unknown EVENT_LOOP')
 
     def reconfigure(self):
-        # Set up loop + queue
+        # Set up loop (workers each have their own queue)
         event_loop_lib = self.get_event_loop_lib()
         self.loop = event_loop_lib.new_event_loop()
         asyncio.set_event_loop(self.loop)
-        self.worker_queue = asyncio.Queue(loop=self.loop)
 
     def run(self, *coros):
         self.loop.run_until_complete(asyncio.gather(*coros))
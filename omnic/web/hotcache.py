@@ -0,0 +1,118 @@
+'''
+In-memory tier in front of the cache, such that small and frequently served
+conversion results (e.g. thumbnails) are served without any disk I/O.
+'''
+import os
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+from omnic import singletons
+
+# Seconds after which a cached item is checked to still exist on disk, e.g.
+# in case it was cleared by another process
+REVALIDATE_INTERVAL = 60
+
+# Contents of a cached resource, and the modification time of its file
+HotItem = namedtuple('HotItem', ['data', 'mtime_ns'])
+
+
+class HotCache:
+    '''
+    Singleton that keeps the contents of recently served or produced typed
+    resources in memory, discarding the least recently used ones first once
+    they exceed HOT_CACHE_MAX_BYTES in total.
+
+    It is shared with the cache janitor's thread, hence locked.
+    '''
+
+    def __init__(self):
+        self.items = OrderedDict()  # resource -> (HotItem, last checked)
+        self.size = 0
+        self.lock = threading.Lock()
+
+    def get(self, resource):
+        '''
+        Return the cached contents of the given resource, or None
+        '''
+        item = self.get_item(resource)
+        return None if item is None else item.data
+
+    def get_item(self, resource):
+        '''
+        Return the cached contents of the given resource along with the
+        modification time of its file as a HotItem, or None
+        '''
+        with self.lock:
+            entry = self.items.get(resource)
+            if entry is None:
+                return None
+            self.items.move_to_end(resource)
+        item, checked_at = entry
+        now = time.monotonic()
+        if now - checked_at > REVALIDATE_INTERVAL:
+            if not os.path.exists(resource.cache_path):
+                self.invalidate(resource)
+                return None
+            with self.lock:
+                if resource in self.items:
+                    self.items[resource] = (item, now)
+        return item
+
+    def admit(self, resource):
+        '''
+        Read the given resource from disk into memory if it is a small
+        enough file, returning its contents, or None if it is not
+        '''
+        settings = singletons.settings
+        max_bytes = settings.HOT_CACHE_MAX_BYTES
+        max_item_size = settings.HOT_CACHE_MAX_ITEM_SIZE
+        if not max_bytes:
+            return None
+        try:
+            with open(resource.cache_path, 'rb') as fd:
+                stat = os.fstat(fd.fileno())
+                if stat.st_size > max_item_size:
+                    return None
+                data = fd.read()
+        except OSError:
+            return None  # Not cached, or a directory
+
+        item = HotItem(data, stat.st_mtime_ns)
+        with self.lock:
+            self._remove(resource)
+            self.items[resource] = (item, time.monotonic())
+            self.size += len(data)
+            while self.size > max_bytes:
+                _, (evicted_item, _) = self.items.popitem(last=False)
+                self.size -= len(evicted_item.data)
+        return data
+
+    def _remove(self, resource):
+        entry = self.items.pop(resource, None)
+        if entry is not None:
+            self.size -= len(entry[0].data)
+
+    def invalidate(self, resource):
+        with self.lock:
+            self._remove(resource)
+
+    def invalidate_path(self, path):
+        '''
+        Forget every cached resource with a cache path in the given directory
+        (e.g. when it is cleared or evicted)
+        '''
+        prefix = os.path.join(path, '')
+        with self.lock:
+            for resource in list(self.items):
+                cache_path = resource.cache_path
+                if cache_path == path or cache_path.startswith(prefix):
+                    self._remove(resource)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+            self.size = 0
+
+
+singletons.register('hot_cache', HotCache)
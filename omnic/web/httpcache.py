@@ -0,0 +1,204 @@
+'''
+HTTP caching of media responses, such that browsers and CDNs can keep them:
+validators (ETag and Last-Modified), conditional requests answered with 304
+Not Modified, and Cache-Control headers (see CACHE_CONTROL). Large files are
+streamed, or left to a proxy to send (see SENDFILE_HEADER), and byte-range
+requests are supported.
+'''
+import email.utils
+import os
+import re
+
+from omnic import singletons
+from omnic.web import ranges
+
+# URLs with these schemes, pinned to a commit SHA, always refer to the same
+# contents
+GIT_SCHEMES = {'git', 'git+https', 'git+http'}
+SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+
+def is_immutable(resource_url):
+    '''
+    Check if the given resource URL always refers to the same contents, i.e.
+    is a git URL pinned to a commit SHA
+    '''
+    if resource_url.parsed.scheme not in GIT_SCHEMES:
+        return False
+    return any(SHA_RE.match(arg) for arg in resource_url.args)
+
+
+def get_cache_control(resource):
+    '''
+    Return the Cache-Control header for serving the given typed resource, or
+    None if there should be none
+    '''
+    settings = singletons.settings
+    if is_immutable(resource.url):
+        return settings.CACHE_CONTROL_IMMUTABLE
+    cache_control = settings.CACHE_CONTROL or {}
+    typestring = resource.typestring
+    for key in (str(typestring), typestring.ts_format, '*'):
+        if key in cache_control:
+            return cache_control[key]
+    return None
+
+
+def get_uncached_headers():
+    '''
+    Return headers for responses that stand in for a resource that is not
+    ready yet, e.g. placeholders
+    '''
+    cache_control = singletons.settings.CACHE_CONTROL_PLACEHOLDER
+    return {'Cache-Control': cache_control} if cache_control else {}
+
+
+def get_etag(mtime_ns, size):
+    # Caches are never modified in place, only replaced (see
+    # Resource.cache_write), so their modification time and size identify
+    # their contents
+    return '"%x-%x"' % (mtime_ns, size)
+
+
+def format_http_date(timestamp):
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def parse_http_date(value):
+    '''
+    Return the timestamp of the given HTTP date, or None if it is invalid
+    '''
+    parsed = email.utils.parsedate_tz(value)
+    if parsed is None:
+        return None
+    try:
+        return email.utils.mktime_tz(parsed)
+    except (OverflowError, ValueError):
+        return None
+
+
+def get_headers(resource, mtime_ns, size):
+    '''
+    Return the caching headers for serving the given typed resource, cached
+    with the given modification time and size
+    '''
+    headers = {
+        'ETag': get_etag(mtime_ns, size),
+        'Last-Modified': format_http_date(mtime_ns // 10 ** 9),
+        'Accept-Ranges': 'bytes',
+    }
+    cache_control = get_cache_control(resource)
+    if cache_control:
+        headers['Cache-Control'] = cache_control
+    return headers
+
+
+def is_not_modified(request_headers, etag, mtime):
+    '''
+    Check if a request with the given headers is conditional, and its
+    cached copy is still fresh given the ETag and modification timestamp of
+    what would be served
+    '''
+    if not request_headers:
+        return False
+    if_none_match = request_headers.get('If-None-Match')
+    if if_none_match is not None:
+        # Takes precedence over If-Modified-Since, and uses weak comparison
+        etags = [value.strip() for value in if_none_match.split(',')]
+        return '*' in etags or etag in etags or 'W/' + etag in etags
+    if_modified_since = request_headers.get('If-Modified-Since')
+    if if_modified_since is not None:
+        since = parse_http_date(if_modified_since)
+        return since is not None and int(mtime) <= since
+    return False
+
+
+def get_sendfile_path(path):
+    '''
+    Return the path or URI that the proxy in front (see SENDFILE_HEADER)
+    knows the given cache path by
+    '''
+    settings = singletons.settings
+    if settings.SENDFILE_PREFIX is None:
+        return os.path.abspath(path)
+    relpath = os.path.relpath(path, settings.PATH_PREFIX)
+    return '%s/%s' % (settings.SENDFILE_PREFIX.rstrip('/'),
+                      relpath.replace(os.sep, '/'))
+
+
+def _range_response(request_headers, resource, content_type, hot_item,
+                    size, headers):
+    response = singletons.server.response
+    settings = singletons.settings
+    range_header = request_headers.get('Range')
+    if not ranges.is_range_fresh(
+            request_headers, headers['ETag'], headers['Last-Modified']):
+        return None
+    try:
+        byte_ranges = ranges.parse_range(range_header, size)
+    except ranges.RangeNotSatisfiable:
+        headers['Content-Range'] = 'bytes */%i' % size
+        return response.raw(b'', status=416, headers=headers)
+    if byte_ranges is None:
+        return None
+
+    if hot_item is not None:
+        def iter_range(start, end):
+            yield hot_item.data[start:end]
+    else:
+        def iter_range(start, end):
+            return ranges.iter_file_range(
+                resource.cache_path, start, end,
+                settings.FILE_STREAM_CHUNK_SIZE)
+    return ranges.partial_response(
+        response, byte_ranges, size, content_type, headers, iter_range,
+        settings.FILE_STREAM_THRESHOLD)
+
+
+async def cached_response(request_headers, resource, content_type,
+                          hot_item=None):
+    '''
+    Respond with the cache of the given typed resource, either from memory
+    if given its HotItem (see HotCache), or its file. Conditional requests
+    for an unchanged cache get 304 Not Modified, and range requests 206
+    Partial Content.
+    '''
+    response = singletons.server.response
+    settings = singletons.settings
+    if hot_item is None:
+        stat = os.stat(resource.cache_path)
+        mtime_ns = stat.st_mtime_ns
+        size = stat.st_size
+    else:
+        mtime_ns = hot_item.mtime_ns
+        size = len(hot_item.data)
+
+    headers = get_headers(resource, mtime_ns, size)
+    if is_not_modified(request_headers, headers['ETag'], mtime_ns // 10 ** 9):
+        return response.raw(b'', status=304, headers=headers)
+
+    if request_headers and request_headers.get('Range'):
+        partial = _range_response(
+            request_headers, resource, content_type, hot_item, size, headers)
+        if partial is not None:
+            return partial
+
+    if hot_item is not None:
+        return response.raw(hot_item.data, headers=headers,
+                            content_type=content_type)
+
+    # Leave sending the file to the proxy in front, if it can
+    if settings.SENDFILE_HEADER:
+        headers[settings.SENDFILE_HEADER] = \
+            get_sendfile_path(resource.cache_path)
+        return response.raw(b'', headers=headers, content_type=content_type)
+
+    # Stream large files, instead of reading them into memory whole
+    if size > settings.FILE_STREAM_THRESHOLD:
+        chunks = ranges.iter_file_range(
+            resource.cache_path, 0, size, settings.FILE_STREAM_CHUNK_SIZE)
+        return ranges.stream_chunks(
+            response, chunks, headers=headers, content_type=content_type)
+
+    headers['Content-Type'] = content_type
+    return await response.file(resource.cache_path, headers=headers)
@@ -0,0 +1,167 @@
+'''
+Byte-range requests (Range and If-Range headers), answered with 206 Partial
+Content for one range, or a multipart/byteranges body for several.
+'''
+import asyncio
+import inspect
+import re
+import uuid
+
+# Requests for more ranges than this (e.g. abusively many) are answered with
+# the whole resource instead
+MAX_RANGES = 16
+
+RANGE_SPEC_RE = re.compile(r'^(\d*)-(\d*)$')
+
+
+class RangeNotSatisfiable(ValueError):
+    pass
+
+
+def parse_range(value, size):
+    '''
+    Return the list of (start, end) byte offsets, end exclusive, requested
+    by the given Range header for a resource of the given size, or None if
+    the header is to be ignored (e.g. invalid). Raises RangeNotSatisfiable
+    if none of the ranges overlap the resource.
+    '''
+    unit, _, specs = value.partition('=')
+    if unit.strip().lower() != 'bytes':
+        return None
+    ranges = []
+    for spec in specs.split(','):
+        match = RANGE_SPEC_RE.match(spec.strip())
+        if not match or match.groups() == ('', ''):
+            return None
+        first, last = match.groups()
+        if not first:
+            # Suffix range, i.e. the last given number of bytes
+            length = int(last)
+            if length > 0 and size > 0:
+                ranges.append((max(size - length, 0), size))
+            continue
+        start = int(first)
+        if last and int(last) < start:
+            return None
+        end = int(last) + 1 if last else size
+        if start < size:
+            ranges.append((start, min(end, size)))
+    if not ranges:
+        raise RangeNotSatisfiable(value)
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def is_range_fresh(request_headers, etag, last_modified):
+    '''
+    Check if the Range of a request with the given headers applies, given
+    the ETag and Last-Modified header of what would be served, i.e. that its
+    If-Range (if any) matches them. Otherwise, the whole resource is served.
+    '''
+    if_range = request_headers.get('If-Range')
+    if if_range is None:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', 'W/')):
+        return if_range == etag  # Strong comparison, so weak never matches
+    return if_range == last_modified
+
+
+def get_content_range(start, end, size):
+    return 'bytes %i-%i/%i' % (start, end - 1, size)
+
+
+def iter_file_range(path, start, end, chunk_size):
+    '''
+    Yield the given range of bytes of the given file, in chunks
+    '''
+    with open(path, 'rb') as fd:
+        fd.seek(start)
+        remaining = end - start
+        while remaining > 0:
+            chunk = fd.read(min(chunk_size, remaining))
+            if not chunk:
+                break  # Truncated meanwhile
+            remaining -= len(chunk)
+            yield chunk
+
+
+def iter_multipart(ranges, size, content_type, boundary, iter_range):
+    '''
+    Yield a multipart/byteranges body of the given ranges, the bytes of
+    which are yielded by the given iter_range function
+    '''
+    for start, end in ranges:
+        yield (
+            '--%s\r\n'
+            'Content-Type: %s\r\n'
+            'Content-Range: %s\r\n'
+            '\r\n' % (boundary, content_type,
+                      get_content_range(start, end, size))
+        ).encode('latin-1')
+        yield from iter_range(start, end)
+        yield b'\r\n'
+    yield ('--%s--\r\n' % boundary).encode('latin-1')
+
+
+async def write_chunk(streaming_response, chunk):
+    '''
+    Write the given chunk to the given streaming response, waiting until the
+    client has taken in what was written so far (if the server can tell) or
+    at least letting other tasks run
+    '''
+    result = streaming_response.write(chunk)
+    if inspect.isawaitable(result):
+        await result  # Waits on the client by itself
+        return
+    protocol = getattr(streaming_response, 'protocol', None)
+    drain = getattr(protocol, 'drain', None)
+    result = drain() if drain is not None else None
+    if inspect.isawaitable(result):
+        await result
+    else:
+        await asyncio.sleep(0)
+
+
+def stream_chunks(response, chunks, **kwargs):
+    '''
+    Return a streaming response (given the server's response module) that
+    writes the given iterable of chunks one at a time, reading each (e.g.
+    from a file) outside of the event loop
+    '''
+    async def streaming_fn(streaming_response):
+        loop = asyncio.get_event_loop()
+        iterator = iter(chunks)
+        while True:
+            chunk = await loop.run_in_executor(None, next, iterator, None)
+            if chunk is None:
+                break
+            await write_chunk(streaming_response, chunk)
+    return response.stream(streaming_fn, **kwargs)
+
+
+def partial_response(response, ranges, size, content_type, headers,
+                     iter_range, stream_threshold):
+    '''
+    Return a 206 Partial Content response (given the server's response
+    module) of the given ranges, the bytes of which are yielded by the given
+    iter_range function. Responses of more than stream_threshold bytes are
+    streamed.
+    '''
+    headers = dict(headers)
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers['Content-Range'] = get_content_range(start, end, size)
+        chunks = iter_range(start, end)
+    else:
+        boundary = uuid.uuid4().hex
+        chunks = iter_multipart(
+            ranges, size, content_type, boundary, iter_range)
+        content_type = 'multipart/byteranges; boundary=%s' % boundary
+    length = sum(end - start for start, end in ranges)
+    if length > stream_threshold:
+        return stream_chunks(response, chunks, status=206, headers=headers,
+                             content_type=content_type)
+    return response.raw(b''.join(chunks), status=206, headers=headers,
+                        content_type=content_type)
@@ -1,55 +1,227 @@
+import asyncio
+import collections
+from collections import namedtuple
 
 from omnic import singletons
 
-from .base import BaseWorker
+from .base import BaseWorker, TaskSkipped
+
+
+# Tasks as queued, with the sticky key they were routed by, their ID in the
+# task queue backend (if recorded), how many times they were retried and
+# the future to resolve once done (if any)
+QueuedTask = namedtuple('QueuedTask', [
+    'key',
+    'task_type',
+    'args',
+    'task_id',
+    'attempts',
+    'done',
+])
+
+
+class WorkerQueue:
+    '''
+    FIFO queue of the tasks of a single worker, each kept with the sticky key
+    it was routed by (e.g. its URL string), such that idle workers can steal
+    tasks without running tasks with the same key out of order
+    '''
+
+    def __init__(self):
+        self.items = collections.deque()
+        self.waiter = None
+
+    def qsize(self):
+        return len(self.items)
+
+    async def put(self, item):
+        self.put_nowait(item)
+
+    def put_nowait(self, item):
+        self.items.append(item)
+        self.wake()
+
+    async def get(self):
+        while not self.items:
+            await self.wait()
+        return self.items.popleft()
+
+    async def wait(self):
+        '''
+        Await the next put, or a call to wake
+        '''
+        self.waiter = asyncio.get_event_loop().create_future()
+        try:
+            await self.waiter
+        finally:
+            self.waiter = None
+
+    def wake(self):
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+    def take(self, running_key):
+        '''
+        Remove and return the oldest task that does not have to wait for the
+        one running with the given key, together with every later task with
+        the same key (in order)
+        '''
+        for item in self.items:
+            key = item[0]
+            if key is None or key != running_key:
+                break
+        else:
+            return []
+        if key is None:
+            self.items.remove(item)
+            return [item]
+        items = [item for item in self.items if item[0] == key]
+        self.items = collections.deque(
+            item for item in self.items if item[0] != key)
+        return items
 
 
 class AioWorker(BaseWorker):
     '''
-    Uses an asyncio Queue to enqueue tasks
+    Runs tasks from its own WorkerQueue in the event loop, stealing tasks
+    from the queues of busy workers when idle
     '''
 
     def __init__(self, queue=None):
         super().__init__()
         self.running = True
         if queue is None:
-            # If no specific queue was specified, use singleton one
-            queue = singletons.eventloop.worker_queue
+            queue = WorkerQueue()
         self.queue = queue
 
-        # Sets for locking to prevent race conditions
+        # Queued or running tasks by sticky key, and the running one
+        self.pending = collections.Counter()
+        self.busy = False
+        self.current = None
+        self.current_lock = None
+
+        # Sets for locking to prevent race conditions, holding what is
+        # running
         self.downloading_resources = set()
         self.converting_resources = set()
+        self.multiconverting_resources = set()
 
     async def queue_size(self):
         return self.queue.qsize()
 
-    async def enqueue(self, task_type, args):
-        await self.queue.put((task_type, args))
+    async def enqueue(self, task_type, args, key=None, done=None):
+        # Recorded by the task queue backend (if durable) until done
+        task_id = singletons.workers.task_queue.put(task_type, args, key)
+        self.accept([QueuedTask(key, task_type, args, task_id, 0, done)])
 
     async def get_next(self):
         '''
-        Await the next item on the queue
+        Await the next item on the queue, stealing from other workers when
+        there is none
         '''
-        task_type, args = await self.queue.get()
-        return task_type, args
+        while not self.queue.qsize():
+            if not self._steal():
+                await self.queue.wait()
+        self.current = QueuedTask(*await self.queue.get())
+        self.busy = True
+
+        # Let idle workers steal what is left meanwhile
+        if self.queue.qsize():
+            for worker in singletons.workers:
+                worker.wake()
+        return self.current.task_type, self.current.args
+
+    def task_done(self, error=None, skipped=False):
+        '''
+        Acknowledge the current task and resolve its future, or queue it
+        again if it failed and has retries left (see TASK_RETRIES). Its
+        lock is released either way, such that it runs again when queued
+        again (e.g. once its result was evicted).
+        '''
+        task, self.current = self.current, None
+        lock, self.current_lock = self.current_lock, None
+        self.busy = False
+        if lock is not None:
+            locked, lock_key = lock
+            locked.discard(lock_key)
+        if task is None:
+            return
+        self._release(task.key)
+
+        # Whoever awaits a skipped task cannot tell that it is done
+        if skipped:
+            error = TaskSkipped('Skipped, since already running')
+
+        task_queue = singletons.workers.task_queue
+        retries = singletons.settings.TASK_RETRIES
+        if error is not None and not skipped and task.attempts < retries:
+            if task.task_id is not None:
+                task_queue.retry(task.task_id)
+            self.accept([task._replace(attempts=task.attempts + 1)])
+            return
+
+        if task.task_id is not None:
+            task_queue.ack(task.task_id)
+        self._resolve(task.done, error)
+
+    @property
+    def current_key(self):
+        return self.current.key if self.current is not None else None
+
+    def _release(self, key):
+        if key is not None:
+            self.pending[key] -= 1
+            if self.pending[key] <= 0:
+                del self.pending[key]
+
+    def _steal(self):
+        # Only from workers busy with another task, since idle ones are
+        # about to get to their queue themselves
+        workers = [
+            worker for worker in singletons.workers
+            if worker is not self and worker.busy
+        ]
+        workers.sort(key=lambda worker: worker.queue.qsize(), reverse=True)
+        for worker in workers:
+            items = worker.give_away()
+            if items:
+                self.accept(items)
+                return True
+        return False
+
+    def holds(self, key):
+        return key in self.pending
+
+    def give_away(self):
+        items = self.queue.take(self.current_key)
+        for item in items:
+            self._release(item[0])
+        return items
+
+    def accept(self, items):
+        for item in items:
+            key = item[0]
+            if key is not None:
+                self.pending[key] += 1
+            self.queue.put_nowait(item)
+
+    def wake(self):
+        if not self.busy:
+            self.queue.wake()
 
     async def check_download(self, foreign_resource):
-        if foreign_resource in self.downloading_resources:
-            return False
-        self.downloading_resources.add(foreign_resource)
-        return True
+        return self._lock(self.downloading_resources, foreign_resource)
 
     async def check_convert(self, converter, in_r, out_r):
-        key = (in_r, out_r)
-        if key in self.converting_resources:
-            return False
-        self.converting_resources.add(key)
-        return True
+        return self._lock(self.converting_resources, (in_r, out_r))
 
     async def check_multiconvert(self, url_string, to_type):
-        key = (url_string, to_type)
-        if key in self.multiconverting_resources:
+        return self._lock(self.multiconverting_resources,
+                          (url_string, to_type))
+
+    def _lock(self, locked, key):
+        if key in locked:
             return False
-        self.converting_resources.add(key)
+        locked.add(key)
+        self.current_lock = (locked, key)
         return True
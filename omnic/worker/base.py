@@ -9,10 +9,19 @@ DOWNLOAD_TIMEOUT = 20
 DOWNLOAD_CHUNK_SIZE = 8124
 
 
+class TaskSkipped(RuntimeError):
+    '''
+    The outcome of a task that was skipped since an identical one is
+    running, i.e. it did not run itself
+    '''
+
+
 class BaseWorker:
     '''
     Worker base class
     '''
+    # Whether a task is running, i.e. queued tasks may be stolen
+    busy = False
 
     def __init__(self):
         self.stats_dequeued = 0
@@ -43,16 +52,19 @@ class BaseWorker:
             elif task_type == Task.DOWNLOAD:
                 if not await self.check_download(*args):
                     log.debug('Already downloading %s' % repr(args))
+                    self.task_done(skipped=True)
                     continue
 
             elif task_type == Task.CONVERT:
                 if not await self.check_convert(*args):
                     log.debug('Already converting %s' % repr(args))
+                    self.task_done(skipped=True)
                     continue
 
             elif task_type == Task.MULTICONVERT:
                 if not await self.check_multiconvert(*args):
                     log.debug('Already multiconverting %s' % repr(args))
+                    self.task_done(skipped=True)
                     continue
 
             # Queue it up and run it
@@ -63,6 +75,50 @@ class BaseWorker:
             except Exception as e:
                 self.stats_error += 1
                 log.exception('Error in task: "%s"' % repr(e))
+                self.task_done(e)
+            else:
+                self.task_done()
+
+    def task_done(self, error=None, skipped=False):
+        '''
+        Called once the current task is done, with the exception it raised
+        if it failed, or with skipped if it did not run
+        '''
+
+    def _resolve(self, done, error=None):
+        '''
+        Resolve the given future of a task (if any) with its outcome
+        '''
+        if done is None or done.done():
+            return
+        if error is None:
+            done.set_result(None)
+        else:
+            done.set_exception(error)
+
+    def holds(self, key):
+        '''
+        Check if tasks routed by the given sticky key are queued or running
+        '''
+        return False
+
+    def give_away(self):
+        '''
+        Remove and return queued (key, task type, args) tuples for an idle
+        worker to run instead
+        '''
+        return []
+
+    def accept(self, items):
+        '''
+        Queue (key, task type, args) tuples given away by another worker
+        '''
+        raise NotImplementedError()
+
+    def wake(self):
+        '''
+        Have this worker, if idle, check for tasks to steal
+        '''
 
     def _get_method(self, task_type):
         return {
@@ -85,13 +141,14 @@ class BaseWorker:
         '''
         Converts using the given converter
         '''
-        await converter.convert(in_resource, out_resource)
+        await tasks.convert(converter, in_resource, out_resource)
 
     async def run_multiconvert(self, url_string, to_type):
         '''
         Enqueues in succession all conversions steps necessary to take the
-        given URL and convert it to to_type, storing the result in the cache
+        given URL and convert it to to_type (or to each of a list of types),
+        storing the result in the cache
         '''
         async def enq_convert(*args):
-            await self.enqueue(Task.CONVERT, args)
+            await self.enqueue(Task.CONVERT, args, key=url_string)
         await tasks.multiconvert(url_string, to_type, enq_convert)
@@ -0,0 +1,95 @@
+'''
+Runs converters according to their execution class (see
+Converter.execution): inline on the event loop, or in a shared thread pool or
+process pool, such that CPU-bound converters do not block serving requests.
+'''
+import asyncio
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from omnic import singletons
+from omnic.conversion.converter import INLINE, PROCESS, THREAD
+
+
+class ConverterExecutor:
+    '''
+    Singleton that holds the shared pools that converters run in, and limits
+    how many conversions run at once by converter or execution class (see
+    CONVERTER_CONCURRENCY)
+    '''
+
+    def __init__(self):
+        self.pools = {}
+        self.semaphores = {}
+
+    def get_pool(self, execution):
+        '''
+        Return the shared pool for the given execution class, creating it
+        with the configured size if necessary
+        '''
+        pool = self.pools.get(execution)
+        if pool is None:
+            settings = singletons.settings
+            if execution == THREAD:
+                pool = ThreadPoolExecutor(settings.CONVERTER_THREADS)
+            elif execution == PROCESS:
+                pool = ProcessPoolExecutor(settings.CONVERTER_PROCESSES)
+            else:
+                raise ValueError('No pool for execution: %s' % execution)
+            self.pools[execution] = pool
+        return pool
+
+    def get_limit(self, converter):
+        '''
+        Return the key and maximum number of conversions of the given
+        converter to run at once, or (None, None) if unlimited
+        '''
+        limits = singletons.settings.CONVERTER_CONCURRENCY or {}
+        for key in (type(converter).__name__, get_execution(converter)):
+            if key in limits:
+                return key, limits[key]
+        return None, None
+
+    def get_semaphore(self, key, limit):
+        semaphore = self.semaphores.get((key, limit))
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(limit)
+            self.semaphores[(key, limit)] = semaphore
+        return semaphore
+
+    async def convert(self, converter, in_resource, out_resource):
+        '''
+        Convert in_resource to out_resource with the given converter, where
+        its execution class says, once within its concurrency limit
+        '''
+        key, limit = self.get_limit(converter)
+        if limit is None:
+            await self._convert(converter, in_resource, out_resource)
+            return
+        async with self.get_semaphore(key, limit):
+            await self._convert(converter, in_resource, out_resource)
+
+    async def _convert(self, converter, in_resource, out_resource):
+        execution = get_execution(converter)
+        if execution == INLINE:
+            await converter.convert(in_resource, out_resource)
+            return
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(
+            self.get_pool(execution),
+            converter.convert_sync, in_resource, out_resource)
+
+    def shutdown(self, wait=True):
+        '''
+        Shut down the pools, e.g. once their size was reconfigured
+        '''
+        for pool in self.pools.values():
+            pool.shutdown(wait=wait)
+        self.pools.clear()
+
+
+def get_execution(converter):
+    execution = getattr(converter, 'execution', INLINE)
+    return execution if execution in (THREAD, PROCESS) else INLINE
+
+
+singletons.register('converter_executor', ConverterExecutor)
@@ -0,0 +1,279 @@
+'''
+Keeps the cache within its configured size and free disk space watermarks, by
+evicting least recently used cached resources.
+'''
+import asyncio
+import logging
+import os
+import shutil
+import time
+from collections import namedtuple
+
+from omnic import singletons
+from omnic.types.content import CONTENT_PATH_DEPTH
+from omnic.types.resource import (ENTRY_LOCK_SUFFIX, LOCK_SUFFIX,
+                                  PARTIAL_PREFIX, CacheLock, ForeignResource,
+                                  get_lock_path)
+from omnic.utils.lru import LRUCache
+
+log = logging.getLogger()
+
+# Seconds between recording accesses to the same cache entry
+ACCESS_RESOLUTION = 60
+
+# Maximum number of cache entries to remember the last recorded access of
+ACCESS_CACHE_SIZE = 4096
+
+# Cache entries used more recently than this many seconds ago are never
+# evicted, since downloads or conversions for them may still be queued
+EVICTION_GRACE_PERIOD = 10 * 60
+
+CacheEntry = namedtuple('CacheEntry', ['path', 'size', 'last_used'])
+
+
+def get_entry_size_and_last_used(path):
+    '''
+    Return the total size of all files in the given cache entry, and the most
+    recent modification time of anything in it
+    '''
+    stat = os.lstat(path)
+    size = 0
+    last_used = stat.st_mtime
+    if not os.path.isdir(path) or os.path.islink(path):
+        return stat.st_size, last_used
+    for dirpath, dirnames, filenames in os.walk(path):
+        for name in dirnames + filenames:
+            try:
+                stat = os.lstat(os.path.join(dirpath, name))
+            except FileNotFoundError:
+                continue  # Removed while walking
+            if name in filenames:
+                size += stat.st_size
+            last_used = max(last_used, stat.st_mtime)
+    return size, last_used
+
+
+class CacheJanitor:
+    '''
+    Singleton that records accesses to cached resources, and evicts the least
+    recently used ones (i.e. a foreign resource together with everything
+    converted from it) when the cache grows too large or the disk too full.
+
+    Cache entries are the directories that hold all resources with the same
+    URL (see PATH_GROUPING) or contents (see CONTENT_ADDRESSED), and their
+    last use is the modification time of anything in them, which recording
+    an access updates.
+    '''
+
+    def __init__(self):
+        self.accessed = LRUCache(ACCESS_CACHE_SIZE)
+        self.stats_evicted = 0
+        self.stats_evicted_bytes = 0
+
+    def touch(self, resource):
+        '''
+        Record an access to the cache entry of the given resource, e.g. on a
+        cache hit, or when queueing its conversion
+        '''
+        path = resource.cache_entry_path()
+        now = time.monotonic()
+        last_touched = self.accessed.get(path)
+        if last_touched is not None and now - last_touched < ACCESS_RESOLUTION:
+            return
+        self.accessed[path] = now
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return  # Not cached (anymore)
+        index = resource.cache_index()
+        if index is not None:
+            index.touch(resource)
+
+        # Also record accesses to what it links to in content storage
+        if singletons.settings.CONTENT_ADDRESSED:
+            content_path = os.path.realpath(resource.cache_path)
+            if content_path != os.path.abspath(resource.cache_path):
+                try:
+                    os.utime(os.path.dirname(content_path))
+                except FileNotFoundError:
+                    pass
+
+    def is_enabled(self):
+        settings = singletons.settings
+        return (settings.CACHE_HIGH_WATERMARK is not None or
+                settings.CACHE_FREE_LOW_WATERMARK is not None)
+
+    def get_entry_depth(self):
+        '''
+        Return how many directories deep cache entries are within each cache
+        interfix directory. Without PATH_GROUPING, every file or directory in
+        them is an entry of its own.
+        '''
+        return len(ForeignResource('localhost/entry').path_grouping())
+
+    def get_entries(self):
+        '''
+        Return a list of all cache entries as CacheEntry tuples
+        '''
+        settings = singletons.settings
+        grouping_depth = self.get_entry_depth()
+        paths = []
+        for interfix, depth in (
+                (settings.RESOURCE_CACHE_INTERFIX, grouping_depth),
+                (settings.MUTABLE_RESOURCE_CACHE_INTERFIX, grouping_depth),
+                (settings.CONTENT_CACHE_INTERFIX, CONTENT_PATH_DEPTH)):
+            interfix_paths = [os.path.join(settings.PATH_PREFIX, interfix)]
+            for _ in range(depth):
+                interfix_paths = [
+                    entry.path
+                    for path in interfix_paths if os.path.isdir(path)
+                    for entry in os.scandir(path)
+                ]
+            paths.extend(interfix_paths)
+        entries = []
+        for path in paths:
+            name = os.path.basename(path)
+            if name.startswith(PARTIAL_PREFIX) or name.endswith(LOCK_SUFFIX):
+                continue  # Only found at this depth without PATH_GROUPING
+            try:
+                size, last_used = get_entry_size_and_last_used(path)
+            except FileNotFoundError:
+                continue  # Evicted or cleared meanwhile
+            entries.append(CacheEntry(path, size, last_used))
+        return entries
+
+    def get_free_bytes(self):
+        path = singletons.settings.PATH_PREFIX
+        try:
+            stat = os.statvfs(path)
+        except FileNotFoundError:
+            return None
+        return stat.f_bavail * stat.f_frsize
+
+    def _is_above_high_watermark(self, total_size, free_bytes):
+        settings = singletons.settings
+        high = settings.CACHE_HIGH_WATERMARK
+        free_low = settings.CACHE_FREE_LOW_WATERMARK
+        if high is not None and total_size > high:
+            return True
+        if free_low is not None and free_bytes is not None:
+            return free_bytes < free_low
+        return False
+
+    def _is_below_low_watermark(self, total_size, free_bytes):
+        settings = singletons.settings
+        low = settings.CACHE_LOW_WATERMARK
+        if low is None:
+            low = settings.CACHE_HIGH_WATERMARK
+        free_high = settings.CACHE_FREE_HIGH_WATERMARK
+        if free_high is None:
+            free_high = settings.CACHE_FREE_LOW_WATERMARK
+        if low is not None and total_size > low:
+            return False
+        if free_high is not None and free_bytes is not None:
+            return free_bytes >= free_high
+        return True
+
+    def evict(self, entry):
+        '''
+        Remove the given cache entry, unless anything in it is locked or
+        being written. Returns True if it was removed.
+        '''
+        # Writers hold the entry lock shared (see Resource.cache_write), so
+        # none can start writing to the entry until it is removed
+        entry_lock = CacheLock(get_lock_path(entry.path, ENTRY_LOCK_SUFFIX))
+        try:
+            if not entry_lock.try_acquire():
+                return False
+            evicted = self._evict_locked(entry)
+            if evicted:
+                entry_lock.remove()
+            return evicted
+        finally:
+            entry_lock.release()
+
+    def _evict_locked(self, entry):
+        is_dir = os.path.isdir(entry.path) and not os.path.islink(entry.path)
+        try:
+            names = os.listdir(entry.path) if is_dir else []
+        except FileNotFoundError:
+            return False  # Evicted or cleared meanwhile
+        if any(name.startswith(PARTIAL_PREFIX) for name in names):
+            return False
+
+        # Also hold every lock in the entry (or, without PATH_GROUPING, the
+        # lock next to it) while removing it
+        lock_paths = [
+            os.path.join(entry.path, name)
+            for name in names if name.endswith(LOCK_SUFFIX)
+        ]
+        lock_path = get_lock_path(entry.path)
+        if os.path.exists(lock_path):
+            lock_paths.append(lock_path)
+        locks = [CacheLock(path) for path in lock_paths]
+        try:
+            for lock in locks:
+                if not lock.try_acquire():
+                    return False
+            if is_dir:
+                shutil.rmtree(entry.path, ignore_errors=True)
+            else:
+                os.unlink(entry.path)
+            for lock in locks:
+                lock.remove()  # e.g. the lock next to it
+        finally:
+            for lock in locks:
+                lock.release()
+        self.accessed.pop(entry.path, None)
+        singletons.hot_cache.invalidate_path(entry.path)
+        if singletons.settings.CACHE_INDEX:
+            singletons.cache_index.remove_path(entry.path)
+        self.stats_evicted += 1
+        self.stats_evicted_bytes += entry.size
+        return True
+
+    def collect(self):
+        '''
+        If the cache is above its high watermarks, evict least recently used
+        cache entries until it is below its low watermarks. Returns the list
+        of evicted entries.
+        '''
+        entries = self.get_entries()
+        total_size = sum(entry.size for entry in entries)
+        free_bytes = self.get_free_bytes()
+        if not self._is_above_high_watermark(total_size, free_bytes):
+            return []
+
+        evicted = []
+        cutoff = time.time() - EVICTION_GRACE_PERIOD
+        for entry in sorted(entries, key=lambda entry: entry.last_used):
+            if self._is_below_low_watermark(total_size, free_bytes):
+                break
+            if entry.last_used > cutoff:
+                break  # All remaining entries are even more recently used
+            if not self.evict(entry):
+                continue
+            evicted.append(entry)
+            total_size -= entry.size
+            if free_bytes is not None:
+                free_bytes = self.get_free_bytes()
+        log.info('Evicted %i cached resources' % len(evicted))
+        return evicted
+
+    async def run(self):
+        '''
+        Periodically collect the cache in the background, if any watermarks
+        are configured
+        '''
+        if not self.is_enabled():
+            return
+        loop = asyncio.get_event_loop()
+        while True:
+            await asyncio.sleep(singletons.settings.CACHE_JANITOR_INTERVAL)
+            try:
+                await loop.run_in_executor(None, self.collect)
+            except Exception as e:
+                log.exception('Error in cache janitor: "%s"' % repr(e))
+
+
+singletons.register('cache_janitor', CacheJanitor)
@@ -0,0 +1,177 @@
+'''
+Jobs, which run the steps of a multi-step process (e.g. downloading a
+resource, detecting its type and converting it step by step) as a DAG: each
+step waits on the completion of the steps it depends on, such that steps
+never run before their inputs are ready, while independent steps may run
+in parallel on different workers.
+'''
+import asyncio
+
+from omnic import singletons
+from omnic.conversion.exceptions import ConversionInputError
+from omnic.conversion.failures import get_error_message
+from omnic.conversion.profiles import freeze_profiles
+from omnic.types.resource import ForeignResource
+from omnic.worker import tasks
+from omnic.worker.enums import Task
+
+
+class Job:
+    '''
+    DAG of steps, each an async function that runs (as an asyncio Task, its
+    completion future) once all the steps it depends on are done. Steps
+    depending on a step that failed are skipped (see skipped), failing with
+    the same error.
+    '''
+    # Identifies the job, e.g. such that it is not started twice at once
+    key = None
+
+    def __init__(self):
+        self.steps = []
+
+    def add(self, func, *args, after=()):
+        '''
+        Add a step running func with the given arguments after the given
+        steps, returning its completion future. Steps may be added while the
+        job is running (e.g. by steps planning further steps).
+        '''
+        step = asyncio.ensure_future(self._run_step(list(after), func, args))
+        self.steps.append(step)
+        return step
+
+    async def _run_step(self, after, func, args):
+        for predecessor in after:
+            try:
+                await predecessor
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.skipped(func, args, e)
+                raise
+        return await func(*args)
+
+    def skipped(self, func, args, error):
+        '''
+        Called with the function and arguments of each step that is not run,
+        since a step it depends on failed with the given error
+        '''
+
+    async def plan(self):
+        '''
+        Add the initial steps of the job
+        '''
+
+    async def run(self):
+        '''
+        Run all steps of the job, including those added while running,
+        raising the error of the first step that failed, if any
+        '''
+        await self.plan()
+        try:
+            while not all(step.done() for step in self.steps):
+                await asyncio.wait(self.steps)
+        except asyncio.CancelledError:
+            for step in self.steps:
+                step.cancel()
+            raise
+        errors = [
+            step.exception() for step in self.steps
+            if not step.cancelled() and step.exception() is not None
+        ]
+        if errors:
+            raise errors[0]
+
+
+class ConversionJob(Job):
+    '''
+    Job that downloads the given URL (unless already downloaded), detects
+    its type and converts it to the given type (or to each of a list of
+    types), with each conversion step waiting on the step producing its
+    input. Steps towards different types run in parallel.
+
+    All steps are routed to the worker picked for the URL, while each
+    conversion step is keyed by its output, such that idle workers may steal
+    independent steps (since workers never steal tasks with the same key as
+    the one they run) to run them in parallel.
+
+    Whatever step fails, the failure is recorded in the negative cache for
+    each type it was to be converted to, such that requests for them are
+    answered with an error right away.
+    '''
+
+    def __init__(self, url_string, to_type, custom_profiles=None):
+        super().__init__()
+        if not isinstance(to_type, str):
+            to_type = tuple(to_type)  # Ensure hashable
+        self.url_string = url_string
+        self.to_type = to_type
+        self.custom_profiles = custom_profiles
+        self.key = (url_string, to_type,
+                    freeze_profiles(custom_profiles or {}))
+
+    def get_targets(self):
+        if isinstance(self.to_type, str):
+            return [self.to_type]
+        return list(self.to_type)
+
+    async def run(self):
+        try:
+            await super().run()
+        except Exception as e:
+            self.record_failure(e)
+            raise
+
+    def record_failure(self, error):
+        '''
+        Record that converting to each target type failed with the given
+        error, unless recorded already (e.g. by the step that failed)
+        '''
+        negative_cache = singletons.negative_cache
+        for target in self.get_targets():
+            if negative_cache.get(self.url_string, target) is None:
+                negative_cache.record(self.url_string, target, error)
+
+    async def plan(self):
+        foreign_res = ForeignResource(self.url_string)
+        after = []
+        if not await foreign_res.cache_ready():
+            after.append(self.add(
+                singletons.workers.async_run_task,
+                Task.DOWNLOAD, (foreign_res,), self.url_string,
+            ))
+        self.add(self.detect, after=after)
+
+    async def detect(self):
+        '''
+        Detect the type of the downloaded resource, and add a step for each
+        conversion necessary from it
+        '''
+        steps = tasks.plan_conversion(
+            self.url_string, self.to_type, self.custom_profiles)
+        produced = {}
+        for converter, in_resource, out_resource in steps:
+            predecessor = produced.get(str(in_resource.typestring))
+            produced[str(out_resource.typestring)] = self.add(
+                self.convert, converter, in_resource, out_resource,
+                after=[predecessor] if predecessor is not None else [],
+            )
+
+    async def convert(self, converter, in_resource, out_resource):
+        await singletons.workers.async_run_task(
+            Task.CONVERT, (converter, in_resource, out_resource),
+            out_resource.cache_path, sticky_key=self.url_string,
+        )
+
+    def skipped(self, func, args, error):
+        # Record conversions that did not run since their input failed, such
+        # that requests for them are answered with an error right away, as
+        # if they were run (see tasks.convert)
+        if func != self.convert:
+            return
+        converter, in_resource, out_resource = args
+        singletons.negative_cache.record(
+            out_resource.url_string, out_resource.typestring,
+            ConversionInputError('Input failed: %s' %
+                                 get_error_message(error)),
+            converter,
+        )
@@ -1,8 +1,12 @@
 import asyncio
+import logging
 
 from omnic import singletons
 
 from . import enums
+from .aioworker import QueuedTask
+
+log = logging.getLogger()
 
 
 class WorkerManager(list):
@@ -13,22 +17,58 @@ class WorkerManager(list):
     '''
 
     def __init__(self):
-        # By default setup a single worker
+        # Set up WORKERS workers, each with its own queue
         self.worker_class = singletons.settings.load('WORKER')
-        self.append(self.worker_class())
+        count = max(singletons.settings.WORKERS, 1)
+        self.extend(self.worker_class() for _ in range(count))
+
+        # Records queued tasks, possibly durably
+        self.task_queue = singletons.settings.load('TASK_QUEUE')()
+
+        # Futures of running jobs and of the tasks they wait on, by key
+        self.jobs = {}
+        self.running_tasks = {}
 
     def gather_run(self):
         '''
-        Gather all workers to be run in a loop.
+        Gather all workers to be run in a loop, first queueing again tasks
+        left over by processes that are gone (e.g. before a restart).
         '''
+        self.recover()
         return asyncio.gather(*[worker.run() for worker in self])
 
+    def recover(self):
+        '''
+        Queue tasks recovered from the task queue backend to the workers
+        '''
+        for record in self.task_queue.recover():
+            worker = self.pick_sticky(record.key)
+            worker.accept([QueuedTask(record.key, record.task_type,
+                                      record.args, record.id,
+                                      record.attempts, None)])
+
     def pick_sticky(self, hashable):
         '''
-        Choose a worker 'stickily' (keeping with the same)
+        Choose a worker 'stickily' (keeping with the same): the one that has
+        tasks for the given key queued or running (e.g. having stolen them),
+        or else always the same one for it
         '''
+        for worker in self:
+            if worker.holds(hashable):
+                return worker
         return self[hash(hashable) % len(self)]
 
+    async def _enqueue(self, worker, task_type, args, key=None, done=None):
+        if done is None:
+            await worker.enqueue(task_type, args, key=key)
+        else:
+            await worker.enqueue(task_type, args, key=key, done=done)
+
+        # Let idle workers steal it, if it has to wait for another task
+        if worker.busy:
+            for other in self:
+                other.wake()
+
     def enqueue_sync(self, func, *func_args):
         '''
         Enqueue an arbitrary synchronous function.
@@ -37,7 +77,7 @@ class WorkerManager(list):
         '''
         worker = self.pick_sticky(0)  # just pick first always
         args = (func,) + func_args
-        coro = worker.enqueue(enums.Task.FUNC, args)
+        coro = self._enqueue(worker, enums.Task.FUNC, args)
         asyncio.ensure_future(coro)
 
     async def async_enqueue_sync(self, func, *func_args):
@@ -46,7 +86,7 @@ class WorkerManager(list):
         '''
         worker = self.pick_sticky(0)  # just pick first always
         args = (func,) + func_args
-        await worker.enqueue(enums.Task.FUNC, args)
+        await self._enqueue(worker, enums.Task.FUNC, args)
 
     def enqueue_download(self, resource):
         '''
@@ -55,7 +95,8 @@ class WorkerManager(list):
         Deprecated: Use async version instead
         '''
         worker = self.pick_sticky(resource.url_string)
-        coro = worker.enqueue(enums.Task.DOWNLOAD, (resource,))
+        coro = self._enqueue(worker, enums.Task.DOWNLOAD, (resource,),
+                             key=resource.url_string)
         asyncio.ensure_future(coro)
 
     async def async_enqueue_download(self, resource):
@@ -63,7 +104,8 @@ class WorkerManager(list):
         Enqueue the download of the given foreign resource.
         '''
         worker = self.pick_sticky(resource.url_string)
-        await worker.enqueue(enums.Task.DOWNLOAD, (resource,))
+        await self._enqueue(worker, enums.Task.DOWNLOAD, (resource,),
+                            key=resource.url_string)
 
     def enqueue_convert(self, converter, from_resource, to_resource):
         '''
@@ -74,7 +116,8 @@ class WorkerManager(list):
         '''
         worker = self.pick_sticky(from_resource.url_string)
         args = (converter, from_resource, to_resource)
-        coro = worker.enqueue(enums.Task.CONVERT, args)
+        coro = self._enqueue(worker, enums.Task.CONVERT, args,
+                             key=from_resource.url_string)
         asyncio.ensure_future(coro)
 
     async def async_enqueue_convert(self, converter, from_, to):
@@ -84,16 +127,62 @@ class WorkerManager(list):
         '''
         worker = self.pick_sticky(from_.url_string)
         args = (converter, from_, to)
-        await worker.enqueue(enums.Task.CONVERT, args)
+        await self._enqueue(worker, enums.Task.CONVERT, args,
+                            key=from_.url_string)
 
     async def async_enqueue_multiconvert(self, url_string, to_type):
         '''
         Enqueue a multi-step conversion process, from the given URL string
-        (which is assumed to have been downloaded / resolved)
+        (which is assumed to have been downloaded / resolved). If to_type is
+        a list of target types, shared intermediate steps are run only once.
         '''
+        if not isinstance(to_type, str):
+            to_type = tuple(to_type)  # Ensure hashable
         worker = self.pick_sticky(url_string)
         args = (url_string, to_type)
-        await worker.enqueue(enums.Task.MULTICONVERT, args)
+        await self._enqueue(worker, enums.Task.MULTICONVERT, args,
+                            key=url_string)
+
+    async def async_run_task(self, task_type, args, key, sticky_key=None):
+        '''
+        Enqueue the given task with the given key to the worker picked for
+        sticky_key (by default, the key itself), and wait until a worker ran
+        it, raising its error if it failed. While it is queued or running,
+        tasks of the same type and key are not enqueued again, but waited on.
+        '''
+        future = self.running_tasks.get((task_type, key))
+        if future is None:
+            future = asyncio.get_event_loop().create_future()
+            self.running_tasks[(task_type, key)] = future
+            future.add_done_callback(
+                lambda _: self.running_tasks.pop((task_type, key), None))
+            worker = self.pick_sticky(key if sticky_key is None
+                                      else sticky_key)
+            await self._enqueue(worker, task_type, args, key=key,
+                                done=future)
+        await asyncio.shield(future)
+
+    def enqueue_job(self, job):
+        '''
+        Start running the given job (see omnic.worker.jobs) in the
+        background, unless the same job is running already, returning a
+        future for its completion
+        '''
+        future = self.jobs.get(job.key) if job.key is not None else None
+        if future is None:
+            future = asyncio.ensure_future(job.run())
+            future.add_done_callback(self._job_done)
+            if job.key is not None:
+                self.jobs[job.key] = future
+        return future
+
+    def _job_done(self, future):
+        for key, job_future in list(self.jobs.items()):
+            if job_future is future:
+                del self.jobs[key]
+        if not future.cancelled() and future.exception() is not None:
+            # Already logged by the worker that ran the failed task
+            log.debug('Job failed: %s' % repr(future.exception()))
 
 
 singletons.register('workers', WorkerManager)
@@ -1,14 +1,72 @@
+'''
+Runs subprocesses (e.g. converters and downloaders) without blocking the
+event loop, such that the server keeps serving while they run.
+'''
+import asyncio
 import subprocess
 
 from omnic import singletons
 
+# Seconds that a timed out or cancelled process gets to exit after being
+# terminated, before it is killed
+TERMINATE_GRACE_PERIOD = 5
+
 
 class SubprocessManager(list):
     '''
-    Singleton that handles running and awaiting subprocesses
+    Singleton that handles running and awaiting subprocesses, holding the
+    ones currently running
     '''
-    async def run(self, cmd, **kwargs):
-        return subprocess.run(cmd, **kwargs)
+
+    async def run(self, cmd, timeout=None, check=False, input=None,
+                  **kwargs):
+        '''
+        Run the given command asynchronously, returning a
+        subprocess.CompletedProcess like subprocess.run. The stdout and
+        stderr keyword arguments are either a file object to redirect them
+        to, or subprocess.PIPE to capture them. If the command runs longer
+        than the given timeout in seconds (by default, SUBPROCESS_TIMEOUT),
+        it is stopped and subprocess.TimeoutExpired raised.
+        '''
+        if timeout is None:
+            timeout = singletons.settings.SUBPROCESS_TIMEOUT
+        if input is not None:
+            kwargs['stdin'] = subprocess.PIPE
+        process = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+        self.append(process)
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(input), timeout)
+        except asyncio.TimeoutError:
+            await self.stop(process)
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            await self.stop(process)
+            raise
+        finally:
+            self.remove(process)
+
+        result = subprocess.CompletedProcess(
+            cmd, process.returncode, stdout, stderr)
+        if check:
+            result.check_returncode()
+        return result
+
+    async def stop(self, process):
+        '''
+        Terminate the given process, killing it if it does not exit in time
+        '''
+        try:
+            process.terminate()
+            try:
+                await asyncio.wait_for(
+                    process.wait(), TERMINATE_GRACE_PERIOD)
+                return
+            except asyncio.TimeoutError:
+                process.kill()
+        except ProcessLookupError:
+            pass  # Already exited
+        await process.wait()
 
 
 singletons.register('subprocess', SubprocessManager)
@@ -0,0 +1,316 @@
+'''
+Task queue backends (see TASK_QUEUE), which keep a record of every task
+queued to the workers until it is done, such that queued and running
+downloads and conversions survive restarts and crashes.
+
+Tasks are recorded in a serializable form: converters, functions and
+resource classes by import path, resources by URL and TypeString, and
+singletons by name. Tasks that cannot be recorded (e.g. with local
+resources) are only kept in memory.
+'''
+import importlib
+import json
+import logging
+import os
+import socket
+import sqlite3
+import time
+import types
+import uuid
+from collections import namedtuple
+
+from omnic import singletons
+from omnic.conversion.converter import Converter
+from omnic.types.resource import (ForeignResource, MutableResource,
+                                  TypedForeignResource, TypedResource)
+from omnic.types.typestring import TypeString
+from omnic.worker.enums import Task
+
+log = logging.getLogger()
+
+# Bump whenever the schema or serialization changes. Recorded tasks in an
+# older format are dropped.
+FORMAT_VERSION = 1
+
+# Resources that are fully identified by their class, URL and TypeString
+DURABLE_RESOURCES = {
+    ForeignResource,
+    MutableResource,
+    TypedForeignResource,
+    TypedResource,
+}
+
+# Distinguishes this process from an earlier one with the same PID (e.g.
+# before it re-executed itself)
+PROCESS_TOKEN = uuid.uuid4().hex
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    task_type TEXT NOT NULL,
+    args TEXT NOT NULL,
+    key TEXT,
+    attempts INTEGER NOT NULL,
+    owner TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+'''
+
+TaskRecord = namedtuple('TaskRecord', [
+    'id',
+    'task_type',
+    'args',
+    'key',  # Sticky key it was routed by, e.g. its URL
+    'attempts',  # Number of times it failed and was retried
+])
+
+
+def get_import_path(obj):
+    if obj.__qualname__ != obj.__name__:
+        raise TypeError('Cannot import nested: %s' % obj.__qualname__)
+    return '%s.%s' % (obj.__module__, obj.__name__)
+
+
+def import_path(path):
+    module_path, _, name = path.rpartition('.')
+    return getattr(importlib.import_module(module_path), name)
+
+
+def _get_singleton_name(obj):
+    for name, singleton in singletons.singletons.items():
+        if singleton is obj:
+            return name
+    raise TypeError('Cannot serialize method of: %r' % obj)
+
+
+def encode_value(value):
+    '''
+    Return a JSON-serializable form of the given task argument, or raise
+    TypeError if it has none
+    '''
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, list):
+        return {'list': [encode_value(item) for item in value]}
+    if isinstance(value, tuple):
+        return {'tuple': [encode_value(item) for item in value]}
+    if isinstance(value, dict):
+        return {'dict': [[encode_value(key), encode_value(item)]
+                         for key, item in value.items()]}
+    if isinstance(value, TypeString):
+        return {'typestring': str(value)}
+    if type(value) in DURABLE_RESOURCES:
+        typestring = getattr(value, 'typestring', None)
+        return {
+            'resource': get_import_path(type(value)),
+            'url': value.url_string,
+            'typestring': str(typestring) if typestring else None,
+        }
+    if isinstance(value, Converter):
+        return {'converter': get_import_path(type(value))}
+    if isinstance(value, types.FunctionType):
+        return {'function': get_import_path(value)}
+    if isinstance(value, types.MethodType):
+        return {
+            'singleton': _get_singleton_name(value.__self__),
+            'method': value.__name__,
+        }
+    raise TypeError('Cannot serialize: %r' % value)
+
+
+def decode_value(value):
+    '''
+    Return the task argument of the given form (see encode_value)
+    '''
+    if not isinstance(value, dict):
+        return value
+    if 'list' in value:
+        return [decode_value(item) for item in value['list']]
+    if 'tuple' in value:
+        return tuple(decode_value(item) for item in value['tuple'])
+    if 'dict' in value:
+        return {decode_value(key): decode_value(item)
+                for key, item in value['dict']}
+    if 'typestring' in value and len(value) == 1:
+        return TypeString(value['typestring'])
+    if 'resource' in value:
+        resource_class = import_path(value['resource'])
+        if value['typestring'] is None:
+            return resource_class(value['url'])
+        return resource_class(value['url'], TypeString(value['typestring']))
+    if 'converter' in value:
+        return import_path(value['converter'])()
+    if 'function' in value:
+        return import_path(value['function'])
+    if 'singleton' in value:
+        singleton = getattr(singletons, value['singleton'])
+        return getattr(singleton, value['method'])
+    raise ValueError('Unknown task argument: %r' % value)
+
+
+def encode_task(task_type, args):
+    return task_type.name, json.dumps([encode_value(arg) for arg in args])
+
+
+def decode_task(task_type_name, encoded_args):
+    args = tuple(decode_value(arg) for arg in json.loads(encoded_args))
+    return Task[task_type_name], args
+
+
+def get_owner():
+    return '%s:%i:%s' % (socket.gethostname(), os.getpid(), PROCESS_TOKEN)
+
+
+def is_orphaned(owner):
+    '''
+    Check if the process that recorded tasks with the given owner is gone,
+    i.e. is no longer running on this host
+    '''
+    hostname, pid, token = owner.rsplit(':', 2)
+    if hostname != socket.gethostname():
+        return False  # Cannot tell
+    pid = int(pid)
+    if pid == os.getpid():
+        return token != PROCESS_TOKEN
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass  # Running, as someone else
+    return False
+
+
+class TaskQueue:
+    '''
+    Task queue backend that keeps tasks only in the memory of the workers,
+    i.e. queued tasks are lost when the process exits
+    '''
+
+    def put(self, task_type, args, key=None):
+        '''
+        Record the given task, returning its ID, or None if not recorded
+        '''
+        return None
+
+    def ack(self, task_id):
+        '''
+        Forget the task with the given ID, since it is done
+        '''
+
+    def retry(self, task_id):
+        '''
+        Record that the task with the given ID failed and is queued again
+        '''
+
+    def recover(self):
+        '''
+        Take over and return TaskRecords of all tasks that were queued or
+        running in processes that are gone, oldest first
+        '''
+        return []
+
+    def close(self):
+        pass
+
+
+class SQLiteTaskQueue(TaskQueue):
+    '''
+    Task queue backend that records tasks in an SQLite database at
+    TASK_QUEUE_PATH
+    '''
+
+    def __init__(self):
+        self.connection = None
+        self.path = None
+        self.owner = get_owner()
+
+    def get_queue_path(self):
+        settings = singletons.settings
+        if settings.TASK_QUEUE_PATH:
+            return settings.TASK_QUEUE_PATH
+        return os.path.join(settings.PATH_PREFIX, 'task_queue.sqlite3')
+
+    def _connect(self, path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=30)
+        connection.execute('PRAGMA journal_mode = WAL')
+        with connection:
+            version, = connection.execute('PRAGMA user_version').fetchone()
+            if version != FORMAT_VERSION:
+                connection.execute('DROP TABLE IF EXISTS tasks')
+                connection.execute('PRAGMA user_version = %i'
+                                   % FORMAT_VERSION)
+            connection.executescript(SCHEMA)
+        return connection
+
+    def get_connection(self):
+        path = self.get_queue_path()
+        if self.path != path:
+            self.close()
+            self.connection = self._connect(path)
+            self.path = path
+        return self.connection
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+        self.connection = None
+        self.path = None
+
+    def put(self, task_type, args, key=None):
+        try:
+            task_type_name, encoded_args = encode_task(task_type, args)
+        except TypeError as e:
+            log.debug('Not recording task: %s' % e)
+            return None
+        connection = self.get_connection()
+        with connection:
+            cursor = connection.execute('''
+                INSERT INTO tasks
+                    (task_type, args, key, attempts, owner, created_at)
+                VALUES (?, ?, ?, 0, ?, ?)
+            ''', (task_type_name, encoded_args, key, self.owner, time.time()))
+        return cursor.lastrowid
+
+    def ack(self, task_id):
+        connection = self.get_connection()
+        with connection:
+            connection.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
+
+    def retry(self, task_id):
+        connection = self.get_connection()
+        with connection:
+            connection.execute('''
+                UPDATE tasks SET attempts = attempts + 1 WHERE id = ?
+            ''', (task_id,))
+
+    def recover(self):
+        connection = self.get_connection()
+        with connection:
+            owners = [owner for owner, in connection.execute(
+                'SELECT DISTINCT owner FROM tasks')]
+            orphaned = [owner for owner in owners if is_orphaned(owner)]
+            if not orphaned:
+                return []
+            placeholders = ', '.join('?' * len(orphaned))
+            rows = connection.execute('''
+                SELECT id, task_type, args, key, attempts FROM tasks
+                WHERE owner IN (%s) ORDER BY id
+            ''' % placeholders, orphaned).fetchall()
+            connection.execute('''
+                UPDATE tasks SET owner = ? WHERE owner IN (%s)
+            ''' % placeholders, [self.owner] + orphaned)
+
+        records = []
+        for task_id, task_type_name, encoded_args, key, attempts in rows:
+            try:
+                task_type, args = decode_task(task_type_name, encoded_args)
+            except Exception as e:
+                log.warning('Dropping task that cannot be recovered: %s'
+                            % repr(e))
+                self.ack(task_id)
+                continue
+            records.append(TaskRecord(task_id, task_type, args, key,
+                                      attempts))
+        return records
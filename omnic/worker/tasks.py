@@ -1,15 +1,25 @@
+import os
+import time
+
 from omnic import singletons
+from omnic.conversion.exceptions import (ConversionInputError,
+                                         ConversionOutputError, DownloadError)
+from omnic.types import content
+from omnic.types.cacheindex import STATUS_FAILED
 from omnic.types.resource import (ForeignResource, TypedForeignResource,
                                   TypedResource)
 from omnic.types.typestring import TypeString
+from omnic.utils.graph import DirectedGraph
 
 
-async def multiconvert(url_string, to_type, enqueue_convert):
+def plan_conversion(url_string, to_type, custom_profiles=None):
     '''
-    Given a URL string that has already been downloaded, enqueue
-    necessary conversion to get to target type
+    Given a URL string that has already been downloaded, return the
+    (converter, in_resource, out_resource) steps necessary to get to target
+    type, in order. If to_type is a list of target types, intermediate steps
+    shared between them are only returned once. Returns no steps if
+    converted before from identical contents.
     '''
-    target_ts = TypeString(to_type)
     foreign_res = ForeignResource(url_string)
 
     # Determine the file type of the foreign resource
@@ -19,21 +29,133 @@ async def multiconvert(url_string, to_type, enqueue_convert):
         # Symlink to new location that includes typed extension
         typed_foreign_res.symlink_from(foreign_res)
 
-    # Now find path between types
+    # Now find path between types, unless converted before from identical
+    # contents
     original_ts = typed_foreign_res.typestring
-    path = singletons.converter_graph.find_path(original_ts, target_ts)
+    cgraph = singletons.converter_graph
+    profiles = custom_profiles or None
+    if isinstance(to_type, str):
+        target_resource = TypedResource(url_string, TypeString(to_type))
+        if content.link_converted(target_resource):
+            return []
+        targets = [TypeString(to_type)]
+    else:
+        targets = [TypeString(ts) for ts in to_type]
+    try:
+        if isinstance(to_type, str):
+            plan = cgraph.find_path(original_ts, targets[0], profiles)
+        else:
+            plan = cgraph.find_paths(original_ts, targets, profiles)
+    except DirectedGraph.NoPath as e:
+        for target_ts in targets:
+            singletons.negative_cache.record(url_string, target_ts, e)
+        raise
 
-    # Loop through each step in graph path and convert
-    is_first = True
-    for converter_class, from_ts, to_ts in path:
+    # Steps with inputs not produced by an earlier step start from the
+    # source resource itself.
+    steps = []
+    produced = set()
+    for converter_class, from_ts, to_ts in plan:
         converter = converter_class()
         in_resource = TypedResource(url_string, from_ts)
-        if is_first:  # Ensure first resource is just the source one
+        if str(from_ts) not in produced:
             in_resource = TypedForeignResource(url_string, from_ts)
         out_resource = TypedResource(url_string, to_ts)
+        produced.add(str(to_ts))
+        steps.append((converter, in_resource, out_resource))
+    return steps
+
+
+async def multiconvert(url_string, to_type, enqueue_convert):
+    '''
+    Given a URL string that has already been downloaded, enqueue
+    necessary conversion to get to target type. If to_type is a list of
+    target types, intermediate steps shared between them are only enqueued
+    once.
+    '''
+    for converter, in_resource, out_resource in \
+            plan_conversion(url_string, to_type):
         await enqueue_convert(converter, in_resource, out_resource)
-        is_first = False
 
 
 async def resolve_foreign_resource(foreign_resource):
-    await singletons.resolver_graph.download(foreign_resource.url)
+    '''
+    Download the given foreign resource, recording it in the negative cache
+    if that fails
+    '''
+    try:
+        await singletons.resolver_graph.download(foreign_resource.url)
+        if not foreign_resource.cache_exists():
+            raise DownloadError('Nothing was downloaded')
+    except Exception as e:
+        singletons.negative_cache.record(foreign_resource.url_string, None, e)
+        raise
+
+
+async def convert(converter, in_resource, out_resource):
+    '''
+    Run the given converter, writing atomically to the cache of out_resource,
+    and recording its runtime and outcome if adaptive conversion costs are
+    enabled. Failures are recorded in the negative cache.
+    '''
+    if content.link_converted(out_resource):
+        return  # Converted before, from identical contents
+
+    try:
+        await _convert(converter, in_resource, out_resource)
+    except Exception as e:
+        singletons.negative_cache.record(
+            out_resource.url_string, out_resource.typestring, e, converter)
+        index = out_resource.cache_index()
+        if index is not None:
+            index.add(out_resource, converter, status=STATUS_FAILED)
+        raise
+
+
+async def _convert(converter, in_resource, out_resource):
+    # Fail right away if the input could not be downloaded or converted
+    failure = singletons.negative_cache.get(
+        in_resource.url_string, in_resource.typestring)
+    if failure is not None:
+        raise ConversionInputError('Input failed: %s' % failure.error)
+
+    async def write(partial_resource):
+        await singletons.converter_executor.convert(
+            converter, in_resource, partial_resource)
+        if not os.path.lexists(partial_resource.cache_path):
+            raise ConversionOutputError('No output was produced')
+        if singletons.settings.CONTENT_ADDRESSED:
+            foreign_res = ForeignResource(out_resource.url_string)
+            digest = content.get_digest(foreign_res)
+            if digest is not None:
+                content.store_output(digest, partial_resource)
+
+    if singletons.settings.ADAPTIVE_COSTS:
+        written = await _write_recording_costs(
+            converter, in_resource, out_resource, write)
+    else:
+        written = await out_resource.cache_write(write, converter=converter)
+
+    # Keep small results in memory, ready to be served
+    if written:
+        singletons.hot_cache.admit(out_resource)
+
+
+async def _write_recording_costs(converter, in_resource, out_resource, write):
+    try:
+        size = os.path.getsize(in_resource.cache_path)
+    except OSError:
+        size = 0
+    cgraph = singletons.converter_graph
+    args = (converter, in_resource.typestring, out_resource.typestring)
+    start = time.monotonic()
+    try:
+        written = await out_resource.cache_write(write, converter=converter)
+    except Exception:
+        seconds = time.monotonic() - start
+        cgraph.record_conversion(*args, seconds, size=size, success=False)
+        raise
+    if written:  # Otherwise, another worker converted it
+        seconds = time.monotonic() - start
+        cgraph.record_conversion(*args, seconds, size=size)
+    return written
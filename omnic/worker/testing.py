@@ -1,6 +1,6 @@
 from contextlib import contextmanager
 
-from omnic.worker.base import BaseWorker
+from omnic.worker.base import BaseWorker, TaskSkipped
 
 
 @contextmanager
@@ -34,9 +34,14 @@ class RunOnceWorker(BaseWorker):
         self.queue = queue
         self.next_queue = []
 
+        # Futures of the tasks in either queue (if any), resolved once run
+        self.queue_done = [None] * len(queue)
+        self.next_done = []
+        self.current_done = None
+
     async def run_once(self):
-        self.queue = self.next_queue
-        self.next_queue = []
+        self.queue, self.queue_done = self.next_queue, self.next_done
+        self.next_queue, self.next_done = [], []
         await self.run()
 
     @property
@@ -46,12 +51,20 @@ class RunOnceWorker(BaseWorker):
     async def queue_size(self):
         return len(self.next_queue)
 
-    async def enqueue(self, *args):
-        self.next_queue.append(args)
+    async def enqueue(self, task_type, args, key=None, done=None):
+        self.next_queue.append((task_type, args))
+        self.next_done.append(done)
 
     async def get_next(self):
+        self.current_done = self.queue_done.pop(0) if self.queue_done else None
         return self.queue.pop(0)
 
+    def task_done(self, error=None, skipped=False):
+        done, self.current_done = self.current_done, None
+        if skipped:
+            error = TaskSkipped('Skipped, since already running')
+        self._resolve(done, error)
+
     async def check_download(self, foreign_resource):
         self.check_download_was_called = True
         return True
@@ -71,9 +84,16 @@ class ForegroundWorker(BaseWorker):
     async def run(self):
         raise RuntimeError('Cannot run ForegroundWorker in event queue')
 
-    async def enqueue(self, task_type, args):
+    async def enqueue(self, task_type, args, key=None, done=None):
         method = self._get_method(task_type)
-        await method(*args)
+        try:
+            await method(*args)
+        except Exception as e:
+            if done is None:
+                raise
+            self._resolve(done, e)  # Raised by whoever awaits it
+        else:
+            self._resolve(done)
 
     async def get_next(self):
         raise RuntimeError('Cannot run ForegroundWorker in event queue')
@@ -5,6 +5,7 @@ import pytest
 from omnic import singletons
 from omnic.conversion import resolver, resolvergraph
 from omnic.types.resourceurl import ResourceURL
+from omnic.utils.asynctools import CoroutineMock
 
 
 class Settings:
@@ -35,12 +36,27 @@ class BaseResolverTest:
         self.mkdir = patcher.start()
         self.patchers.append(patcher)
 
-        patcher = patch('omnic.worker.subprocessmanager.subprocess')
-        self.subprocess = patcher.start()
+        # Resources are written atomically to a (here, predictable) partial
+        # path; cache locks are skipped, since nothing is actually written
+        patcher = patch('omnic.types.resource.fcntl', None)
+        patcher.start()
+        self.patchers.append(patcher)
+
+        patcher = patch('omnic.types.resource.get_partial_name')
+        patcher.start().return_value = '.partial'
+        self.patchers.append(patcher)
+
+        # Nor are partial directories actually made, so take them to exist
+        patcher = patch('os.path.isdir')
+        patcher.start().return_value = True
+        self.patchers.append(patcher)
 
-        class FakeResult:
-            stdout = tree_object.encode('utf8')
-        self.subprocess.run.return_value = FakeResult
+        patcher = patch(
+            'omnic.worker.subprocessmanager.SubprocessManager.run',
+            new_callable=CoroutineMock)
+        self.subprocess_run = patcher.start()
+        self.subprocess_run.return_value.stdout = tree_object.encode('utf8')
+        self.subprocess_run.return_value.returncode = 0
         self.patchers.append(patcher)
 
         self.open = mock_open()
@@ -72,7 +88,7 @@ class TestDownloaderFunction(BaseResolverTest):
         # ensure the curl command was called
         curl_cmd = ['curl', '-L', '--silent', '--output']
         paths = ['/t/res/whatever.png', 'http://site.com/whatever.png']
-        self.subprocess.run.assert_called_once_with(curl_cmd + paths)
+        self.subprocess_run.assert_called_once_with(curl_cmd + paths)
 
     async def _do_download(self, git_url):
         resource_url = ResourceURL(git_url)
@@ -98,7 +114,7 @@ class TestDownloaderFunction(BaseResolverTest):
         self._check_config()
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
                   'git://githoobie.com/lol.git', '/t/mut/lol.git']),
             call(['git', 'archive', '--output=/t/res/README.md',
@@ -114,7 +130,7 @@ class TestDownloaderFunction(BaseResolverTest):
         self._check_config()
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
                   'git://githoobie.com/lol.git', '/t/mut/lol.git']),
             call(['git', 'archive', '--prefix=/t/res/lol.git',
@@ -133,7 +149,7 @@ class TestDownloaderFunction(BaseResolverTest):
         self.open.assert_any_call('/t/res/lol.git', 'w+')
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
                   'git://githoobie.com/lol.git', '/t/mut/lol.git']),
             call(['git', 'ls-tree', '-r', '--long', '--full-tree',
@@ -157,6 +173,48 @@ class TestResolverGraphHelperMethods(BaseResolverTest):
         destination_type = self.rgraph.find_destination_type(resource_url)
         assert destination_type == None
 
+    def test_dispatch_table(self):
+        by_scheme = self.rgraph.resolvers_by_scheme
+        assert [r.__name__ for r in by_scheme['http']] == ['CurlDownloader']
+        assert 'GitFileResolver' in [r.__name__ for r in by_scheme['git']]
+        assert 'CurlDownloader' not in [r.__name__ for r in by_scheme['git']]
+
+    def test_find_destination_type_memoized(self):
+        git_url = 'git://githoobie.com/lol.git<%s><some/path>' % tree_object
+        self.rgraph.find_destination_type(ResourceURL(git_url))
+
+        # Same scheme and argument shape, so resolvers are not consulted
+        resource_url = ResourceURL('git://githoobie.com/a.git<a><b/c>')
+        with patch('omnic.builtin.resolvers.git.GitFileResolver'
+                   '.get_destination_type') as get_destination_type:
+            destination_type = self.rgraph.find_destination_type(resource_url)
+        assert destination_type == 'file'
+        assert not get_destination_type.called
+
+    def test_find_destination_type_not_memoized(self):
+        # Not found, or resolvers did not opt in, so consulted every time
+        resource_url = ResourceURL('idontexist://site.com/whatever.png')
+        self.rgraph.find_destination_type(resource_url)
+        assert len(self.rgraph.destination_types) == 0
+        git_url = 'git://githoobie.com/lol.git<%s><some/path>' % tree_object
+        with patch('omnic.builtin.resolvers.git.GitExecConverter'
+                   '.destination_type_by_shape', False):
+            destination_type = self.rgraph.find_destination_type(
+                ResourceURL(git_url))
+        assert destination_type == 'file'
+        assert len(self.rgraph.destination_types) == 0
+
+    def test_find_resource_url_basename(self):
+        find_basename = self.rgraph.find_resource_url_basename
+        resource_url = ResourceURL('http://site.com/a/whatever.png')
+        assert find_basename(resource_url) == 'whatever.png'
+        resource_url = ResourceURL('http://site.com/a/dir/')
+        assert find_basename(resource_url) == 'dir'
+        git_url = 'git://githoobie.com/lol.git<%s><some/path.md>' % tree_object
+        assert find_basename(ResourceURL(git_url)) == 'path.md'
+        git_url = 'git://githoobie.com/lol.git<%s></>' % tree_object
+        assert find_basename(ResourceURL(git_url)) == 'lol.git'
+
     def test_find_path_from_url_http(self):
         resource_url = ResourceURL('http://site.com/whatever.png')
         path = self.rgraph.find_path_from_url(resource_url)
@@ -221,10 +279,13 @@ class TestResolverGraphDownload(BaseResolverTest):
         self.mkdir.assert_has_calls((call('/t', 511), call('/t/res', 511)))
 
         # ensure the curl command was called
-        curl_cmd = ['curl', '-L', '--silent', '--output']
-        paths = ['/t/res/whatever.png', 'http://site.com/whatever.png']
+        curl_cmd = ['curl', '-L', '--silent', '--fail', '--output']
+        paths = [
+            '/t/res/.partial/whatever.png',
+            'http://site.com/whatever.png',
+        ]
         kwds = {'cwd': '/t/mut'}
-        self.subprocess.run.assert_called_once_with(curl_cmd + paths, **kwds)
+        self.subprocess_run.assert_called_once_with(curl_cmd + paths, **kwds)
 
     async def _do_download(self, git_url):
         resource_url = ResourceURL(git_url)
@@ -234,7 +295,8 @@ class TestResolverGraphDownload(BaseResolverTest):
 
     def _check_config(self):
         # ensure git config was appended to
-        self.open.assert_called_once_with('/t/mut/lol.git/config', 'a')
+        config_path = '/t/mut/.partial/lol.git/config'
+        self.open.assert_called_once_with(config_path, 'a')
         assert len(self.open().write.mock_calls) == 1
         contents = list(self.open().write.mock_calls[0])[1][0]  # first arg
         assert '[tar "raw"]' in contents
@@ -250,13 +312,13 @@ class TestResolverGraphDownload(BaseResolverTest):
         self._check_config()
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
-                  'git://githoobie.com/lol.git', '/t/mut/lol.git'],
-                 cwd='/t/mut'),
+                  'git://githoobie.com/lol.git', '/t/mut/.partial/lol.git'],
+                 cwd='/t/mut/.partial'),
             call(['git', 'rev-parse', '--quiet', '--verify', tree_object],
                  cwd='/t/mut/lol.git', stdout=-1),
-            call(['git', 'archive', '--output=/t/res/README.md',
+            call(['git', 'archive', '--output=/t/res/.partial/README.md',
                   '--format=raw', tree_object, 'README.md'],
                  cwd='/t/mut/lol.git'),
         ]
@@ -269,13 +331,13 @@ class TestResolverGraphDownload(BaseResolverTest):
         self._check_config()
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
-                  'git://githoobie.com/lol.git', '/t/mut/lol.git'],
-                 cwd='/t/mut'),
+                  'git://githoobie.com/lol.git', '/t/mut/.partial/lol.git'],
+                 cwd='/t/mut/.partial'),
             call(['git', 'rev-parse', '--quiet', '--verify', tree_object],
                  cwd='/t/mut/lol.git', stdout=-1),
-            call(['git', 'archive', '--prefix=/t/res/lol.git/',
+            call(['git', 'archive', '--prefix=/t/res/.partial/lol.git/',
                   '--format=directory', tree_object],
                  cwd='/t/mut/lol.git'),
         ]
@@ -287,14 +349,14 @@ class TestResolverGraphDownload(BaseResolverTest):
 
         # ensure git config was appended to, and that the output file was
         # opened
-        self.open.assert_any_call('/t/mut/lol.git/config', 'a')
-        self.open.assert_any_call('/t/res/lol.git', 'w+')
+        self.open.assert_any_call('/t/mut/.partial/lol.git/config', 'a')
+        self.open.assert_any_call('/t/res/.partial/lol.git', 'w+')
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
-                  'git://githoobie.com/lol.git', '/t/mut/lol.git'],
-                 cwd='/t/mut'),
+                  'git://githoobie.com/lol.git', '/t/mut/.partial/lol.git'],
+                 cwd='/t/mut/.partial'),
             call(['git', 'rev-parse', '--quiet', '--verify', tree_object],
                  cwd='/t/mut/lol.git', stdout=-1),
             call(['git', 'ls-tree', '-r', '--long', '--full-tree',
@@ -304,23 +366,21 @@ class TestResolverGraphDownload(BaseResolverTest):
 
     @pytest.mark.asyncio
     async def test_update_when_hash_not_present(self):
-        class FakeResult:
-            stdout = b''
-        self.subprocess.run.return_value = FakeResult
+        self.subprocess_run.return_value.stdout = b''
         path = 'README.md'
         git_url = 'git://githoobie.com/lol.git<%s><%s>' % (tree_object, path)
         await self._do_download(git_url)
         self._check_config()
 
         # ensure the sequence of git commands were called
-        assert self.subprocess.run.mock_calls == [
+        assert self.subprocess_run.mock_calls == [
             call(['git', 'clone', '--bare',
-                  'git://githoobie.com/lol.git', '/t/mut/lol.git'],
-                 cwd='/t/mut'),
+                  'git://githoobie.com/lol.git', '/t/mut/.partial/lol.git'],
+                 cwd='/t/mut/.partial'),
             call(['git', 'rev-parse', '--quiet', '--verify', tree_object],
                  cwd='/t/mut/lol.git', stdout=-1),
             call(['git', 'fetch'], cwd='/t/mut/lol.git'),
-            call(['git', 'archive', '--output=/t/res/README.md',
+            call(['git', 'archive', '--output=/t/res/.partial/README.md',
                   '--format=raw', tree_object, 'README.md'],
                  cwd='/t/mut/lol.git'),
         ]
@@ -1,3 +1,4 @@
+import asyncio
 import io
 import json
 import os
@@ -9,6 +10,7 @@ from omnic import singletons
 from omnic.builtin.converters.manifest import ManifestDownloader
 from omnic.types.detectors import DIRECTORY
 from omnic.types.resource import ForeignResource, TypedResource
+from omnic.types.typestring import TypeString
 from omnic.utils import asynctools
 from omnic.worker.enums import Task
 from omnic.worker.testing import RunOnceWorker
@@ -40,9 +42,17 @@ class BaseUnitTest:
             pass
         singletons.settings.use_previous_settings()
 
-    async def _get(self, path, **get_args):
+    async def _wait_enqueued(self):
+        # Let jobs started in the background enqueue their first steps
+        for _ in range(100):
+            if self.worker.next_queue:
+                break
+            await asyncio.sleep(0.01)
+
+    async def _get(self, path, request_headers=None, **get_args):
         class MockRequest:
             args = {k: [v] for k, v in get_args.items()}
+            headers = request_headers or {}
         singletons.server.configure()
         matches, view = singletons.server.route_path(path)
         response = await view(MockRequest, *matches)
@@ -163,6 +173,20 @@ class TestAdmin(BaseUnitTest):
         assert b'Conversion' in data
         assert b'Graph Explorer' in data
 
+    @pytest.mark.asyncio
+    async def test_converters(self):
+        data = await self._get('/admin/converters/')
+        assert b'200 OK' in data
+        assert b'Converters' in data
+        assert b'Graph Explorer' in data
+
+    @pytest.mark.asyncio
+    async def test_failures(self):
+        data = await self._get('/admin/failures/')
+        assert b'200 OK' in data
+        assert b'Failures' in data
+        assert b'Graph Explorer' in data
+
     @pytest.mark.asyncio
     async def test_subgraph(self):
         data = await self._get('/admin/graph/JPEG/')
@@ -206,16 +230,35 @@ class TestBuiltinMediaServer(BaseUnitTest):
         }
         await self._do_check_enqueued()
 
+    @pytest.mark.asyncio
+    async def test_media_conditional_request(self):
+        url = '%s/test.png' % self.host
+        res = TypedResource('http://%s' % url, TypeString('thumb.jpg:20x20'))
+        with res.cache_open('wb') as fd:
+            fd.write(b'JPEG data')
+        data = await self._get('/media/thumb.jpg:20x20/', url=url)
+        assert b'200 OK' in data
+        assert b'JPEG data' in data
+        assert b'Cache-Control: public, max-age=3600' in data
+        etag = data.partition(b'ETag: ')[2].partition(b'\r\n')[0]
+        assert etag
+        etag = etag.decode('utf8')
+
+        data = await self._get('/media/thumb.jpg:20x20/', url=url,
+                               request_headers={'If-None-Match': etag})
+        assert b'304 Not Modified' in data
+        assert b'JPEG data' not in data
+        res.cache_remove()
+        singletons.hot_cache.invalidate(res)
+
     async def _do_check_enqueued(self):
-        # Inspect whats been enqueued, ensure as expected
-        await asynctools.await_all()
+        # Inspect whats been enqueued, ensure as expected: only the download,
+        # since detecting and converting wait on it
+        await self._wait_enqueued()
         q = self.worker.next_queue
-        assert q
-        assert q[0]
+        assert len(q) == 1
         assert q[0][0] == Task.DOWNLOAD
-        assert q[1][0] == Task.FUNC
-        assert q[1][1][1] == '127.0.0.1:42101/test.png'
-        assert q[1][1][2] == 'thumb.jpg:200x200'
+        assert q[0][1] == (ForeignResource('127.0.0.1:42101/test.png'),)
 
         # Run through queue... this should download the resource, and in
         # turn enqueue the remaining steps
@@ -262,13 +305,12 @@ class TestViewerViews(BaseUnitTest):
         assert b'application/javascript' in r
         assert b'window._OMNIC_VIEWER_BUNDLE_IS_LOADED = false' in r
 
-        # Inspect whats been enqueued, ensure as expected
+        # Inspect whats been enqueued, ensure as expected: only the first
+        # conversion step, since the others wait on it
+        await self._wait_enqueued()
         q = self.worker.next_queue
         assert len(q) == 1
-        assert q
-        assert q[0]
-        assert q[0][0] == Task.FUNC
-        assert q[0][1][2] == 'min.js'
+        assert q[0][0] == Task.CONVERT
         await self.worker.run_once()
         return  # TODO finish this crap
 
@@ -0,0 +1,225 @@
+'''
+Tests for `cacheindex` module.
+'''
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+
+import pytest
+
+from omnic import singletons
+from omnic.types import cacheindex
+from omnic.types.cacheindex import CacheIndex
+from omnic.types.resource import (ForeignResource, TypedLocalResource,
+                                  TypedResource)
+from omnic.types.typestring import TypeString
+from omnic.worker import tasks
+from omnic.worker.janitor import CacheEntry, CacheJanitor
+
+URL = 'http://mocksite.local/file.png'
+OTHER_URL = 'http://mocksite.local/other/file.png'
+OTHER_HOST_URL = 'http://othersite.local/file.png'
+
+
+class StubConverter:
+    def __init__(self, data=b'converted'):
+        self.data = data
+
+    async def convert(self, in_resource, out_resource):
+        with out_resource.cache_open('wb') as fd:
+            fd.write(self.data)
+
+
+class FailingConverter:
+    async def convert(self, in_resource, out_resource):
+        raise ValueError('bad input')
+
+
+class TestCacheIndex:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'cache_index': True,
+        })
+        self.index = singletons.cache_index
+
+    def teardown_method(self, method):
+        self.index.close()
+        singletons.settings.use_previous_settings()
+
+    async def _write(self, res, data=b'data', converter=None):
+        async def write(partial):
+            with partial.cache_open('wb') as fd:
+                fd.write(data)
+        return await res.cache_write(write, converter=converter)
+
+    @pytest.mark.asyncio
+    async def test_cache_write(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        assert not await res.cache_ready()
+        assert await self._write(res, b'1234', StubConverter())
+        assert await res.cache_ready()
+        entry = self.index.get(res)
+        assert entry.url == URL
+        assert entry.host == 'mocksite.local'
+        assert entry.typestring == 'thumb.jpg'
+        assert entry.size == 4
+        assert entry.converter == 'StubConverter'
+        assert entry.status == cacheindex.STATUS_READY
+
+    @pytest.mark.asyncio
+    async def test_readiness_from_index(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        with res.cache_open('wb') as fd:
+            fd.write(b'cached before indexing')
+        assert res.cache_exists()
+        assert not await res.cache_ready()
+
+        # Found already cached by the next worker
+        assert not await self._write(res)
+        assert await res.cache_ready()
+        assert self.index.get(res).size == 22
+
+    @pytest.mark.asyncio
+    async def test_remove(self):
+        foreign_res = ForeignResource(URL)
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        await self._write(foreign_res)
+        await self._write(res)
+        res.cache_remove()
+        assert not await res.cache_ready()
+        assert await foreign_res.cache_ready()
+        foreign_res.cache_remove_all()
+        assert not await foreign_res.cache_ready()
+        assert self.index.find() == []
+
+    @pytest.mark.asyncio
+    async def test_local_resources_not_indexed(self):
+        path = os.path.join(tempfile.mkdtemp(), 'file.png')
+        res = TypedLocalResource(path, TypeString('thumb.jpg'))
+        await self._write(res)
+        assert os.path.exists(res.cache_path)
+        assert self.index.find() == []
+
+    @pytest.mark.asyncio
+    async def test_failed_conversion(self):
+        in_res = TypedResource(URL, TypeString('PNG'))
+        out_res = TypedResource(URL, TypeString('thumb.jpg'))
+        with pytest.raises(ValueError):
+            await tasks.convert(FailingConverter(), in_res, out_res)
+        singletons.negative_cache.clear()
+        entry = self.index.get(out_res)
+        assert entry.status == cacheindex.STATUS_FAILED
+        assert entry.converter == 'FailingConverter'
+        assert not await out_res.cache_ready()
+
+        await tasks.convert(StubConverter(), in_res, out_res)
+        assert self.index.get(out_res).status == cacheindex.STATUS_READY
+
+    @pytest.mark.asyncio
+    async def test_find_and_invalidate(self):
+        resources = [
+            ForeignResource(URL),
+            TypedResource(URL, TypeString('thumb.jpg')),
+            TypedResource(OTHER_URL, TypeString('thumb.jpg')),
+            TypedResource(OTHER_HOST_URL, TypeString('thumb.jpg')),
+            TypedResource(OTHER_HOST_URL, TypeString('thumb.png')),
+        ]
+        for res in resources:
+            await self._write(res)
+
+        def urls(entries):
+            return sorted((e.url, e.typestring or '') for e in entries)
+
+        assert len(self.index.find()) == 5
+        assert len(self.index.find(host='mocksite.local')) == 3
+        assert urls(self.index.find(url_prefix='http://mocksite.local/o')) \
+            == [(OTHER_URL, 'thumb.jpg')]
+        assert len(self.index.find(typestring='thumb.jpg')) == 3
+        assert len(self.index.find(
+            host='othersite.local', typestring='thumb.jpg')) == 1
+
+        invalidated = self.index.invalidate(host='othersite.local')
+        assert urls(invalidated) == [
+            (OTHER_HOST_URL, 'thumb.jpg'),
+            (OTHER_HOST_URL, 'thumb.png'),
+        ]
+        assert not os.path.exists(resources[3].cache_path)
+        assert not await resources[4].cache_ready()
+
+        invalidated = self.index.invalidate(typestring=TypeString('thumb.jpg'))
+        assert len(invalidated) == 2
+        assert [res.cache_exists() for res in resources[:3]] == \
+            [True, False, False]
+
+    @pytest.mark.asyncio
+    async def test_usage(self):
+        await self._write(ForeignResource(URL), b'x' * 100)
+        await self._write(ForeignResource(OTHER_URL), b'x' * 50)
+        await self._write(TypedResource(URL, TypeString('thumb.jpg')), b'x')
+        usage = self.index.get_usage()
+        assert usage == [
+            cacheindex.TypeUsage(None, 2, 150),
+            cacheindex.TypeUsage('thumb.jpg', 1, 1),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_janitor(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        await self._write(res)
+        janitor = CacheJanitor()
+        accessed_at = self.index.get(res).accessed_at
+        janitor.touch(res)
+        assert self.index.get(res).accessed_at > accessed_at
+        assert janitor.evict(CacheEntry(res.cache_path_base, 4, 0))
+        assert not await res.cache_ready()
+
+    @pytest.mark.asyncio
+    async def test_shared_between_threads_and_instances(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        await self._write(res)
+        results = []
+        thread = threading.Thread(
+            target=lambda: results.append(CacheIndex().is_ready(res)))
+        thread.start()
+        thread.join()
+        assert results == [True]
+
+    @pytest.mark.asyncio
+    async def test_busy_falls_back_to_filesystem(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        other_res = TypedResource(URL, TypeString('thumb.png'))
+        await self._write(res)
+        busy = sqlite3.OperationalError('database is locked')
+        with patch.object(self.index, 'get_connection', side_effect=busy):
+            assert self.index.is_ready(res) is None
+            assert await res.cache_ready()
+            assert not await other_res.cache_ready()
+
+    @pytest.mark.asyncio
+    async def test_touch_does_not_wait(self):
+        res = TypedResource(URL, TypeString('thumb.jpg'))
+        await self._write(res)
+        accessed_at = self.index.get(res).accessed_at
+        other_connection = sqlite3.connect(self.index.get_index_path())
+        try:
+            other_connection.execute('BEGIN IMMEDIATE')
+            start = time.monotonic()
+            self.index.touch(res)
+            assert time.monotonic() - start < 5
+        finally:
+            other_connection.close()
+        assert self.index.get(res).accessed_at == accessed_at
+
+    def test_outdated_index_started_over(self):
+        connection = self.index.get_connection()
+        connection.execute('PRAGMA user_version = 0')
+        connection.execute('''
+            INSERT INTO entries VALUES ('/x', 'u', 'h', NULL, 0, 0, 0, NULL,
+                                        'ready')
+        ''')
+        connection.commit()
+        assert CacheIndex().find() == []
@@ -1,4 +1,5 @@
 import re
+import tempfile
 from unittest.mock import MagicMock, call, patch
 
 import pytest
@@ -250,6 +251,22 @@ class TestCoreCommands:
         #        self.singletons.workers.gather_run(),
         #    )
 
+    def test_runserver_logs_probe_errors(self):
+        class args:
+            host = None
+            port = None
+        self.commands.runserver(args)
+        future = self.singletons.eventloop.loop.run_in_executor.return_value
+        future.add_done_callback.assert_called_once_with(
+            self.commands._probe_done)
+
+        failed = MagicMock()
+        failed.cancelled.return_value = False
+        failed.exception.return_value = OSError('probe failed')
+        with patch('omnic.cli.commands.log') as log:
+            self.commands._probe_done(failed)
+        assert 'probe failed' in log.error.call_args[0][0]
+
     def test_runserver_command_with_args(self):
         class args:
             host = '1.2.3.4'
@@ -354,6 +371,28 @@ class TestCacheCommands:
         _check_silent(capsys)
 
     @use_settings(path_prefix='/some/path/')
+    def test_clear_failures_command(self, capsys):
+        from omnic import singletons
+
+        class args:
+            urls = ['http://fake/foreign/resource']
+
+        class args_all:
+            urls = []
+
+        with use_settings(path_prefix=tempfile.mkdtemp()):
+            negative_cache = singletons.negative_cache
+            for url in ('http://fake/foreign/resource', 'http://other'):
+                negative_cache.record(url, TypeString('EXT'), ValueError())
+            self.commands.list_failures(args_all)
+            out, err = capsys.readouterr()
+            assert 'http://other -> EXT: ValueError' in out
+            self.commands.clear_failures(args)
+            assert len(negative_cache.get_all()) == 1
+            self.commands.clear_failures(args_all)
+            assert negative_cache.get_all() == []
+        _check_silent(capsys)
+
     @pytest.mark.asyncio
     async def test_precache_command(self, capsys):
         # Wrap around magic mock to make async friendly
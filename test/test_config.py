@@ -3,6 +3,7 @@ Tests for `config` module.
 """
 import os
 import tempfile
+from unittest.mock import patch
 
 import pytest
 
@@ -71,6 +72,42 @@ class TestSettings:
             settings.private_thing
 
 
+class TestSettingsSnapshot:
+    def test_snapshot_is_read_only(self):
+        settings = SettingsManager()
+        assert settings.snapshot['SERVICES'] == settings.SERVICES
+        with pytest.raises(TypeError):
+            settings.snapshot['SERVICES'] = []
+
+    def test_set_rebuilds_snapshot(self):
+        settings = SettingsManager()
+        settings.set(port=1234)
+        assert settings.PORT == 1234
+        assert settings.snapshot['PORT'] == 1234
+
+    def test_previous_custom_settings_forgotten(self):
+        settings = SettingsManager()
+
+        class MockSettings:
+            MADE_UP_SETTING = 1
+        settings.use_settings(MockSettings)
+        assert settings.MADE_UP_SETTING == 1
+        settings.use_previous_settings()
+        with pytest.raises(ConfigurationError):
+            settings.MADE_UP_SETTING
+
+    def test_load_all_cached_until_settings_change(self):
+        settings = SettingsManager()
+        settings.set(services=['test.test_config.ExampleClassA'])
+        first = settings.load_all('SERVICES')
+        with patch.object(settings, 'load_path') as load_path:
+            assert settings.load_all('SERVICES') == first
+            assert settings.load_all('SERVICES') is not first
+            assert not load_path.called
+        settings.set(services=['test.test_config.ExampleClassB'])
+        assert settings.load_all('SERVICES') == [ExampleClassB]
+
+
 class TestSettingsCustom:
     def setup_method(self, method):
         self._original = os.environ.get('OMNIC_SETTINGS', None)
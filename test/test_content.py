@@ -0,0 +1,115 @@
+'''
+Tests for `content` module.
+'''
+import hashlib
+import os
+import tempfile
+
+import pytest
+
+from omnic import singletons
+from omnic.config.utils import use_settings
+from omnic.types import content
+from omnic.types.resource import ForeignResource, TypedResource
+from omnic.types.typestring import TypeString
+from omnic.worker import tasks
+
+URL1 = 'http://mocksite.local/file.png'
+URL2 = 'http://mirror.local/copy-of-file.png'
+URL3 = 'http://mocksite.local/other.png'
+DATA = b'png data'
+
+
+class StubConverter:
+    def __init__(self):
+        self.calls = []
+
+    async def convert(self, in_resource, out_resource):
+        self.calls.append((in_resource, out_resource))
+        with out_resource.cache_open('wb') as fd:
+            fd.write(b'converted')
+
+
+class TestContentAddressed:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'content_addressed': True,
+        })
+
+    def teardown_method(self, method):
+        singletons.settings.use_previous_settings()
+
+    def _download(self, url, data=DATA):
+        res = ForeignResource(url)
+        with res.cache_open('wb') as fd:
+            fd.write(data)
+        return content.store_download(res)
+
+    def test_hash_file(self):
+        self._download(URL1)
+        res = ForeignResource(URL1)
+        assert content.hash_file(res.cache_path) == \
+            hashlib.sha256(DATA).hexdigest()
+
+    def test_store_download(self):
+        digest = self._download(URL1)
+        assert digest == hashlib.sha256(DATA).hexdigest()
+        res = ForeignResource(URL1)
+        assert os.path.islink(res.cache_path)
+        assert content.get_digest(res) == digest
+        with res.cache_open() as fd:
+            assert fd.read() == DATA
+
+    def test_stored_once(self):
+        assert self._download(URL1) == self._download(URL2)
+        assert self._download(URL3, b'other') != self._download(URL1)
+        paths = [
+            os.path.realpath(ForeignResource(url).cache_path)
+            for url in (URL1, URL2, URL3)
+        ]
+        assert paths[0] == paths[1] == content.get_content_path(
+            hashlib.sha256(DATA).hexdigest())
+        assert paths[2] != paths[0]
+
+    def test_directories_not_stored(self):
+        res = ForeignResource(URL1)
+        res.cache_makedirs(subdir='')
+        assert content.store_download(res) is None
+        assert content.get_digest(res) is None
+
+    def test_not_downloaded(self):
+        assert content.get_digest(ForeignResource(URL1)) is None
+        res = TypedResource(URL1, TypeString('thumb.jpg'))
+        assert not content.link_converted(res)
+
+    @pytest.mark.asyncio
+    async def test_conversion_reused(self):
+        self._download(URL1)
+        self._download(URL2)
+        self._download(URL3, b'other')
+        converter = StubConverter()
+        for url in (URL1, URL2, URL3):
+            in_res = TypedResource(url, TypeString('PNG'))
+            out_res = TypedResource(url, TypeString('thumb.jpg'))
+            await tasks.convert(converter, in_res, out_res)
+            assert out_res.cache_exists()
+            with out_res.cache_open() as fd:
+                assert fd.read() == b'converted'
+
+        # Converted once per contents
+        converted = [out.url_string for _, out in converter.calls]
+        assert converted == [URL1, URL3]
+
+    @pytest.mark.asyncio
+    async def test_disabled(self):
+        self._download(URL1)
+        self._download(URL2)
+        converter = StubConverter()
+        with use_settings(path_prefix=singletons.settings.PATH_PREFIX):
+            for url in (URL1, URL2):
+                in_res = TypedResource(url, TypeString('PNG'))
+                out_res = TypedResource(url, TypeString('thumb.jpg'))
+                await tasks.convert(converter, in_res, out_res)
+                assert not os.path.islink(out_res.cache_path)
+        assert len(converter.calls) == 2
@@ -11,9 +11,14 @@ import pytest
 from omnic import singletons
 from omnic.config.utils import use_settings
 from omnic.conversion import converter
+from omnic.conversion.availability import ConverterAvailability
+from omnic.conversion.costs import AdaptiveCosts
 from omnic.conversion.graph import ConverterGraph
+from omnic.conversion.plan import ConversionPlan, MultiConversionPlan
+from omnic.conversion.profiles import ConversionProfiles
 from omnic.types.resource import TypedResource
 from omnic.types.typestring import TypeString
+from omnic.utils.asynctools import CoroutineMock
 from omnic.utils.graph import NoPath
 
 from .testing_utils import (AgreeableDetector, DummyDetector, Magic,
@@ -270,8 +275,10 @@ class TestExecConverterUnitTest:
         command = ['test', '$IN', '$OUT']
 
     def _get_mocked_resource(self, ts):
-        res = TypedResource(URL, TypeString(ts))
-        res.cache_makedirs = MagicMock()
+        # Resources are immutable, so mock one with the same interface
+        res = MagicMock(spec=TypedResource)
+        res.url_string = URL
+        res.typestring = TypeString(ts)
         res.cache_path = 'test/path.%s' % ts
         return res
 
@@ -291,16 +298,47 @@ class TestExecConverterUnitTest:
         res1 = self._get_mocked_resource('input')
         res2 = self._get_mocked_resource('output')
         sb = self.Subclass()
-        info = {'run.return_value': '/bin/test'}
-        with patch('omnic.worker.subprocessmanager.subprocess', **info) as sp:
+        with patch('omnic.worker.subprocessmanager.SubprocessManager.run',
+                   new_callable=CoroutineMock) as run:
+            run.return_value.returncode = 0
             await sb.convert(res1, res2)
         res1.cache_makedirs.assert_called_once_with()
         res2.cache_makedirs.assert_called_once_with()
-        sp.run.assert_called_once_with(
+        run.assert_called_once_with(
             ['test', 'test/path.input', 'test/path.output'],
             cwd='test',
         )
 
+    @pytest.mark.asyncio
+    async def test_convert_timeout(self):
+        class Subclass(self.Subclass):
+            timeout = 30
+        res1 = self._get_mocked_resource('input')
+        res2 = self._get_mocked_resource('output')
+        with patch('omnic.worker.subprocessmanager.SubprocessManager.run',
+                   new_callable=CoroutineMock) as run:
+            run.return_value.returncode = 0
+            await Subclass().convert(res1, res2)
+        run.assert_called_once_with(
+            ['test', 'test/path.input', 'test/path.output'],
+            cwd='test',
+            timeout=30,
+        )
+
+    @pytest.mark.asyncio
+    async def test_convert_exits_nonzero(self):
+        class Subclass(converter.ExecConverter):
+            command = ['sh', '-c', 'echo partial; exit 3']
+
+            def get_capture(self, in_resource, out_resource):
+                return ['stdout']
+        res1 = self._get_mocked_resource('input')
+        res2 = self._get_mocked_resource('output')
+        res2.cache_path = os.path.join(tempfile.mkdtemp(), 'out.txt')
+        with pytest.raises(converter.ConversionProcessError) as excinfo:
+            await Subclass().convert(res1, res2)
+        assert 'exited with 3' in str(excinfo.value)
+
 
 class TestBasicConverterGraph(ConverterTestBase):
     @classmethod
@@ -327,6 +365,35 @@ class TestBasicConverterGraph(ConverterTestBase):
         assert results[0][0] is Convert3DGraphicsToImage
         assert results[1][0] is ConvertImageToThumb
 
+    def test_find_paths_shares_steps(self):
+        targets = ['thumb.png:80x80', 'thumb.png:200x200', 'PNG']
+        results = self.cgraph.find_paths(
+            TypeString('STL'), [TypeString(ts) for ts in targets])
+        assert isinstance(results, MultiConversionPlan)
+        assert len(results) == 3  # STL -> PNG only occurs once
+        assert results[0][0] is Convert3DGraphicsToImage
+        assert results[1][0] is ConvertImageToThumb
+        assert results[2][0] is ConvertImageToThumb
+        assert [str(step[2]) for step in results] == [
+            'PNG', 'thumb.png:80x80', 'thumb.png:200x200']
+        assert [str(ts) for ts in results.targets] == targets
+
+    def test_find_path_memoizes_plan(self):
+        results = self._path('AVI', 'thumb.png:200x200')
+        assert isinstance(results, ConversionPlan)
+        assert self._path('AVI', 'thumb.png:200x200') is results
+        assert self._path('AVI', 'thumb.png:100x100') is not results
+        with pytest.raises(AttributeError):
+            results.steps = ()
+
+    def test_plans_cleared_on_graph_change(self):
+        cgraph = ConverterGraph(MockConfig.CONVERTERS)
+        results = cgraph.find_path(TypeString('STL'), TypeString('thumb.png'))
+        assert len(results) == 2
+        cgraph._setup_preferred_paths([('STL', 'AVI', 'JPG', 'thumb.png')])
+        results = cgraph.find_path(TypeString('STL'), TypeString('thumb.png'))
+        assert len(results) == 3
+
 
 class TestConverterGraphCustomPaths:
     def teardown_method(self, method):
@@ -336,11 +403,15 @@ class TestConverterGraphCustomPaths:
         return self.cgraph.find_path(TypeString(in_str), TypeString(out_str))
 
     def test_pruned_converters(self):
-        cgraph = ConverterGraph([
-            AvailableConverter,
-            UnavailableConverter,
-        ], prune_converters=True)
+        # Keep the probe results out of the shared cache
+        path = os.path.join(tempfile.mkdtemp(), 'availability.json')
+        with use_settings(converter_probe_path=path):
+            cgraph = ConverterGraph([
+                AvailableConverter,
+                UnavailableConverter,
+            ], prune_converters=True)
         assert len(cgraph.converters) == 1
+        os.remove(path)
 
     @use_settings(preferred_conversion_paths=[('STL', 'AVI', 'JPG', 'thumb.png')])
     def test_preferred_conversions(self):
@@ -402,6 +473,277 @@ class TestConverterGraphCustomPaths:
         assert results[1][0] is ConvertImageToThumb
         assert results[1][2].arguments == ('123x456', )
 
+        # Ensure global conversion profiles are unaffected
+        with pytest.raises(NoPath):
+            self._path('STL', 'thumb')
+
+    def test_get_profiles(self):
+        self.cgraph = ConverterGraph(MockConfig.CONVERTERS)
+        profiles = self.cgraph.get_profiles({'thumb': 'thumb.png:123x456'})
+        assert isinstance(profiles, ConversionProfiles)
+        assert profiles.get('thumb') == ('thumb.png:123x456', )
+        assert 'thumb' not in self.cgraph.conversion_profiles
+
+        # Equal profiles are only validated once and share plans
+        same = self.cgraph.get_profiles({'thumb': 'thumb.png:123x456'})
+        assert same is profiles
+        assert hash(same) == hash(profiles)
+        assert self.cgraph.get_profiles(profiles) is profiles
+        stl, thumb = TypeString('STL'), TypeString('thumb')
+        plan = self.cgraph.find_path(stl, thumb, profiles)
+        assert self.cgraph.find_path(stl, thumb, same) is plan
+        assert plan[1][2].arguments == ('123x456', )
+
+        # Invalid profiles are skipped
+        invalid = self.cgraph.get_profiles({'avithumb': ('AVI', 'OBJ')})
+        assert 'avithumb' not in invalid
+
+    def test_profiles_revalidated_after_graph_change(self):
+        self.cgraph = ConverterGraph(MockConfig.CONVERTERS)
+        profiles = self.cgraph.get_profiles({'thumb': 'thumb.png:123x456'})
+        self.cgraph._setup_preferred_paths(
+            [('STL', 'AVI', 'JPG', 'thumb.png')])
+        new_profiles = self.cgraph.get_profiles(profiles)
+        assert new_profiles is not profiles
+        assert new_profiles == profiles
+        results = self.cgraph.find_path(
+            TypeString('STL'), TypeString('thumb'), profiles)
+        assert len(results) == 3
+
+
+class TestAdaptiveCosts:
+    def test_record_and_get_cost(self):
+        costs = AdaptiveCosts()
+        edge = ('STL', 'PNG')
+        other_edge = ('STL', 'AVI')
+        assert costs.get_cost(edge, 'conv', 1) == 1
+        costs.record(edge, 'conv', 3.0)
+        assert costs.get_cost(edge, 'conv', 1) == 1.0  # mean of itself
+        costs.record(other_edge, 'other_conv', 1.0)
+        assert costs.get_cost(edge, 'conv', 1) == 1.5
+        assert costs.get_cost(edge, 'conv', 4) == 6.0
+        assert costs.get_cost(other_edge, 'other_conv', 1) == 0.5
+        assert costs.get_cost(edge, 'other_conv', 1) == 1
+        costs.record(edge, 'conv', 0.5, success=False)
+        assert costs.stats[edge].seconds == 3.0  # timing of failures ignored
+        assert costs.get_cost(edge, 'conv', 1) > 1.5
+
+    def test_scaled_by_size(self):
+        costs = AdaptiveCosts()
+        costs.record(('STL', 'PNG'), 'conv', 2.0, size=1024 * 1024)
+        costs.record(('STL', 'AVI'), 'conv', 1.0)
+        assert costs.get_cost(('STL', 'PNG'), 'conv', 1) == 1.0
+        assert costs.get_cost(('STL', 'AVI'), 'conv', 1) == 1.0
+
+    def test_save_and_load(self):
+        path = os.path.join(tempfile.mkdtemp(), 'costs.json')
+        costs = AdaptiveCosts()
+        costs.record(('STL', 'PNG'), 'conv', 3.0)
+        costs.record(('STL', 'AVI'), 'conv', 1.0)
+        costs.save(path)
+        loaded = AdaptiveCosts()
+        loaded.load(path)
+        assert loaded.get_cost(('STL', 'PNG'), 'conv', 1) == 1.5
+        os.remove(path)
+
+
+class TestConverterGraphAdaptiveCosts:
+    def setup_method(self, method):
+        self.path = os.path.join(tempfile.mkdtemp(), 'costs.json')
+
+    def teardown_method(self, method):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _path(self):
+        return self.cgraph.find_path(
+            TypeString('STL'), TypeString('thumb.png'))
+
+    def test_learns_and_persists_costs(self):
+        with use_settings(adaptive_costs=True, adaptive_costs_interval=0,
+                          adaptive_costs_path=self.path):
+            self.cgraph = ConverterGraph(MockConfig.CONVERTERS)
+            results = self._path()
+            assert results[0][0] is Convert3DGraphicsToImage
+            self.cgraph.record_conversion(
+                Convert3DGraphicsToImage(),
+                TypeString('STL'), TypeString('PNG'), 10.0,
+            )
+            results = self._path()
+            assert len(results) == 2  # Slow compared to nothing else yet
+            self.cgraph.record_conversion(
+                Convert3DGraphicsToMovie(),
+                TypeString('STL'), TypeString('AVI'), 1.0,
+            )
+            self.cgraph.record_conversion(
+                ConvertMovieToImage(),
+                TypeString('AVI'), TypeString('JPG'), 1.0,
+            )
+            results = self._path()
+            assert len(results) == 3  # Now avoids slow STL -> PNG step
+            assert results[0][0] is Convert3DGraphicsToMovie
+            assert os.path.exists(self.path)
+
+            # Ensure learned costs survive restart
+            self.cgraph = ConverterGraph(MockConfig.CONVERTERS)
+            assert len(self._path()) == 3
+
+    def test_disabled_by_default(self):
+        self.cgraph = ConverterGraph(MockConfig.CONVERTERS)
+        self.cgraph.record_conversion(
+            Convert3DGraphicsToImage(),
+            TypeString('STL'), TypeString('PNG'), 10.0,
+        )
+        assert len(self._path()) == 2
+
+
+class TestConverterGraphRoutingTable:
+    CONVERTER_PATHS = [
+        'test.test_converter.%s' % converter.__name__
+        for converter in MockConfig.CONVERTERS
+    ]
+
+    def setup_method(self, method):
+        self.path = os.path.join(tempfile.mkdtemp(), 'routing_table.bin')
+
+    def teardown_method(self, method):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _path(self, in_str, out_str):
+        return self.cgraph.find_path(TypeString(in_str), TypeString(out_str))
+
+    def _settings(self, **kwargs):
+        return use_settings(
+            converters=self.CONVERTER_PATHS,
+            routing_table_path=self.path,
+            **kwargs
+        )
+
+    def test_saves_and_loads_routing_table(self):
+        with self._settings():
+            self.cgraph = ConverterGraph()
+            assert os.path.exists(self.path)
+            expected = self._path('STL', 'thumb.png:200x200')
+
+            self.cgraph = ConverterGraph()
+            assert self.cgraph.converters[('STL', 'PNG')] == \
+                'test.test_converter.Convert3DGraphicsToImage'
+            assert self.cgraph.dgraph.routes  # Using precomputed routes
+            results = self._path('STL', 'thumb.png:200x200')
+            assert results == expected
+            assert results[0][0] is Convert3DGraphicsToImage
+            assert self._path('MKV', 'WEBM')[0][0] is MockVideoDirectConverter
+            assert ConvertMovieToImage in self.cgraph.converter_list
+
+    def test_rebuilds_when_fingerprint_changes(self):
+        with self._settings():
+            ConverterGraph()
+        preferred = [('STL', 'AVI', 'JPG', 'thumb.png')]
+        with self._settings(preferred_conversion_paths=preferred):
+            self.cgraph = ConverterGraph()
+            assert not isinstance(self.cgraph.converters[('STL', 'PNG')], str)
+            assert len(self._path('STL', 'thumb.png')) == 3
+
+            self.cgraph = ConverterGraph()
+            assert isinstance(self.cgraph.converters[('STL', 'PNG')], str)
+            assert len(self._path('STL', 'thumb.png')) == 3
+
+    def test_adaptive_costs_without_importing(self):
+        with self._settings():
+            ConverterGraph()
+        costs_path = os.path.join(tempfile.mkdtemp(), 'costs.json')
+        with self._settings(adaptive_costs=True,
+                            adaptive_costs_path=costs_path):
+            with patch.object(singletons.settings, 'load_path',
+                              side_effect=AssertionError('imported')):
+                self.cgraph = ConverterGraph()
+            assert isinstance(self.cgraph.converters[('STL', 'PNG')], str)
+            assert len(self._path('STL', 'thumb.png')) == 2
+
+    def test_disabled(self):
+        with self._settings(routing_table=False):
+            ConverterGraph()
+        assert not os.path.exists(self.path)
+
+
+class TestConverterAvailability:
+    def setup_method(self, method):
+        self.path = os.path.join(tempfile.mkdtemp(), 'availability.json')
+
+    def teardown_method(self, method):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _settings(self, **kwargs):
+        return use_settings(converter_probe_path=self.path, **kwargs)
+
+    def test_probe(self):
+        availability = ConverterAvailability()
+        availability.probe([
+            AvailableConverter,
+            UnavailableConverter,
+            ExecConverter,
+        ])
+        assert availability.is_available(AvailableConverter)
+        assert not availability.is_available(UnavailableConverter)
+        assert availability.is_available(ExecConverter)
+        assert availability.get_status(ExecConverter).binary.endswith('/mv')
+        assert availability.get_unavailable() == [
+            'test.test_converter.UnavailableConverter',
+        ]
+
+    def test_probe_versions(self):
+        class VersionedConverter(ExecConverter):
+            command = ['echo']
+            version_args = ['echo 1.2.3']
+        availability = ConverterAvailability()
+        availability.probe([VersionedConverter], probe_versions=True)
+        status = availability.get_status(VersionedConverter)
+        assert status.version == 'echo 1.2.3'
+
+    def test_refresh_caches_to_disk(self):
+        with self._settings():
+            availability = ConverterAvailability()
+            availability.refresh([AvailableConverter, UnavailableConverter])
+            assert os.path.exists(self.path)
+
+            loaded = ConverterAvailability()
+            with patch.object(ConverterAvailability, 'probe') as probe:
+                loaded.refresh([AvailableConverter, UnavailableConverter])
+            assert not probe.called
+            assert loaded.is_available(AvailableConverter)
+            assert not loaded.is_available(UnavailableConverter)
+
+    def test_refresh_reprobes_when_stale(self):
+        with self._settings(converter_probe_ttl=0):
+            availability = ConverterAvailability()
+            availability.refresh([AvailableConverter])
+            availability.probed_at -= 1
+            with patch.object(ConverterAvailability, 'probe') as probe:
+                availability.refresh([AvailableConverter])
+            assert probe.called
+
+    def test_refresh_reprobes_when_converters_change(self):
+        with self._settings():
+            availability = ConverterAvailability()
+            availability.refresh([AvailableConverter])
+            availability.refresh([AvailableConverter, UnavailableConverter])
+            assert not availability.is_available(UnavailableConverter)
+
+    def test_refresh_reprobes_when_binary_changes(self):
+        with self._settings():
+            availability = ConverterAvailability()
+            availability.refresh([ExecConverter])
+            status = availability.get_status(ExecConverter)
+            name = 'test.test_converter.ExecConverter'
+            availability.statuses[name] = status._replace(binary_mtime=0)
+            availability.save(self.path)
+            loaded = ConverterAvailability()
+            with patch.object(ConverterAvailability, 'probe') as probe:
+                loaded.refresh([ExecConverter])
+            assert probe.called
+
 
 class TestConverterGraphDirectConverions(ConverterTestBase):
     def test_conversion_normal(self):
@@ -1,3 +1,6 @@
+import shutil
+import tempfile
+
 from omnic import singletons
 
 
@@ -7,15 +10,19 @@ class TestSettingsBuiltinDefaults:
     '''
     @classmethod
     def setup_class(cls):
-        # Ensure no custom settings, except ignoring the system check
+        # Ensure no custom settings, except ignoring the system check and
+        # keeping what is saved (e.g. the routing table) out of the cache
         class config:
             CONVERSION_SYSTEM_CHECK = False
+            PATH_PREFIX = tempfile.mkdtemp(prefix='omnic_test_')
+        cls.path_prefix = config.PATH_PREFIX
         singletons.settings.use_settings(config)
 
     @classmethod
     def teardown_class(cls):
         # Ensure no custom settings
         singletons.settings.use_previous_settings()
+        shutil.rmtree(cls.path_prefix, ignore_errors=True)
 
     def test_default_settings_exist(self):
         s = singletons.settings
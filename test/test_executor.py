@@ -0,0 +1,153 @@
+'''
+Tests for `executor` module.
+'''
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+
+from omnic import singletons
+from omnic.builtin.converters.git import GitLsTreeToJson
+from omnic.config.utils import use_settings
+from omnic.conversion import converter
+from omnic.types.resource import TypedResource
+from omnic.types.typestring import TypeString
+from omnic.worker import tasks
+from omnic.worker.executor import ConverterExecutor
+
+URL = 'http://mocksite.local/file.txt'
+GIT_URL = 'git://mocksite.local/repo.git<%s>' % ('a' * 40)
+
+
+class WhereConverter(converter.Converter):
+    '''
+    Writes where (which process and thread) it ran
+    '''
+
+    def convert_sync(self, in_resource, out_resource):
+        with out_resource.cache_open('w') as fd:
+            json.dump([os.getpid(), threading.get_ident()], fd)
+
+
+class ThreadWhereConverter(WhereConverter):
+    execution = converter.THREAD
+
+
+class ProcessWhereConverter(WhereConverter):
+    execution = converter.PROCESS
+
+
+class SlowConverter(converter.Converter):
+    execution = converter.THREAD
+    running = 0
+    most_running = 0
+    lock = threading.Lock()
+
+    def convert_sync(self, in_resource, out_resource):
+        with self.lock:
+            SlowConverter.running += 1
+            SlowConverter.most_running = max(
+                SlowConverter.running, SlowConverter.most_running)
+        time.sleep(0.05)
+        with self.lock:
+            SlowConverter.running -= 1
+
+
+class TestConverterExecutor:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'converter_threads': 4,
+            'converter_processes': 1,
+        })
+        self.executor = ConverterExecutor()
+        self.in_res = TypedResource(URL, TypeString('txt'))
+        self.out_res = TypedResource(URL, TypeString('json'))
+        self.out_res.cache_makedirs()
+
+    def teardown_method(self, method):
+        self.executor.shutdown()
+        singletons.settings.use_previous_settings()
+
+    async def _where(self, converter_class):
+        await self.executor.convert(
+            converter_class(), self.in_res, self.out_res)
+        with self.out_res.cache_open('r') as fd:
+            return json.load(fd)
+
+    @pytest.mark.asyncio
+    async def test_inline(self):
+        assert await self._where(WhereConverter) == \
+            [os.getpid(), threading.get_ident()]
+        assert self.executor.pools == {}
+
+    @pytest.mark.asyncio
+    async def test_thread(self):
+        pid, thread = await self._where(ThreadWhereConverter)
+        assert pid == os.getpid()
+        assert thread != threading.get_ident()
+        assert list(self.executor.pools) == [converter.THREAD]
+
+    @pytest.mark.asyncio
+    async def test_process(self):
+        pid, thread = await self._where(ProcessWhereConverter)
+        assert pid != os.getpid()
+        assert list(self.executor.pools) == [converter.PROCESS]
+
+    @pytest.mark.asyncio
+    async def test_errors_propagate(self):
+        with pytest.raises(NotImplementedError):
+            await self.executor.convert(
+                converter.Converter(), self.in_res, self.out_res)
+
+
+class TestConcurrencyLimits:
+    async def _run_slow(self, count, **settings):
+        executor = ConverterExecutor()
+        res = TypedResource(URL, TypeString('txt'))
+        SlowConverter.most_running = 0
+        with use_settings(converter_threads=4, **settings):
+            await asyncio.gather(*[
+                executor.convert(SlowConverter(), res, res)
+                for _ in range(count)
+            ])
+        executor.shutdown()
+        return SlowConverter.most_running
+
+    @pytest.mark.asyncio
+    async def test_concurrency(self):
+        assert await self._run_slow(4) > 1
+        assert await self._run_slow(
+            4, converter_concurrency={'thread': 2}) == 2
+        assert await self._run_slow(3, converter_concurrency={
+            'thread': 2,
+            'SlowConverter': 1,
+        }) == 1
+
+
+class TestConverterExecution:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'converter_processes': 1,
+        })
+
+    def teardown_method(self, method):
+        singletons.converter_executor.shutdown()
+        singletons.settings.use_previous_settings()
+
+    @pytest.mark.asyncio
+    async def test_process_converter(self):
+        in_res = TypedResource(GIT_URL, TypeString('GIT'))
+        out_res = TypedResource(GIT_URL, TypeString('git-tree.json'))
+        with in_res.cache_open('w') as fd:
+            fd.write('100644 blob %s 748\tREADME.md\n' % ('b' * 40))
+        await tasks.convert(GitLsTreeToJson(), in_res, out_res)
+        with out_res.cache_open('r') as fd:
+            tree = json.load(fd)
+        assert tree['git_sha'] == 'a' * 40
+        assert [child['path'] for child in tree['children']] == ['README.md']
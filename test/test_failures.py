@@ -0,0 +1,200 @@
+'''
+Tests for `failures` module.
+'''
+import json
+import os
+import tempfile
+import threading
+from unittest.mock import patch
+
+import pytest
+
+from omnic import singletons
+from omnic.conversion import failures
+from omnic.conversion.exceptions import (ConversionInputError,
+                                         ConversionOutputError,
+                                         ConversionProcessError,
+                                         DownloadError)
+from omnic.conversion.failures import NegativeCache
+from omnic.types.resource import (CacheLock, ForeignResource,
+                                  TypedResource, get_lock_path)
+from omnic.types.typestring import TypeString
+from omnic.worker import tasks
+
+URL = 'http://mocksite.local/file.png'
+OTHER_URL = 'http://mocksite.local/other.png'
+
+
+class FailingConverter:
+    async def convert(self, in_resource, out_resource):
+        raise ConversionProcessError('exited with 1')
+
+
+class SilentConverter:
+    async def convert(self, in_resource, out_resource):
+        pass
+
+
+class TestNegativeCache:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+        })
+        self.negative_cache = NegativeCache()
+
+    def teardown_method(self, method):
+        singletons.settings.use_previous_settings()
+
+    def test_record_and_get(self):
+        ts = TypeString('thumb.jpg')
+        assert self.negative_cache.get(URL, ts) is None
+        failure = self.negative_cache.record(
+            URL, ts, ConversionProcessError('exited with 1'),
+            FailingConverter())
+        assert failure.error == 'ConversionProcessError: exited with 1'
+        assert failure.converter == 'FailingConverter'
+        assert failure.status == failures.CONVERSION_FAILED_STATUS
+        assert self.negative_cache.get(URL, ts) == failure
+        assert self.negative_cache.get(URL, TypeString('PNG')) is None
+        assert self.negative_cache.get(OTHER_URL, ts) is None
+
+    def test_download_failure_applies_to_all_types(self):
+        failure = self.negative_cache.record(URL, None, OSError())
+        assert failure.error == 'OSError'
+        assert failure.status == failures.DOWNLOAD_FAILED_STATUS
+        assert self.negative_cache.get(URL, TypeString('thumb.jpg')) == \
+            failure
+        assert self.negative_cache.get(URL, TypeString('PNG')) == failure
+
+    def test_input_failure_status(self):
+        failure = self.negative_cache.record(
+            URL, TypeString('thumb.jpg'), ConversionInputError())
+        assert failure.status == failures.CONVERSION_INPUT_FAILED_STATUS
+
+    def test_expires(self):
+        ts = TypeString('thumb.jpg')
+        self.negative_cache.record(URL, ts, ValueError())
+        with patch('omnic.conversion.failures.time.time') as mock_time:
+            mock_time.return_value = 2 ** 40
+            assert self.negative_cache.get(URL, ts) is None
+            assert self.negative_cache.get_all() == []
+
+    def test_disabled(self):
+        ts = TypeString('thumb.jpg')
+        singletons.settings.use_settings_dict({'negative_cache_ttl': 0})
+        try:
+            assert self.negative_cache.record(URL, ts, ValueError()) is None
+            assert self.negative_cache.get(URL, ts) is None
+        finally:
+            singletons.settings.use_previous_settings()
+
+    def test_clear(self):
+        ts = TypeString('thumb.jpg')
+        self.negative_cache.record(URL, ts, ValueError())
+        self.negative_cache.record(URL, None, ValueError())
+        self.negative_cache.record(OTHER_URL, ts, ValueError())
+        assert len(self.negative_cache.get_all()) == 3
+        assert self.negative_cache.clear(URL) == 2
+        assert self.negative_cache.get(URL, ts) is None
+        assert self.negative_cache.get(OTHER_URL, ts) is not None
+        assert self.negative_cache.clear() == 1
+        assert self.negative_cache.get_all() == []
+
+    def test_shared_between_processes(self):
+        ts = TypeString('thumb.jpg')
+        failure = self.negative_cache.record(URL, ts, ValueError())
+        other_cache = NegativeCache()
+        assert other_cache.get(URL, ts) == failure
+        other_cache.clear()
+        assert self.negative_cache.get(URL, ts) is None
+
+    def test_concurrent_records_kept(self):
+        ts = TypeString('thumb.jpg')
+        other_cache = NegativeCache()
+        assert other_cache.get(URL, ts) is None
+        self.negative_cache.record(URL, ts, ValueError())
+
+        # Even if the other process did not notice the file changed
+        path = self.negative_cache.get_cache_path()
+        other_cache.loaded = (path, os.stat(path).st_mtime_ns)
+        other_cache.record(OTHER_URL, ts, ValueError())
+        assert len(NegativeCache().get_all()) == 2
+
+    def test_waits_while_locked(self):
+        path = self.negative_cache.get_cache_path()
+        lock = CacheLock(get_lock_path(path))
+        assert lock.try_acquire()
+        thread = threading.Thread(
+            target=self.negative_cache.record,
+            args=(URL, None, ValueError()))
+        try:
+            thread.start()
+            thread.join(0.1)
+            assert thread.is_alive()
+            assert not os.path.exists(path)
+        finally:
+            lock.release()
+        thread.join(2)
+        assert NegativeCache().get(URL, None) is not None
+
+    def test_invalid_file(self):
+        path = self.negative_cache.get_cache_path()
+        with open(path, 'w') as fd:
+            json.dump({'version': failures.FORMAT_VERSION + 1}, fd)
+        assert self.negative_cache.get_all() == []
+        with open(path, 'w') as fd:
+            fd.write('not json')
+        assert self.negative_cache.get_all() == []
+
+
+class TestRecordedFailures:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+        })
+        self.in_res = TypedResource(URL, TypeString('PNG'))
+        self.out_res = TypedResource(URL, TypeString('thumb.jpg'))
+
+    def teardown_method(self, method):
+        singletons.negative_cache.clear()
+        singletons.settings.use_previous_settings()
+
+    @pytest.mark.asyncio
+    async def test_conversion_failure(self):
+        with pytest.raises(ConversionProcessError):
+            await tasks.convert(FailingConverter(), self.in_res, self.out_res)
+        failure = singletons.negative_cache.get(URL, self.out_res.typestring)
+        assert failure.converter == 'FailingConverter'
+        assert 'exited with 1' in failure.error
+        assert not self.out_res.cache_exists()
+
+    @pytest.mark.asyncio
+    async def test_no_output(self):
+        with pytest.raises(ConversionOutputError):
+            await tasks.convert(SilentConverter(), self.in_res, self.out_res)
+        failure = singletons.negative_cache.get(URL, self.out_res.typestring)
+        assert failure.converter == 'SilentConverter'
+
+    @pytest.mark.asyncio
+    async def test_failed_input(self):
+        singletons.negative_cache.record(URL, None, OSError())
+        with pytest.raises(ConversionInputError):
+            await tasks.convert(SilentConverter(), self.in_res, self.out_res)
+        failure = singletons.negative_cache.get(URL, self.out_res.typestring)
+        assert failure.status == failures.DOWNLOAD_FAILED_STATUS
+        assert singletons.negative_cache.clear(URL) == 2
+
+    @pytest.mark.asyncio
+    async def test_download_failure(self):
+        foreign_res = ForeignResource(URL)
+
+        async def download(url):
+            pass  # e.g. curl saved nothing
+
+        with patch.object(singletons.resolver_graph, 'download', download):
+            with pytest.raises(DownloadError):
+                await tasks.resolve_foreign_resource(foreign_res)
+        failure = singletons.negative_cache.get(URL, None)
+        assert failure.status == failures.DOWNLOAD_FAILED_STATUS
+        assert 'Nothing was downloaded' in failure.error
+        assert os.path.exists(singletons.negative_cache.get_cache_path())
@@ -0,0 +1,104 @@
+'''
+Tests for `hotcache` module.
+'''
+import os
+import tempfile
+from unittest.mock import patch
+
+from omnic import singletons
+from omnic.types.resource import TypedResource
+from omnic.types.typestring import TypeString
+from omnic.web.hotcache import HotCache
+
+URLS = ['http://mocksite.local/%i.png' % i for i in range(4)]
+
+
+class TestHotCache:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'hot_cache_max_bytes': 30,
+            'hot_cache_max_item_size': 10,
+        })
+        self.hot_cache = HotCache()
+
+    def teardown_method(self, method):
+        singletons.settings.use_previous_settings()
+
+    def _cache(self, url, data=b'x' * 10, ts='thumb.jpg'):
+        res = TypedResource(url, TypeString(ts))
+        with res.cache_open('wb') as fd:
+            fd.write(data)
+        return res
+
+    def test_admit_and_get(self):
+        res = self._cache(URLS[0], b'data')
+        assert self.hot_cache.get(res) is None
+        assert self.hot_cache.admit(res) == b'data'
+        os.unlink(res.cache_path)  # Served without disk I/O
+        assert self.hot_cache.get(res) == b'data'
+        assert self.hot_cache.get(TypedResource(URLS[0], TypeString('PNG'))) \
+            is None
+
+    def test_too_large_item(self):
+        res = self._cache(URLS[0], b'x' * 11)
+        assert self.hot_cache.admit(res) is None
+        assert self.hot_cache.get(res) is None
+        assert self.hot_cache.size == 0
+
+    def test_not_cached_or_directory(self):
+        res = TypedResource(URLS[0], TypeString('thumb.jpg'))
+        assert self.hot_cache.admit(res) is None
+        res.cache_makedirs(subdir='')
+        assert self.hot_cache.admit(res) is None
+
+    def test_evicts_least_recently_used(self):
+        resources = [self._cache(url) for url in URLS]
+        for res in resources[:3]:
+            self.hot_cache.admit(res)
+        self.hot_cache.get(resources[0])
+        self.hot_cache.admit(resources[3])
+        assert self.hot_cache.size == 30
+        cached = [self.hot_cache.get(res) is not None for res in resources]
+        assert cached == [True, False, True, True]
+
+    def test_readmit(self):
+        res = self._cache(URLS[0], b'old')
+        self.hot_cache.admit(res)
+        self._cache(URLS[0], b'new data')
+        self.hot_cache.admit(res)
+        assert self.hot_cache.get(res) == b'new data'
+        assert self.hot_cache.size == 8
+
+    def test_disabled(self):
+        singletons.settings.use_settings_dict({'hot_cache_max_bytes': 0})
+        try:
+            res = self._cache(URLS[0])
+            assert self.hot_cache.admit(res) is None
+            assert self.hot_cache.get(res) is None
+        finally:
+            singletons.settings.use_previous_settings()
+
+    def test_invalidate(self):
+        res = self._cache(URLS[0])
+        self.hot_cache.admit(res)
+        self.hot_cache.invalidate(res)
+        assert self.hot_cache.get(res) is None
+        assert self.hot_cache.size == 0
+
+    def test_invalidate_path(self):
+        res = self._cache(URLS[0])
+        other_res = self._cache(URLS[1])
+        self.hot_cache.admit(res)
+        self.hot_cache.admit(other_res)
+        self.hot_cache.invalidate_path(res.cache_path_base)
+        assert self.hot_cache.get(res) is None
+        assert self.hot_cache.get(other_res) is not None
+
+    def test_revalidated(self):
+        res = self._cache(URLS[0])
+        self.hot_cache.admit(res)
+        os.unlink(res.cache_path)  # e.g. cleared by another process
+        with patch('omnic.web.hotcache.REVALIDATE_INTERVAL', -1):
+            assert self.hot_cache.get(res) is None
+        assert self.hot_cache.size == 0
@@ -0,0 +1,229 @@
+'''
+Tests for `httpcache` module.
+'''
+import os
+import tempfile
+from unittest.mock import MagicMock, call, patch
+
+import pytest
+
+from omnic import singletons
+from omnic.config.utils import use_settings
+from omnic.types.resource import TypedResource
+from omnic.types.resourceurl import ResourceURL
+from omnic.types.typestring import TypeString
+from omnic.utils.asynctools import CoroutineMock
+from omnic.web import httpcache
+from omnic.web.hotcache import HotItem
+
+SHA = '8a192e251273a68091042fc169a604ce6bb5d868'
+URL = 'http://mocksite.local/file.png'
+GIT_URL = 'git://github.com/michaelpb/omnic-zoo.git<%s>' % SHA
+
+MTIME_NS = 1500000000 * 10 ** 9
+ETAG = httpcache.get_etag(MTIME_NS, 4)
+LAST_MODIFIED = 'Fri, 14 Jul 2017 02:40:00 GMT'
+
+
+class TestValidators:
+    def test_etag(self):
+        assert ETAG == '"14d1120d7b160000-4"'
+        assert httpcache.get_etag(MTIME_NS + 1, 4) != ETAG
+        assert httpcache.get_etag(MTIME_NS, 5) != ETAG
+
+    def test_http_dates(self):
+        assert httpcache.format_http_date(1500000000) == LAST_MODIFIED
+        assert httpcache.parse_http_date(LAST_MODIFIED) == 1500000000
+        assert httpcache.parse_http_date('Friday') is None
+        assert httpcache.parse_http_date('') is None
+
+    def test_not_conditional(self):
+        assert not httpcache.is_not_modified(None, ETAG, 1500000000)
+        assert not httpcache.is_not_modified({}, ETAG, 1500000000)
+
+    def test_if_none_match(self):
+        def check(value):
+            headers = {'If-None-Match': value}
+            return httpcache.is_not_modified(headers, ETAG, 1500000000)
+        assert check(ETAG)
+        assert check('W/' + ETAG)
+        assert check('"other", %s' % ETAG)
+        assert check('*')
+        assert not check('"other"')
+
+        # Takes precedence over If-Modified-Since
+        assert not httpcache.is_not_modified({
+            'If-None-Match': '"other"',
+            'If-Modified-Since': LAST_MODIFIED,
+        }, ETAG, 1500000000)
+
+    def test_if_modified_since(self):
+        def check(value):
+            headers = {'If-Modified-Since': value}
+            return httpcache.is_not_modified(headers, ETAG, 1500000000)
+        assert check(LAST_MODIFIED)
+        assert check('Sat, 15 Jul 2017 00:00:00 GMT')
+        assert not check('Thu, 13 Jul 2017 00:00:00 GMT')
+        assert not check('invalid')
+
+
+class TestCacheControl:
+    def _get(self, url, ts):
+        return httpcache.get_cache_control(TypedResource(url, TypeString(ts)))
+
+    def test_immutable(self):
+        assert httpcache.is_immutable(ResourceURL(GIT_URL))
+        assert not httpcache.is_immutable(
+            ResourceURL('git://github.com/michaelpb/omnic-zoo.git'))
+        assert not httpcache.is_immutable(ResourceURL('%s<%s>' % (URL, SHA)))
+
+    @use_settings(cache_control={
+        'thumb.jpg:20x20': 'per typestring',
+        'thumb.jpg': 'per format',
+        '*': 'default',
+    })
+    def test_per_typestring(self):
+        assert self._get(URL, 'thumb.jpg:20x20') == 'per typestring'
+        assert self._get(URL, 'thumb.jpg:40x40') == 'per format'
+        assert self._get(URL, 'PNG') == 'default'
+        assert self._get(GIT_URL, 'min.js') == \
+            singletons.settings.CACHE_CONTROL_IMMUTABLE
+
+    @use_settings(cache_control={'PNG': 'public'})
+    def test_no_default(self):
+        assert self._get(URL, 'PNG') == 'public'
+        assert self._get(URL, 'JPEG') is None
+
+    @use_settings(cache_control_placeholder=None)
+    def test_no_uncached_headers(self):
+        assert httpcache.get_uncached_headers() == {}
+
+    def test_uncached_headers(self):
+        assert httpcache.get_uncached_headers() == {
+            'Cache-Control': 'no-store',
+        }
+
+
+class TestCachedResponse:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'cache_control': {'*': 'public'},
+        })
+        self.resource = TypedResource(URL, TypeString('thumb.jpg'))
+        with self.resource.cache_open('wb') as fd:
+            fd.write(b'data')
+        os.utime(self.resource.cache_path, ns=(MTIME_NS, MTIME_NS))
+        self.response = MagicMock()
+        self.response.file = CoroutineMock()
+        patcher = patch('omnic.web.httpcache.singletons')
+        self.singletons = patcher.start()
+        self.singletons.settings = singletons.settings
+        self.singletons.server.response = self.response
+        self.patcher = patcher
+
+    def teardown_method(self, method):
+        self.patcher.stop()
+        singletons.settings.use_previous_settings()
+
+    def _use_settings(self, **kwargs):
+        settings = singletons.settings
+        return use_settings(path_prefix=settings.PATH_PREFIX,
+                            cache_control=settings.CACHE_CONTROL, **kwargs)
+
+    async def _respond(self, request_headers, hot_item=None):
+        return await httpcache.cached_response(
+            request_headers, self.resource, 'image/jpeg', hot_item)
+
+    def _headers(self):
+        return {
+            'ETag': ETAG,
+            'Last-Modified': LAST_MODIFIED,
+            'Accept-Ranges': 'bytes',
+            'Cache-Control': 'public',
+        }
+
+    @pytest.mark.asyncio
+    async def test_file(self):
+        await self._respond({})
+        headers = self._headers()
+        headers['Content-Type'] = 'image/jpeg'
+        self.response.file.assert_called_once_with(
+            self.resource.cache_path, headers=headers)
+
+    @pytest.mark.asyncio
+    async def test_hot_item(self):
+        await self._respond({}, HotItem(b'data', MTIME_NS))
+        self.response.raw.assert_called_once_with(
+            b'data', headers=self._headers(), content_type='image/jpeg')
+
+    @pytest.mark.asyncio
+    async def test_not_modified(self):
+        for hot_item in (None, HotItem(b'data', MTIME_NS)):
+            self.response.raw.reset_mock()
+            await self._respond({'If-None-Match': ETAG}, hot_item)
+            self.response.raw.assert_called_once_with(
+                b'', status=304, headers=self._headers())
+        assert self.response.file.mock_calls == []
+
+    @pytest.mark.asyncio
+    async def test_not_cached(self):
+        self.resource.cache_remove()
+        with pytest.raises(FileNotFoundError):
+            await self._respond({})
+
+    @pytest.mark.asyncio
+    async def test_range(self):
+        for hot_item in (None, HotItem(b'data', MTIME_NS)):
+            self.response.raw.reset_mock()
+            await self._respond({'Range': 'bytes=1-2'}, hot_item)
+            headers = self._headers()
+            headers['Content-Range'] = 'bytes 1-2/4'
+            self.response.raw.assert_called_once_with(
+                b'at', status=206, headers=headers, content_type='image/jpeg')
+
+    @pytest.mark.asyncio
+    async def test_range_not_satisfiable(self):
+        await self._respond({'Range': 'bytes=4-'})
+        headers = self._headers()
+        headers['Content-Range'] = 'bytes */4'
+        self.response.raw.assert_called_once_with(
+            b'', status=416, headers=headers)
+
+    @pytest.mark.asyncio
+    async def test_range_ignored(self):
+        await self._respond({'Range': 'bytes=1-2', 'If-Range': '"old"'},
+                            HotItem(b'data', MTIME_NS))
+        await self._respond({'Range': 'invalid'}, HotItem(b'data', MTIME_NS))
+        assert self.response.raw.mock_calls == [
+            call(b'data', headers=self._headers(), content_type='image/jpeg'),
+        ] * 2
+
+    @pytest.mark.asyncio
+    async def test_sendfile(self):
+        with self._use_settings(sendfile_header='X-Accel-Redirect'):
+            await self._respond({})
+            headers = self._headers()
+            headers['X-Accel-Redirect'] = self.resource.cache_path
+            self.response.raw.assert_called_once_with(
+                b'', headers=headers, content_type='image/jpeg')
+
+        with self._use_settings(sendfile_header='X-Accel-Redirect',
+                                sendfile_prefix='/cache/'):
+            assert httpcache.get_sendfile_path(self.resource.cache_path) \
+                == '/cache/' + os.path.relpath(
+                    self.resource.cache_path, singletons.settings.PATH_PREFIX)
+
+    @pytest.mark.asyncio
+    async def test_streamed(self):
+        with self._use_settings(file_stream_threshold=3,
+                                file_stream_chunk_size=3):
+            await self._respond({})
+        assert self.response.file.mock_calls == []
+        args, kwargs = self.response.stream.call_args
+        assert kwargs == {'headers': self._headers(),
+                          'content_type': 'image/jpeg'}
+        streaming_response = MagicMock()
+        await args[0](streaming_response)
+        assert streaming_response.write.mock_calls == [
+            call(b'dat'), call(b'a')]
@@ -0,0 +1,191 @@
+'''
+Tests for `janitor` module.
+'''
+import os
+import tempfile
+import time
+from unittest.mock import patch
+
+import pytest
+
+from omnic import singletons
+from omnic.types import content
+from omnic.types.resource import ForeignResource, TypedResource
+from omnic.types.typestring import TypeString
+from omnic.worker.janitor import CacheJanitor
+
+URLS = ['http://mocksite.local/%i.png' % i for i in range(4)]
+HOUR = 60 * 60
+
+
+class TestCacheJanitor:
+    def setup_method(self, method):
+        self.prefix = tempfile.mkdtemp(prefix='omnic_test_')
+        self._use_settings()
+        self.janitor = CacheJanitor()
+
+    def teardown_method(self, method):
+        singletons.settings.use_previous_settings()
+
+    def _use_settings(self, **kwargs):
+        kwargs.setdefault('path_prefix', self.prefix)
+        singletons.settings.use_settings_dict(kwargs)
+
+    def _cache(self, url, hours_ago, size=100):
+        foreign = ForeignResource(url)
+        typed = TypedResource(url, TypeString('thumb.jpg'))
+        for res in (foreign, typed):
+            with res.cache_open('wb') as fd:
+                fd.write(b'x' * size)
+        used = time.time() - hours_ago * HOUR
+        for path in (foreign.cache_path, typed.cache_path,
+                     foreign.cache_path_base):
+            os.utime(path, (used, used))
+        return foreign
+
+    def _cached(self):
+        return [ForeignResource(url).cache_exists() for url in URLS]
+
+    def test_entries(self):
+        self._cache(URLS[0], 1)
+        self._cache(URLS[1], 2)
+        entries = sorted(self.janitor.get_entries())
+        assert len(entries) == 2
+        paths = {ForeignResource(url).cache_path_base for url in URLS[:2]}
+        assert {entry.path for entry in entries} == paths
+        assert all(entry.size == 200 for entry in entries)
+
+    def test_disabled_by_default(self):
+        for i, url in enumerate(URLS):
+            self._cache(url, i + 1)
+        assert not self.janitor.is_enabled()
+        assert self.janitor.collect() == []
+        assert all(self._cached())
+
+    def test_evicts_least_recently_used(self):
+        for i, url in enumerate(URLS):
+            self._cache(url, i + 1)
+        self._use_settings(cache_high_watermark=700, cache_low_watermark=400)
+        evicted = self.janitor.collect()
+        assert len(evicted) == 2
+        assert self._cached() == [True, True, False, False]
+        assert not TypedResource(URLS[3], TypeString('thumb.jpg')) \
+            .cache_exists()
+        assert self.janitor.stats_evicted_bytes == 400
+
+    def test_below_high_watermark(self):
+        for i, url in enumerate(URLS):
+            self._cache(url, i + 1)
+        self._use_settings(cache_high_watermark=800, cache_low_watermark=100)
+        assert self.janitor.collect() == []
+        assert all(self._cached())
+
+    def test_free_disk_watermarks(self):
+        for i, url in enumerate(URLS):
+            self._cache(url, i + 1)
+        self._use_settings(cache_free_low_watermark=1000,
+                           cache_free_high_watermark=1300)
+        free_bytes = [900]
+
+        def get_free_bytes():
+            return free_bytes[0] + 200 * (4 - sum(self._cached()))
+        with patch.object(self.janitor, 'get_free_bytes', get_free_bytes):
+            self.janitor.collect()
+        assert self._cached() == [True, True, False, False]
+
+    def test_recently_used_not_evicted(self):
+        self._cache(URLS[0], 0)
+        self._cache(URLS[1], 2)
+        self._use_settings(cache_high_watermark=1)
+        self.janitor.collect()
+        assert self._cached() == [True, False, False, False]
+
+    @pytest.mark.asyncio
+    async def test_locked_not_evicted(self):
+        self._cache(URLS[0], 1)
+        self._cache(URLS[1], 2)
+        self._use_settings(cache_high_watermark=1)
+        res = TypedResource(URLS[1], TypeString('thumb.jpg'))
+        async with res.cache_lock():
+            self.janitor.collect()
+        assert self._cached() == [False, True, False, False]
+
+    @pytest.mark.asyncio
+    async def test_being_written_not_evicted(self):
+        self._cache(URLS[0], 1)
+        self._use_settings(cache_high_watermark=1)
+        res = TypedResource(URLS[0], TypeString('min.js'))
+        async with res.cache_entry_lock():  # As held by cache_write
+            self.janitor.collect()
+        assert self._cached()[0]
+
+    @pytest.mark.asyncio
+    async def test_lock_files_removed(self):
+        self._use_settings(path_grouping=None, cache_high_watermark=1)
+        res = TypedResource(URLS[0], TypeString('thumb.jpg'))
+        async with res.cache_entry_lock(), res.cache_lock():
+            pass  # As left behind by cache_write
+        self._cache(URLS[0], 1)
+        self.janitor.collect()
+        assert self._cached()[0] is False
+        dirname = os.path.dirname(res.cache_path)
+        assert os.listdir(dirname) == []
+
+    def test_partially_written_not_evicted(self):
+        self._cache(URLS[0], 1)
+        self._use_settings(cache_high_watermark=1)
+        res = TypedResource(URLS[0], TypeString('min.js'))
+        res.cache_partial()
+        self.janitor.collect()
+        assert self._cached()[0]
+
+    def test_without_path_grouping(self):
+        self._use_settings(path_grouping=None, cache_high_watermark=200)
+        for i, url in enumerate(URLS[:2]):
+            self._cache(url, i + 1)
+        assert len(self.janitor.get_entries()) == 4
+        self.janitor.collect()
+        assert self._cached() == [True, False, False, False]
+
+    def test_touch(self):
+        foreign = self._cache(URLS[0], 1)
+        before = os.stat(foreign.cache_path_base).st_mtime
+        self.janitor.touch(TypedResource(URLS[0], TypeString('thumb.jpg')))
+        touched = os.stat(foreign.cache_path_base).st_mtime
+        assert touched > before + HOUR / 2
+
+        # Only recorded again after a while
+        os.utime(foreign.cache_path_base, (before, before))
+        self.janitor.touch(foreign)
+        assert os.stat(foreign.cache_path_base).st_mtime == before
+
+    def test_touch_without_path_grouping(self):
+        self._use_settings(path_grouping=None)
+        foreign = self._cache(URLS[0], 1)
+        before = os.stat(foreign.cache_path).st_mtime
+        self.janitor.touch(foreign)
+        assert os.stat(foreign.cache_path).st_mtime > before + HOUR / 2
+
+    def test_touch_not_cached(self):
+        self.janitor.touch(ForeignResource(URLS[0]))
+
+    @pytest.mark.asyncio
+    async def test_run_disabled(self):
+        await self.janitor.run()  # Returns right away
+
+    def test_content_entries(self):
+        foreign = self._cache(URLS[0], 1)
+        content.store_download(foreign)
+        self._use_settings(content_addressed=True)
+        paths = {entry.path for entry in self.janitor.get_entries()}
+        content_path = os.path.realpath(foreign.cache_path)
+        assert os.path.dirname(content_path) in paths
+        assert foreign.cache_path_base in paths
+
+    def test_evicted_from_memory(self):
+        self._cache(URLS[0], 1)
+        self._use_settings(cache_high_watermark=1)
+        res = TypedResource(URLS[0], TypeString('thumb.jpg'))
+        assert singletons.hot_cache.admit(res) is not None
+        self.janitor.collect()
+        assert singletons.hot_cache.get(res) is None
@@ -0,0 +1,253 @@
+'''
+Tests for `jobs` module.
+'''
+import asyncio
+import tempfile
+from unittest.mock import patch
+
+import pytest
+
+from omnic import singletons
+from omnic.conversion import converter
+from omnic.types.resource import (ForeignResource, TypedForeignResource,
+                                  TypedResource)
+from omnic.types.typestring import TypeString
+from omnic.worker.jobs import ConversionJob, Job
+from omnic.worker.manager import WorkerManager
+
+URL = 'http://mocksite.local/file.png'
+
+
+class TestJob:
+    def setup_method(self, method):
+        self.events = []
+
+    async def _step(self, name, seconds=0.02, error=None):
+        self.events.append(('start', name))
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+        self.events.append(('end', name))
+        return name
+
+    @pytest.mark.asyncio
+    async def test_waits_on_predecessors(self):
+        job = Job()
+        first = job.add(self._step, 'first')
+        second = job.add(self._step, 'second', after=[first])
+        job.add(self._step, 'third', after=[first, second])
+        await job.run()
+        assert self.events == [
+            ('start', 'first'), ('end', 'first'),
+            ('start', 'second'), ('end', 'second'),
+            ('start', 'third'), ('end', 'third'),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_independent_in_parallel(self):
+        job = Job()
+        job.add(self._step, 'a')
+        job.add(self._step, 'b')
+        await job.run()
+        assert self.events[:2] == [('start', 'a'), ('start', 'b')]
+
+    @pytest.mark.asyncio
+    async def test_failure_propagates(self):
+        job = Job()
+        first = job.add(self._step, 'first', 0.02, ValueError('failed'))
+        job.add(self._step, 'second', after=[first])
+        job.add(self._step, 'unrelated')
+        with pytest.raises(ValueError):
+            await job.run()
+        assert ('start', 'second') not in self.events
+        assert ('end', 'unrelated') in self.events
+
+    @pytest.mark.asyncio
+    async def test_steps_added_while_running(self):
+        job = Job()
+
+        async def plan():
+            await asyncio.sleep(0.01)
+            job.add(self._step, 'added')
+        job.add(plan)
+        await job.run()
+        assert ('end', 'added') in self.events
+
+
+class RecordingConverter(converter.Converter):
+    '''
+    Records when it ran, and whether its input was ready by then
+    '''
+    events = []
+
+    def __init__(self, error=None):
+        super().__init__()
+        self.error = error
+
+    async def convert(self, in_resource, out_resource):
+        name = str(out_resource.typestring)
+        ready = in_resource.cache_exists()
+        RecordingConverter.events.append(('start', name, ready))
+        await asyncio.sleep(0.02)
+        if self.error is not None:
+            raise self.error
+        with out_resource.cache_open('wb') as fd:
+            fd.write(b'converted')
+        RecordingConverter.events.append(('end', name, ready))
+
+
+class TestConversionJob:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'workers': 2,
+        })
+        self.workers = singletons.workers
+        self.original_workers = list(self.workers)
+        self.workers.clear()
+        self.workers.extend(WorkerManager())
+        RecordingConverter.events = []
+        self.downloads = []
+        self.patchers = [
+            patch('omnic.worker.tasks.resolve_foreign_resource',
+                  new=self._download),
+            patch('omnic.worker.tasks.plan_conversion',
+                  new=self._plan_conversion),
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.error = None
+
+    def teardown_method(self, method):
+        for patcher in self.patchers:
+            patcher.stop()
+        singletons.negative_cache.clear()
+        self.workers.clear()
+        self.workers.extend(self.original_workers)
+        singletons.settings.use_previous_settings()
+
+    async def _download(self, foreign_res):
+        await asyncio.sleep(0.02)
+        with foreign_res.cache_open('wb') as fd:
+            fd.write(b'input')
+        self.downloads.append(foreign_res)
+
+    def _plan_conversion(self, url_string, to_type, custom_profiles=None):
+        # PNG -> JPG -> thumb.jpg, and PNG -> thumb.png
+        def _res(ts, cls=TypedResource):
+            return cls(url_string, TypeString(ts))
+        return [
+            (RecordingConverter(self.error),
+             _res('PNG', TypedForeignResource), _res('JPG')),
+            (RecordingConverter(), _res('JPG'), _res('thumb.jpg:10x10')),
+            (RecordingConverter(),
+             _res('PNG', TypedForeignResource), _res('thumb.png:10x10')),
+        ]
+
+    async def _run_job(self, *args):
+        future = asyncio.ensure_future(self.workers.gather_run())
+        try:
+            await asyncio.wait_for(
+                self.workers.enqueue_job(ConversionJob(*args)), 2)
+        finally:
+            future.cancel()
+
+    def _started(self):
+        return [event[1] for event in RecordingConverter.events
+                if event[0] == 'start']
+
+    @pytest.mark.asyncio
+    async def test_steps_in_dependency_order(self):
+        targets = ['thumb.jpg:10x10', 'thumb.png:10x10']
+        await self._run_job(URL, targets)
+        assert self.downloads == [ForeignResource(URL)]
+        assert sorted(self._started()) == \
+            ['JPG', 'thumb.jpg:10x10', 'thumb.png:10x10']
+
+        # Each step ran once its input was ready
+        events = RecordingConverter.events
+        assert all(ready for _, _, ready in events)
+        assert events.index(('end', 'JPG', True)) < \
+            events.index(('start', 'thumb.jpg:10x10', True))
+
+        # Independent steps ran in parallel
+        assert self._started()[:2] in (
+            ['JPG', 'thumb.png:10x10'], ['thumb.png:10x10', 'JPG'])
+        for ts in targets:
+            assert TypedResource(URL, TypeString(ts)).cache_exists()
+
+    @pytest.mark.asyncio
+    async def test_steps_routed_by_url(self):
+        picked = []
+        enqueue = self.workers._enqueue
+
+        async def _enqueue(worker, task_type, args, key=None, done=None):
+            picked.append((key, worker))
+            await enqueue(worker, task_type, args, key=key, done=done)
+        with patch.object(self.workers, '_enqueue', _enqueue):
+            await self._run_job(URL, ['thumb.jpg:10x10', 'thumb.png:10x10'])
+        assert len(picked) == 4
+        assert {worker for key, worker in picked} == \
+            {self.workers.pick_sticky(URL)}
+
+        # Keyed by output, such that they may be stolen by other workers
+        assert len({key for key, worker in picked}) == 4
+
+    @pytest.mark.asyncio
+    async def test_no_download_when_downloaded(self):
+        with ForeignResource(URL).cache_open('wb') as fd:
+            fd.write(b'input')
+        await self._run_job(URL, 'thumb.jpg:10x10')
+        assert self.downloads == []
+        assert len(self._started()) == 3
+
+    @pytest.mark.asyncio
+    async def test_runs_again_once_evicted(self):
+        targets = ['thumb.jpg:10x10', 'thumb.png:10x10']
+        await self._run_job(URL, targets)
+        outputs = [TypedResource(URL, TypeString(ts))
+                   for ts in ['JPG'] + targets]
+        for out_res in outputs:
+            out_res.cache_remove()
+        await self._run_job(URL, targets)
+        assert len(self._started()) == 6
+        assert all(out_res.cache_exists() for out_res in outputs)
+
+    @pytest.mark.asyncio
+    async def test_failure_skips_dependents(self):
+        self.error = ValueError('failed')
+        with pytest.raises(ValueError):
+            await self._run_job(URL, 'thumb.jpg:10x10')
+        assert 'thumb.jpg:10x10' not in self._started()
+        assert 'thumb.png:10x10' in self._started()
+        assert self.workers.jobs == {}
+
+        # Recorded as failed too, such that it is not requested again
+        failure = singletons.negative_cache.get(URL, 'thumb.jpg:10x10')
+        assert failure is not None
+        assert failure.error == \
+            'ConversionInputError: Input failed: ValueError: failed'
+        assert failure.converter == 'RecordingConverter'
+        assert singletons.negative_cache.get(URL, 'thumb.png:10x10') is None
+
+    @pytest.mark.asyncio
+    async def test_failure_recorded_for_targets(self):
+        targets = ['thumb.jpg:10x10', 'thumb.png:10x10']
+        error = ValueError('undetectable')
+        with patch('omnic.worker.tasks.plan_conversion', side_effect=error):
+            with pytest.raises(ValueError):
+                await self._run_job(URL, targets)
+        for ts in targets:
+            failure = singletons.negative_cache.get(URL, ts)
+            assert failure.error == 'ValueError: undetectable'
+        assert singletons.negative_cache.get(URL, 'JPG') is None
+
+    @pytest.mark.asyncio
+    async def test_same_job_started_once(self):
+        first = self.workers.enqueue_job(ConversionJob(URL, 'thumb.jpg'))
+        second = self.workers.enqueue_job(ConversionJob(URL, 'thumb.jpg'))
+        third = self.workers.enqueue_job(ConversionJob(URL, 'thumb.png'))
+        assert first is second
+        assert first is not third
+        for future in (first, third):
+            future.cancel()
@@ -0,0 +1,176 @@
+'''
+Tests for `ranges` module.
+'''
+import asyncio
+import os
+import tempfile
+from unittest.mock import MagicMock
+
+import pytest
+
+from omnic.web import ranges
+
+DATA = b'0123456789'
+
+
+def _iter_range(start, end):
+    yield DATA[start:end]
+
+
+class TestParseRange:
+    def test_single(self):
+        assert ranges.parse_range('bytes=0-4', 10) == [(0, 5)]
+        assert ranges.parse_range('bytes=5-', 10) == [(5, 10)]
+        assert ranges.parse_range('bytes=-3', 10) == [(7, 10)]
+        assert ranges.parse_range('bytes=-30', 10) == [(0, 10)]
+        assert ranges.parse_range('bytes=8-30', 10) == [(8, 10)]
+
+    def test_multiple(self):
+        assert ranges.parse_range('bytes=0-1, 4-5,-2', 10) == \
+            [(0, 2), (4, 6), (8, 10)]
+        assert ranges.parse_range('bytes=0-1,20-30', 10) == [(0, 2)]
+
+    def test_ignored(self):
+        for value in ('bytes=', 'bytes=-', 'bytes=5-4', 'bytes=a-b',
+                      'bytes=1-2-3', 'items=0-4', 'bytes=+1-2', '0-4'):
+            assert ranges.parse_range(value, 10) is None
+        too_many = 'bytes=' + ','.join(['0-1'] * (ranges.MAX_RANGES + 1))
+        assert ranges.parse_range(too_many, 10) is None
+
+    def test_not_satisfiable(self):
+        for value in ('bytes=10-', 'bytes=20-30', 'bytes=-0'):
+            with pytest.raises(ranges.RangeNotSatisfiable):
+                ranges.parse_range(value, 10)
+        with pytest.raises(ranges.RangeNotSatisfiable):
+            ranges.parse_range('bytes=-5', 0)
+
+
+class TestIfRange:
+    ETAG = '"abc-4"'
+    LAST_MODIFIED = 'Fri, 14 Jul 2017 02:40:00 GMT'
+
+    def _check(self, if_range):
+        headers = {'Range': 'bytes=0-1'}
+        if if_range is not None:
+            headers['If-Range'] = if_range
+        return ranges.is_range_fresh(headers, self.ETAG, self.LAST_MODIFIED)
+
+    def test_if_range(self):
+        assert self._check(None)
+        assert self._check(self.ETAG)
+        assert self._check(self.LAST_MODIFIED)
+        assert not self._check('W/' + self.ETAG)
+        assert not self._check('"other"')
+        assert not self._check('Thu, 13 Jul 2017 00:00:00 GMT')
+
+
+class TestPartialResponse:
+    def setup_method(self, method):
+        self.response = MagicMock()
+
+    def _respond(self, byte_ranges, stream_threshold=100):
+        return ranges.partial_response(
+            self.response, byte_ranges, len(DATA), 'text/plain',
+            {'ETag': '"x"'}, _iter_range, stream_threshold)
+
+    def test_single(self):
+        self._respond([(2, 5)])
+        self.response.raw.assert_called_once_with(
+            b'234', status=206, content_type='text/plain', headers={
+                'ETag': '"x"',
+                'Content-Range': 'bytes 2-4/10',
+            })
+
+    def test_multiple(self):
+        self._respond([(0, 2), (8, 10)])
+        args, kwargs = self.response.raw.call_args
+        content_type = kwargs['content_type']
+        assert content_type.startswith('multipart/byteranges; boundary=')
+        boundary = content_type.partition('boundary=')[2]
+        assert args[0] == (
+            '--{0}\r\n'
+            'Content-Type: text/plain\r\n'
+            'Content-Range: bytes 0-1/10\r\n'
+            '\r\n'
+            '01\r\n'
+            '--{0}\r\n'
+            'Content-Type: text/plain\r\n'
+            'Content-Range: bytes 8-9/10\r\n'
+            '\r\n'
+            '89\r\n'
+            '--{0}--\r\n'
+        ).format(boundary).encode('latin-1')
+        assert kwargs['status'] == 206
+        assert 'Content-Range' not in kwargs['headers']
+
+    @pytest.mark.asyncio
+    async def test_streamed(self):
+        self._respond([(2, 5)], stream_threshold=2)
+        assert self.response.raw.mock_calls == []
+        args, kwargs = self.response.stream.call_args
+        assert kwargs['status'] == 206
+        assert kwargs['headers']['Content-Range'] == 'bytes 2-4/10'
+
+        streaming_response = MagicMock()
+        await args[0](streaming_response)
+        streaming_response.write.assert_called_once_with(b'234')
+
+
+class TestStreamChunks:
+    def setup_method(self, method):
+        self.events = []
+
+    def _chunks(self, count):
+        for i in range(count):
+            self.events.append(('read', i))
+            yield b'%i' % i
+
+    async def _stream(self, streaming_response, count=3):
+        response = MagicMock()
+        ranges.stream_chunks(response, self._chunks(count))
+        args, kwargs = response.stream.call_args
+        await args[0](streaming_response)
+
+    @pytest.mark.asyncio
+    async def test_waits_on_client(self):
+        class StreamingResponse:
+            async def write(response, chunk):
+                self.events.append(('write', chunk))
+                await asyncio.sleep(0.01)  # A slow client
+                self.events.append(('written', chunk))
+        await self._stream(StreamingResponse())
+        assert self.events == [
+            ('read', 0), ('write', b'0'), ('written', b'0'),
+            ('read', 1), ('write', b'1'), ('written', b'1'),
+            ('read', 2), ('write', b'2'), ('written', b'2'),
+        ]
+
+    @pytest.mark.asyncio
+    async def test_incremental(self):
+        async def tick():
+            while True:
+                self.events.append('tick')
+                await asyncio.sleep(0)
+        streaming_response = MagicMock()
+        streaming_response.write.side_effect = \
+            lambda chunk: self.events.append(('write', chunk))
+        ticker = asyncio.ensure_future(tick())
+        await self._stream(streaming_response)
+        ticker.cancel()
+
+        # Other tasks ran between reading and writing any two chunks
+        writes = [i for i, event in enumerate(self.events)
+                  if event[0] == 'write']
+        assert len(writes) == 3
+        for before, after in zip(writes, writes[1:]):
+            assert 'tick' in self.events[before:after]
+
+
+class TestIterFileRange:
+    def test_chunks(self):
+        path = os.path.join(tempfile.mkdtemp(), 'data')
+        with open(path, 'wb') as fd:
+            fd.write(DATA)
+        assert list(ranges.iter_file_range(path, 1, 8, 3)) == \
+            [b'123', b'456', b'7']
+        assert list(ranges.iter_file_range(path, 8, 20, 3)) == [b'89']
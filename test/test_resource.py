@@ -1,8 +1,10 @@
 '''
 Tests for `resource` module.
 '''
+import asyncio
 import hashlib
 import os
+import shutil
 import tempfile
 from unittest.mock import call, patch
 
@@ -12,8 +14,9 @@ import requests_mock
 from omnic import singletons
 from omnic.config.exceptions import ConfigurationError
 from omnic.config.utils import use_settings
-from omnic.types.resource import (CacheError, ForeignBytesResource,
-                                  ForeignResource, TypedResource, URLError)
+from omnic.types.resource import (ENTRY_LOCK_SUFFIX, CacheError, CacheLock,
+                                  ForeignBytesResource, ForeignResource,
+                                  TypedResource, URLError, get_lock_path)
 from omnic.types.typestring import TypeString
 
 from .testing_utils import Magic, rm_tmp_files
@@ -175,6 +178,30 @@ class TestTypedResource:
         ])
         assert len(paths) == 5
 
+    def test_compact(self):
+        assert not hasattr(self.res, '__dict__')
+        with pytest.raises(AttributeError):
+            self.res.made_up_attribute = True
+
+    def test_hash(self):
+        res = TypedResource(URL, TypeString('image/gif'))
+        assert hash(res) == hash(self.res)
+        assert res == self.res
+        assert hash(res) != hash(TypedResource(URL, TypeString('image/png')))
+
+    def test_cache_paths_memoized(self):
+        res = TypedResource(URL, TypeString('image/gif'))
+        with patch('omnic.types.resource.os.path.join') as join:
+            res2 = TypedResource(URL, TypeString('image/gif'))
+        assert not join.called
+        assert res2.cache_path == res.cache_path
+
+    def test_cache_paths_depend_on_settings(self):
+        with use_settings(path_prefix='/other/prefix/'):
+            res = TypedResource(URL, TypeString('image/gif'))
+        assert res.cache_path.startswith('/other/prefix/')
+        assert not self.res.cache_path.startswith('/other/prefix/')
+
 
 class TestForeignBytesResource:
     def setup_method(self, method):
@@ -250,3 +277,173 @@ class TestCacheSettings:
     def test_invalid_path_grouping(self):
         with pytest.raises(ConfigurationError):
             ForeignResource(URL)
+
+    @use_settings(path_grouping='BLAKE2B')
+    def test_blake2b_path_grouping(self):
+        res = ForeignResource(URL)
+        assert res.url.blake2b[:8] in res.cache_path
+        assert res.md5 not in res.cache_path
+
+
+class TestCacheMigration:
+    def setup_method(self, method):
+        self.prefix = tempfile.mkdtemp(prefix='omnic_test_')
+
+    def _settings(self, **kwargs):
+        return use_settings(path_prefix=self.prefix, **kwargs)
+
+    def test_migrate_path_grouping(self):
+        with self._settings(path_grouping='MD5'):
+            old_res = ForeignResource(URL)
+            with old_res.cache_open('wb') as fd:
+                fd.write(b'data')
+
+        with self._settings(path_grouping='BLAKE2B'):
+            res = ForeignResource(URL)
+            assert res.cache_path != old_res.cache_path
+            assert not res.cache_exists()
+
+        with self._settings(path_grouping='BLAKE2B',
+                            path_grouping_migrate_from='MD5'):
+            res = ForeignResource(URL)
+            assert res.cache_exists()
+            with res.cache_open() as fd:
+                assert fd.read() == b'data'
+            assert not os.path.exists(old_res.cache_path)
+
+
+class TestCacheWrite:
+    def setup_method(self, method):
+        self.prefix = tempfile.mkdtemp(prefix='omnic_test_')
+        singletons.settings.use_settings_dict({'path_prefix': self.prefix})
+        self.res = TypedResource(URL, TypeString('image/gif'))
+
+    def teardown_method(self, method):
+        singletons.settings.use_previous_settings()
+
+    def _listdir(self):
+        return os.listdir(os.path.dirname(self.res.cache_path))
+
+    @pytest.mark.asyncio
+    async def test_written_atomically(self):
+        async def write(partial):
+            assert partial.cache_path != self.res.cache_path
+            assert partial.basename == self.res.basename
+            with partial.cache_open('wb') as fd:
+                fd.write(b'data')
+            assert not await self.res.cache_ready()
+        assert await self.res.cache_write(write)
+        assert await self.res.cache_ready()
+        with self.res.cache_open() as fd:
+            assert fd.read() == b'data'
+        assert not [n for n in self._listdir() if n.startswith('.partial')]
+
+    @pytest.mark.asyncio
+    async def test_failed_write_discarded(self):
+        async def write(partial):
+            with partial.cache_open('wb') as fd:
+                fd.write(b'half')
+            raise ValueError()
+        with pytest.raises(ValueError):
+            await self.res.cache_write(write)
+        assert not await self.res.cache_ready()
+        assert not [n for n in self._listdir() if n.startswith('.partial')]
+
+    @pytest.mark.asyncio
+    async def test_not_rewritten_unless_replacing(self):
+        async def write(partial):
+            calls.append(partial)
+            with partial.cache_open('wb') as fd:
+                fd.write(b'%i' % len(calls))
+        calls = []
+        assert await self.res.cache_write(write)
+        assert not await self.res.cache_write(write)
+        assert len(calls) == 1
+        assert await self.res.cache_write(write, replace=True)
+        with self.res.cache_open() as fd:
+            assert fd.read() == b'2'
+
+    @pytest.mark.asyncio
+    async def test_replace_directory(self):
+        async def write(partial):
+            with partial.cache_open_as_dir('a.txt', 'w') as fd:
+                fd.write(str(len(calls)))
+            calls.append(partial)
+        calls = []
+        await self.res.cache_write(write)
+        await self.res.cache_write(write, replace=True)
+        with self.res.cache_open_as_dir('a.txt', 'r') as fd:
+            assert fd.read() == '1'
+
+    @pytest.mark.asyncio
+    async def test_concurrent_writes(self):
+        async def write(partial):
+            calls.append(partial)
+            await asyncio.sleep(0.1)
+            with partial.cache_open('wb') as fd:
+                fd.write(b'data')
+        calls = []
+        results = await asyncio.gather(
+            self.res.cache_write(write),
+            self.res.cache_write(write),
+        )
+        assert sorted(results) == [False, True]
+        assert len(calls) == 1
+
+    @pytest.mark.asyncio
+    async def test_partial_removed_while_writing(self):
+        async def write(partial):
+            with partial.cache_open('wb') as fd:
+                fd.write(b'data')
+            shutil.rmtree(os.path.dirname(partial.cache_path))
+        with pytest.raises(CacheError):
+            await self.res.cache_write(write)
+        assert not await self.res.cache_ready()
+
+    @pytest.mark.asyncio
+    async def test_waits_while_entry_locked(self):
+        async def write(partial):
+            calls.append(partial)
+            with partial.cache_open('wb') as fd:
+                fd.write(b'data')
+        calls = []
+        lock_path = get_lock_path(
+            self.res.cache_entry_path(), ENTRY_LOCK_SUFFIX)
+        eviction_lock = CacheLock(lock_path)  # As held while evicting
+        assert eviction_lock.try_acquire()
+        future = asyncio.ensure_future(self.res.cache_write(write))
+        await asyncio.sleep(0.1)
+        assert calls == []
+        eviction_lock.release()
+        assert await future
+        assert len(calls) == 1
+
+    def test_lock_removed_while_waiting(self):
+        lock_path = get_lock_path(self.res.cache_path)
+        lock = CacheLock(lock_path)
+        waiting = CacheLock(lock_path, shared=True)
+        assert lock.try_acquire()
+        assert not waiting.try_acquire()
+        lock.remove()
+        lock.release()
+        assert waiting.try_acquire()  # Locks a new lock file instead
+        assert os.path.exists(lock_path)
+        assert not CacheLock(lock_path).try_acquire()
+        waiting.release()
+
+    @pytest.mark.asyncio
+    async def test_lock_timeout(self):
+        with use_settings(cache_lock_timeout=0.1):
+            async with self.res.cache_lock():
+                with pytest.raises(CacheError):
+                    async with self.res.cache_lock():
+                        pass
+            async with self.res.cache_lock():
+                pass  # Released
+
+    def test_save_atomically(self):
+        res = ForeignBytesResource(b'data')
+        res.save()
+        assert os.listdir(os.path.dirname(res.cache_path)) == [res.basename]
+        with res.cache_open() as fd:
+            assert fd.read() == b'data'
@@ -1,7 +1,7 @@
 """
 Tests for `resourceurl` module.
 """
-
+import hashlib
 
 from omnic.types.resourceurl import BytesResourceURL, ResourceURL
 
@@ -58,6 +58,21 @@ class TestResourceURLParsing:
         assert url.path_basename == 'lol.git'
 
 
+class TestResourceURLCaching:
+    def test_parsed_once(self):
+        url = ResourceURL('some.com/cached/file<a><b: c>')
+        assert ResourceURL('some.com/cached/file<a><b: c>') is url
+        assert ResourceURL('some.com/cached/other<a><b: c>') is not url
+
+    def test_lazy_hashes(self):
+        url = ResourceURL('some.com/lazy/file.png')
+        assert url._md5 is None
+        expected = hashlib.md5(b'http://some.com/lazy/file.png').hexdigest()
+        assert url.md5 == expected
+        assert len(url.blake2b) == len(url.md5)
+        assert url.blake2b != url.md5
+
+
 class TestBytesResourceURLParsing:
     def test_faux_url_construction(self):
         url = BytesResourceURL(b'testdata', 'txt', 'input')
@@ -71,8 +71,9 @@ class TestResponsePlaceholders:
                 mock_response.data = data
 
             @staticmethod
-            def stream(streamer=None, content_type=None):
+            def stream(streamer=None, headers=None, content_type=None):
                 mock_response.ct = content_type
+                mock_response.headers = headers
                 # For now, too hard to test this bit
                 #coro = streamer(mock_response)
                 #assert iscoroutine(coro)
@@ -84,6 +85,11 @@ class TestResponsePlaceholders:
 
         self.phs.stream_response(TypeString('JPEG'), mock_response)
         assert mock_response.ct == 'image/jpeg'
+        assert mock_response.headers is None
+
+        headers = {'Cache-Control': 'no-store'}
+        self.phs.stream_response(TypeString('PNG'), mock_response, headers)
+        assert mock_response.headers == headers
         #assert mock_response.data == Magic.JPEG
 
         self.phs.stream_response(TypeString('lol'), mock_response)
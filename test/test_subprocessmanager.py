@@ -0,0 +1,82 @@
+'''
+Tests for `subprocessmanager` module.
+'''
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pytest
+
+from omnic.config.utils import use_settings
+from omnic.worker.subprocessmanager import SubprocessManager
+
+
+def _python(code):
+    return [sys.executable, '-c', code]
+
+
+class TestSubprocessManager:
+    def setup_method(self, method):
+        self.manager = SubprocessManager()
+
+    @pytest.mark.asyncio
+    async def test_run(self):
+        result = await self.manager.run(_python('print("ok")'))
+        assert result.returncode == 0
+        assert result.stdout is None
+        assert result.stderr is None
+        assert self.manager == []
+
+    @pytest.mark.asyncio
+    async def test_pipe(self):
+        cmd = _python('import sys; print("out"); sys.exit("err")')
+        result = await self.manager.run(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        assert result.args == cmd
+        assert result.returncode == 1
+        assert result.stdout.strip() == b'out'
+        assert result.stderr.strip() == b'err'
+        with pytest.raises(subprocess.CalledProcessError):
+            await self.manager.run(cmd, stderr=subprocess.PIPE, check=True)
+
+    @pytest.mark.asyncio
+    async def test_input(self):
+        cmd = _python('import sys; print(sys.stdin.read().upper())')
+        result = await self.manager.run(
+            cmd, input=b'abc', stdout=subprocess.PIPE)
+        assert result.stdout.strip() == b'ABC'
+
+    @pytest.mark.asyncio
+    async def test_file_and_cwd(self):
+        cwd = tempfile.mkdtemp(prefix='omnic_test_')
+        path = os.path.join(cwd, 'output.txt')
+        with open(path, 'w+') as fd:
+            await self.manager.run(
+                _python('import os; print(os.getcwd())'), cwd=cwd, stdout=fd)
+        with open(path) as fd:
+            assert os.path.samefile(fd.read().strip(), cwd)
+
+    @pytest.mark.asyncio
+    async def test_timeout(self):
+        start = time.time()
+        with pytest.raises(subprocess.TimeoutExpired):
+            await self.manager.run(
+                _python('import time; time.sleep(30)'), timeout=0.2)
+        assert time.time() - start < 10
+        assert self.manager == []
+
+        with use_settings(subprocess_timeout=0.2):
+            with pytest.raises(subprocess.TimeoutExpired):
+                await self.manager.run(_python('import time; time.sleep(30)'))
+
+    @pytest.mark.asyncio
+    async def test_concurrent(self):
+        cmd = _python('import time; time.sleep(0.5)')
+        start = time.time()
+        results = await asyncio.gather(
+            *[self.manager.run(cmd) for _ in range(4)])
+        assert [result.returncode for result in results] == [0] * 4
+        assert time.time() - start < 1.5
@@ -0,0 +1,244 @@
+'''
+Tests for `taskqueue` module.
+'''
+import asyncio
+import os
+import socket
+import subprocess
+import tempfile
+
+import pytest
+
+from omnic import singletons
+from omnic.conversion import converter
+from omnic.conversion.utils import enqueue_conversion_path
+from omnic.types.resource import (ForeignResource, TypedLocalResource,
+                                  TypedResource)
+from omnic.types.typestring import TypeString
+from omnic.worker import taskqueue
+from omnic.worker.enums import Task
+from omnic.worker.manager import WorkerManager
+from omnic.worker.taskqueue import SQLiteTaskQueue
+
+URL = 'http://mocksite.local/file.png'
+
+
+class StubConverter(converter.Converter):
+    failures = 0
+
+    async def convert(self, in_resource, out_resource):
+        if StubConverter.failures:
+            StubConverter.failures -= 1
+            raise ValueError('failing for now')
+        with out_resource.cache_open('wb') as fd:
+            fd.write(b'converted')
+
+
+def _get_owner(pid, token='token', hostname=None):
+    return '%s:%i:%s' % (hostname or socket.gethostname(), pid, token)
+
+
+def _get_dead_owner():
+    process = subprocess.Popen(['true'])
+    process.wait()
+    return _get_owner(process.pid)
+
+
+class TestSerialization:
+    def _round_trip(self, value):
+        encoded = taskqueue.encode_value(value)
+        decoded = taskqueue.decode_value(encoded)
+        assert decoded == value
+        return decoded
+
+    def test_values(self):
+        self._round_trip(None)
+        self._round_trip(['a', 1, 2.5, True])
+        self._round_trip(('thumb.jpg', 'thumb.png'))
+        self._round_trip({'profile': ['a', 'b'], 'list': 1})
+        self._round_trip(TypeString('thumb.jpg:20x20'))
+
+    def test_resources(self):
+        foreign_res = self._round_trip(ForeignResource(URL))
+        assert type(foreign_res) is ForeignResource
+        typed_res = self._round_trip(
+            TypedResource(URL, TypeString('thumb.jpg')))
+        assert type(typed_res) is TypedResource
+        assert typed_res.typestring == TypeString('thumb.jpg')
+
+    def test_callables(self):
+        decoded = self._round_trip(enqueue_conversion_path)
+        assert decoded is enqueue_conversion_path
+        assert taskqueue.encode_value(singletons.workers.enqueue_convert) == {
+            'singleton': 'workers',
+            'method': 'enqueue_convert',
+        }
+        converter = taskqueue.decode_value(
+            taskqueue.encode_value(StubConverter()))
+        assert isinstance(converter, StubConverter)
+
+    def test_not_serializable(self):
+        path = os.path.join(tempfile.mkdtemp(), 'file.png')
+        for value in (TypedLocalResource(path, TypeString('PNG')),
+                      lambda: None, object(), {1, 2}):
+            with pytest.raises(TypeError):
+                taskqueue.encode_value(value)
+
+    def test_task(self):
+        args = (StubConverter(), TypedResource(URL, TypeString('PNG')),
+                TypedResource(URL, TypeString('thumb.jpg')))
+        task_type, decoded = taskqueue.decode_task(
+            *taskqueue.encode_task(Task.CONVERT, args))
+        assert task_type == Task.CONVERT
+        assert decoded[1:] == args[1:]
+
+
+class TestSQLiteTaskQueue:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+        })
+        self.queue = SQLiteTaskQueue()
+
+    def teardown_method(self, method):
+        self.queue.close()
+        singletons.settings.use_previous_settings()
+
+    def _put(self, url=URL):
+        return self.queue.put(Task.DOWNLOAD, (ForeignResource(url),), url)
+
+    def _set_owner(self, owner, task_ids):
+        connection = self.queue.get_connection()
+        with connection:
+            connection.executemany('UPDATE tasks SET owner = ? WHERE id = ?',
+                                   [(owner, task_id) for task_id in task_ids])
+
+    def test_put_and_ack(self):
+        first = self._put()
+        second = self._put(URL + '?2')
+        assert first < second
+        self.queue.ack(first)
+        self.queue.retry(second)
+        assert self.queue.recover() == []  # Still running here
+
+        # As if recorded by this process before re-executing itself
+        self._set_owner(_get_owner(os.getpid()), [second])
+        assert self.queue.recover() == [taskqueue.TaskRecord(
+            second, Task.DOWNLOAD, (ForeignResource(URL + '?2'),),
+            URL + '?2', 1)]
+
+    def test_not_recorded(self):
+        path = os.path.join(tempfile.mkdtemp(), 'file.png')
+        resource = TypedLocalResource(path, TypeString('PNG'))
+        assert self.queue.put(Task.DOWNLOAD, (resource,)) is None
+        assert self.queue.recover() == []
+
+    def test_recover_orphaned_only(self):
+        dead, alive, elsewhere = self._put(), self._put(), self._put()
+        self._set_owner(_get_dead_owner(), [dead])
+        self._set_owner(_get_owner(os.getppid()), [alive])
+        self._set_owner(_get_owner(1, hostname='otherhost.local'),
+                        [elsewhere])
+        assert [record.id for record in self.queue.recover()] == [dead]
+
+        # Taken over, i.e. not recovered by others while still running here
+        assert SQLiteTaskQueue().recover() == []
+
+    def test_undecodable_dropped(self):
+        task_id = self._put()
+        self._set_owner(_get_dead_owner(), [task_id])
+        connection = self.queue.get_connection()
+        with connection:
+            connection.execute('UPDATE tasks SET args = ?',
+                               ('[{"converter": "omnic.Missing"}]',))
+        assert self.queue.recover() == []
+        with connection:
+            assert connection.execute(
+                'SELECT * FROM tasks WHERE id = ?', (task_id,)).fetchall() \
+                == []
+
+
+class TestDurableWorkers:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'path_prefix': tempfile.mkdtemp(prefix='omnic_test_'),
+            'task_queue': 'omnic.worker.taskqueue.SQLiteTaskQueue',
+            'task_retries': 2,
+            'workers': 2,
+        })
+        self.workers = singletons.workers
+        self.original_workers = list(self.workers)
+        self.original_task_queue = self.workers.task_queue
+        self._start_over()
+        StubConverter.failures = 0
+        self.in_res = TypedResource(URL, TypeString('PNG'))
+        self.out_res = TypedResource(URL, TypeString('thumb.jpg'))
+        with self.in_res.cache_open('wb') as fd:
+            fd.write(b'input')
+
+    def teardown_method(self, method):
+        singletons.negative_cache.clear()
+        self.workers.task_queue.close()
+        self.workers.clear()
+        self.workers.extend(self.original_workers)
+        self.workers.task_queue = self.original_task_queue
+        singletons.settings.use_previous_settings()
+
+    def _start_over(self):
+        # As if the process was restarted
+        manager = WorkerManager()
+        self.workers.clear()
+        self.workers.extend(manager)
+        self.workers.task_queue = manager.task_queue
+
+    def _recorded(self):
+        connection = self.workers.task_queue.get_connection()
+        return connection.execute(
+            'SELECT task_type, attempts FROM tasks').fetchall()
+
+    async def _run(self, seconds=0.1):
+        future = asyncio.ensure_future(self.workers.gather_run())
+        await asyncio.sleep(seconds)
+        future.cancel()
+
+    async def _enqueue(self):
+        await self.workers.async_enqueue_convert(
+            StubConverter(), self.in_res, self.out_res)
+
+    @pytest.mark.asyncio
+    async def test_acknowledged(self):
+        await self._enqueue()
+        assert self._recorded() == [('CONVERT', 0)]
+        await self._run()
+        assert self.out_res.cache_exists()
+        assert self._recorded() == []
+
+    @pytest.mark.asyncio
+    async def test_recovered_after_restart(self):
+        await self._enqueue()
+        connection = self.workers.task_queue.get_connection()
+        with connection:
+            connection.execute('UPDATE tasks SET owner = ?',
+                               (_get_dead_owner(),))
+        self.workers.task_queue.close()
+        self._start_over()
+        await self._run()
+        assert self.out_res.cache_exists()
+        assert self._recorded() == []
+
+    @pytest.mark.asyncio
+    async def test_retried(self):
+        StubConverter.failures = 2
+        await self._enqueue()
+        await self._run()
+        assert self.out_res.cache_exists()
+        assert self._recorded() == []
+
+    @pytest.mark.asyncio
+    async def test_retried_until_given_up(self):
+        StubConverter.failures = 3
+        await self._enqueue()
+        await self._run()
+        assert not self.out_res.cache_exists()
+        assert self._recorded() == []
+        assert StubConverter.failures == 0
@@ -2,6 +2,10 @@
 Tests for `typestring` module.
 """
 
+import pickle
+from unittest.mock import patch
+
+import pytest
 
 from omnic.types.typestring import TypeString
 
@@ -82,3 +86,39 @@ class TestQualifierArgumentsTypeString:
         assert self.ts.modify_basename(
             'thing.xml') == 'thing.xml.400x300.thumb.png'
         assert self.ts.modify_basename('thing') == 'thing.400x300.thumb.png'
+
+
+class TestTypeStringInterning:
+    def test_interned(self):
+        ts = TypeString('thumb.png:400x300')
+        assert TypeString('thumb.png:400x300') is ts
+        assert TypeString('JPEG') is TypeString('JPEG')
+
+    def test_hashable(self):
+        lookup = {TypeString('JPEG'): 1, TypeString('thumb.png'): 2}
+        assert lookup[TypeString('JPEG')] == 1
+        assert lookup[TypeString('thumb.png')] == 2
+        assert TypeString('thumb.png:400x300') not in lookup
+
+    def test_qualifiers_not_equal(self):
+        assert TypeString('unknown') != TypeString('directory')
+        assert hash(TypeString('unknown')) != hash(TypeString('directory'))
+
+    def test_immutable(self):
+        with pytest.raises(AttributeError):
+            TypeString('JPEG').extension = 'PNG'
+
+    def test_pickle(self):
+        ts = TypeString('thumb.png:400x300')
+        assert pickle.loads(pickle.dumps(ts)) is ts
+
+    def test_does_not_consult_mimetypes_for_known_types(self):
+        TypeString._interned.clear()
+        with patch('omnic.types.typestring.mimetypes') as mimetypes:
+            assert TypeString('PNG').mimetype == 'image/png'
+            assert TypeString('image/png').extension == 'PNG'
+        assert not mimetypes.mock_calls
+
+    def test_unknown_types(self):
+        assert TypeString('NOTAREALEXTENSION').mimetype is None
+        assert TypeString('made/up').extension is None
@@ -6,7 +6,7 @@ from os.path import islink, join
 
 import pytest
 
-from omnic.utils import filesystem, graph, iters
+from omnic.utils import filesystem, graph, iters, lru
 
 from .testing_utils import clear_tmp_files, gen_tmp_files
 
@@ -144,6 +144,46 @@ class TestDirectedGraph:
         with pytest.raises(graph.DirectedGraph.NoPath):
             self.dg.shortest_path('MP3', 'thumb.png')
 
+    def test_reachable_from(self):
+        self._simple_tree()
+        assert self.dg.get_reachable_from('B') == {'B', 'C', 'D', 'E'}
+        assert self.dg.get_reachable_from('C') == {'C'}
+
+    def test_get_shortest_paths(self):
+        self._multi_pathed_graph_weighted()
+        self.dg.add_preferred_path('A', 'Z', 'G')
+        paths = self.dg.get_shortest_paths()
+        assert paths[('A', 'C')] == (3, ('A', 'B', 'G', 'C'))
+        assert paths[('F', 'G')] == (2, ('F', 'B', 'G'))
+        assert paths[('A', 'G')] == (1, ('A', 'Z', 'G'))
+        assert ('C', 'A') not in paths
+        assert ('A', 'A') not in paths
+
+    def test_precomputed_routes(self):
+        self._multi_pathed_graph()
+        self.dg.set_routes({('A', 'C'): (3, ('A', 'B', 'G', 'C'))})
+        assert self.dg.shortest_path('A', 'C') == ('A', 'B', 'G', 'C')
+        assert self.dg.shortest_path('A', 'G') == ('A', 'B', 'G')
+        self.dg.add_edge('A', 'G', 1)  # Changing graph clears routes
+        assert self.dg.shortest_path('A', 'C') == ('A', 'F', 'C')
+
+    def test_cache_cleared_on_new_edge(self):
+        self._multi_pathed_graph()
+        assert self.dg.shortest_path('A', 'C') == ('A', 'F', 'C')
+        self.dg.add_edge('A', 'C', 1)
+        assert self.dg.shortest_path('A', 'C') == ('A', 'C')
+
+    def test_cache_per_graph(self):
+        self._multi_pathed_graph()
+        assert self.dg.shortest_path('A', 'C') == ('A', 'F', 'C')
+        other = graph.DirectedGraph()
+        other.add_edge('A', 'C', 1)
+        assert other.shortest_path('A', 'C') == ('A', 'C')
+        assert ('A', 'C') in self.dg.shortest_paths
+        with pytest.raises(graph.DirectedGraph.NoPath):
+            other.shortest_path('C', 'A')
+        assert other.shortest_paths[('C', 'A')] is None
+
 
 class TestIterUtils:
     def test_pair_looper(self):
@@ -173,6 +213,24 @@ class TestIterUtils:
         assert list(group_by('asdf', 2)) == ['as', 'df']
 
 
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        cache = lru.LRUCache(maxsize=2)
+        cache['a'] = 1
+        cache['b'] = 2
+        assert cache.get('a') == 1  # 'a' is now most recently used
+        cache['c'] = 3
+        assert 'b' not in cache
+        assert cache.get('a') == 1
+        assert cache.get('c') == 3
+        assert cache.get('b', 'missing') == 'missing'
+        assert len(cache) == 2
+
+    def test_invalid_maxsize(self):
+        with pytest.raises(ValueError):
+            lru.LRUCache(maxsize=0)
+
+
 class TestFilesystemUtils:
     FILES = [
         'testfile',
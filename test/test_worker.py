@@ -1,21 +1,24 @@
 """
 Tests for `worker` module.
 """
-
+import asyncio
 from unittest.mock import MagicMock, patch
 
 import pytest
 
 from omnic import singletons
+from omnic.conversion.plan import MultiConversionPlan
 from omnic.types.resource import TypedForeignResource, TypedResource
 from omnic.types.typestring import TypeString
-from omnic.worker.aioworker import AioWorker
-from omnic.worker.base import BaseWorker
+from omnic.utils.asynctools import CoroutineMock
+from omnic.worker.aioworker import AioWorker, WorkerQueue
+from omnic.worker.base import BaseWorker, TaskSkipped
 from omnic.worker.enums import Task
+from omnic.worker.manager import WorkerManager
 from omnic.worker.testing import (ForegroundWorker, RunOnceWorker,
                                   autodrain_worker)
 
-from .testing_utils import MockAioQueue, MockWorker
+from .testing_utils import MockWorker
 
 
 class WorkerTestBase:
@@ -96,11 +99,37 @@ class TestWorkerTasks:
         assert worker.next_queue[3][1][2] == \
             TypedResource(self.url_string, TypeString('thumb.jpg:123x456'))
 
+    @pytest.mark.asyncio
+    async def test_run_multiconvert_multiple_targets(self):
+        self.singletons.converter_graph.find_paths.return_value = \
+            MultiConversionPlan([
+                [
+                    self._step(0, 'AVI', 'PNG'),
+                    self._step(1, 'PNG', 'thumb.jpg:80x80'),
+                ],
+                [
+                    self._step(0, 'AVI', 'PNG'),
+                    self._step(1, 'PNG', 'thumb.jpg:200x200'),
+                ],
+            ])
+        worker = RunOnceWorker()
+        targets = ('thumb.jpg:80x80', 'thumb.jpg:200x200')
+        await worker.run_multiconvert(self.url_string, targets)
+        assert len(worker.next_queue) == 3  # AVI -> PNG only once
+        assert worker.next_queue[0][1][1] == \
+            TypedForeignResource(self.url_string, TypeString('AVI'))
+        assert worker.next_queue[1][1][1] == \
+            TypedResource(self.url_string, TypeString('PNG'))
+        assert worker.next_queue[2][1][1] == \
+            TypedResource(self.url_string, TypeString('PNG'))
+        assert worker.next_queue[2][1][2] == \
+            TypedResource(self.url_string, TypeString('thumb.jpg:200x200'))
+
 
 class TestAsyncioWorker(WorkerTestBase):
     @pytest.mark.asyncio
     async def test_run_once(self):
-        worker = AioWorker(MockAioQueue())
+        worker = AioWorker()
         worker.called = 0
 
         def fake_func(*args):
@@ -119,6 +148,168 @@ class TestAsyncioWorker(WorkerTestBase):
         assert worker.called == 4
 
 
+class TestWorkerQueue:
+    def test_take(self):
+        queue = WorkerQueue()
+        for item in [('a', 1, ()), ('b', 2, ()), ('a', 3, ()),
+                     (None, 4, ()), ('b', 5, ())]:
+            queue.put_nowait(item)
+
+        # Never tasks with the same key as the running one, and others
+        # together with every later task with the same key
+        assert queue.take('a') == [('b', 2, ()), ('b', 5, ())]
+        assert queue.take('a') == [(None, 4, ())]
+        assert queue.take('a') == []
+        assert queue.take(None) == [('a', 1, ()), ('a', 3, ())]
+        assert queue.qsize() == 0
+
+
+class SlowWorker(AioWorker):
+    '''
+    Worker that records which tasks it ran, and when
+    '''
+    log = []
+
+    async def run_func(self, name, seconds):
+        SlowWorker.log.append(('start', name, self))
+        await asyncio.sleep(seconds)
+        SlowWorker.log.append(('end', name, self))
+
+
+class TestWorkerManager:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({
+            'worker': 'test.test_worker.SlowWorker',
+            'workers': 3,
+        })
+        # Workers steal from the others in the singleton
+        self.workers = singletons.workers
+        self.original_workers = list(self.workers)
+        self.workers.clear()
+        self.workers.extend(WorkerManager())
+        SlowWorker.log = []
+
+    def teardown_method(self, method):
+        self.workers.clear()
+        self.workers.extend(self.original_workers)
+        singletons.settings.use_previous_settings()
+
+    async def _enqueue(self, key, name, seconds=0.05):
+        worker = self.workers.pick_sticky(key)
+        await self.workers._enqueue(
+            worker, Task.FUNC, (name, seconds), key=key)
+
+    async def _run(self, seconds):
+        future = asyncio.ensure_future(self.workers.gather_run())
+        await asyncio.sleep(seconds)
+        future.cancel()
+
+    def _ran(self, name):
+        return [(event, worker) for event, ran, worker in SlowWorker.log
+                if ran == name]
+
+    def test_workers(self):
+        assert len(self.workers) == 3
+        assert all(isinstance(w, SlowWorker) for w in self.workers)
+        assert len(set(id(worker.queue) for worker in self.workers)) == 3
+
+    @pytest.mark.asyncio
+    async def test_sticky(self):
+        worker = self.workers.pick_sticky('http://a/')
+        assert self.workers.pick_sticky('http://a/') is worker
+        assert self.workers.pick_sticky('http://b/') is \
+            self.workers[hash('http://b/') % 3]
+
+        # Tasks for a key are routed to the worker holding them
+        other = next(w for w in self.workers if w is not worker)
+        await other.enqueue(Task.FUNC, ('a', 0), key='http://a/')
+        assert self.workers.pick_sticky('http://a/') is other
+
+    @pytest.mark.asyncio
+    async def test_concurrent_and_in_order(self):
+        urls = ['http://site/%i' % i for i in range(6)]
+        for url in urls:
+            await self._enqueue(url, url + ' 1')
+            await self._enqueue(url, url + ' 2')
+        await self._run(0.5)
+        assert len(SlowWorker.log) == 24
+        for url in urls:
+            # Every step of a URL in order, on the same worker
+            events = self._ran(url + ' 1') + self._ran(url + ' 2')
+            assert [event for event, worker in events] == ['start', 'end'] * 2
+            assert len(set(worker for event, worker in events)) == 1
+
+        # Several ran at once
+        running = most_running = 0
+        for event, name, worker in SlowWorker.log:
+            running += 1 if event == 'start' else -1
+            most_running = max(running, most_running)
+        assert most_running > 1
+
+    @pytest.mark.asyncio
+    async def test_work_stealing(self):
+        # All queued on the first worker, once the others are idle
+        future = asyncio.ensure_future(self.workers.gather_run())
+        await asyncio.sleep(0)
+        for i in range(4):
+            await self.workers._enqueue(
+                self.workers[0], Task.FUNC, ('task %i' % i, 0.1),
+                key='http://site/%i' % i)
+        await asyncio.sleep(0.3)
+        future.cancel()
+        assert len(SlowWorker.log) == 8
+        assert self._ran('task 0')[0][1] is self.workers[0]
+        assert len(set(worker for event, name, worker in SlowWorker.log)) \
+            == 3
+        assert all(not worker.pending for worker in self.workers)
+
+
+class TestAioWorkerLocks:
+    def setup_method(self, method):
+        singletons.settings.use_settings_dict({'workers': 1})
+        self.workers = singletons.workers
+        self.original_workers = list(self.workers)
+        self.workers.clear()
+        self.workers.extend(WorkerManager())
+        self.worker = self.workers[0]
+
+    def teardown_method(self, method):
+        self.workers.clear()
+        self.workers.extend(self.original_workers)
+        singletons.settings.use_previous_settings()
+
+    async def _run_once(self):
+        future = asyncio.ensure_future(self.worker.run())
+        await asyncio.sleep(0.01)
+        future.cancel()
+
+    @pytest.mark.asyncio
+    async def test_released_once_done(self):
+        resource = MagicMock()
+        future = asyncio.ensure_future(self.workers.gather_run())
+        try:
+            with patch('omnic.worker.tasks.resolve_foreign_resource',
+                       new_callable=CoroutineMock) as download:
+                for _ in range(2):
+                    await asyncio.wait_for(self.workers.async_run_task(
+                        Task.DOWNLOAD, (resource,), 'key'), 1)
+        finally:
+            future.cancel()
+        assert download.call_count == 2
+        assert not self.worker.downloading_resources
+
+    @pytest.mark.asyncio
+    async def test_skipped_not_successful(self):
+        resource = MagicMock()
+        self.worker.downloading_resources.add(resource)  # As if running
+        done = asyncio.get_event_loop().create_future()
+        await self.worker.enqueue(Task.DOWNLOAD, (resource,), done=done)
+        await self._run_once()
+        with pytest.raises(TaskSkipped):
+            done.result()
+        assert resource in self.worker.downloading_resources
+
+
 class TestForegroundWorker(WorkerTestBase):
     @pytest.mark.asyncio
     async def test_run(self):
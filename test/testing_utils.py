@@ -44,14 +44,6 @@ class MockWorker(BaseWorker):
         return True
 
 
-class MockAioQueue(list):
-    async def put(self, item):
-        self.append(item)
-
-    async def get(self):
-        return self.pop(0)
-
-
 class DummyDetector(Detector):
     pass
 